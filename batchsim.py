@@ -0,0 +1,700 @@
+# batchsim.py
+# Пакетный бой для подбора баланса: B одинаковых боёв (один набор шаблонов врагов против одной
+# колоды) шагают синхронно на массивах NumPy — hp/блок/мана/стаки статусов и стопки карт
+# хранятся «столбцами», один вызов обрабатывает сразу все бои.
+#
+#   pip install -r requirements-sim.txt      # numpy; серверу он не нужен
+#   python batchsim.py RAT_MAGE --batch 20000 --validate 400
+#
+# Игрок ходит той же жадной политикой, что simulate.GreedyDamagePolicy. Правила повторяют
+# game.py для подмножества контента (см. SUPPORTED_OPS); всё остальное отвергается сразу,
+# а не считается «примерно». Сверка со скалярным движком — validate().
+
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+import argparse, random, sys, time
+
+try:
+    import numpy as np
+except ImportError:  # необязательная зависимость: без неё модуль импортируется, но не считает
+    np = None
+
+import content
+import game
+
+# карточные op, которые пакетный движок умеет исполнять
+SUPPORTED_OPS = {"damage", "aoe_damage", "block", "apply", "draw", "gain_mana", "gain_max_mana",
+                 "heal", "lose_hp", "heal_per_enemy"}
+
+STATUS_IDS = list(content.STATUSES)
+S_IDX = {s: i for i, s in enumerate(STATUS_IDS)}
+
+# где лежит карта
+DRAW, HAND, DISCARD, EXHAUST, LIMBO = 0, 1, 2, 3, 4
+
+# типы ходов врага
+MOVE_TYPES = ("attack", "attack_apply", "apply", "apply_all", "block", "heal",
+              "phase_shift", "counter_prep", "self_debuff")
+M_IDX = {t: i for i, t in enumerate(MOVE_TYPES)}
+
+HAND_LIMIT = 6
+SEQ_SPAN = 1 << 24  # порядок попадания в руку: ничьи жадной политики — в пользу более ранней карты
+
+CardRef = Union[str, Tuple[str, bool]]
+
+
+class BatchUnsupported(ValueError):
+    pass
+
+
+def _need_numpy():
+    if np is None:
+        raise RuntimeError("batchsim требует numpy: pip install -r requirements-sim.txt")
+
+
+# ---- разбор контента ----
+
+class _Card:
+    __slots__ = ("id", "up", "cost", "exhaust", "targeted", "ops", "prio")
+
+    def __init__(self, card_id: str, up: bool):
+        cdef = content.get_card_def(card_id, upgraded=up)
+        problems = []
+        if game.is_curse_card(cdef):
+            problems.append("проклятье")
+        if cdef.get("stays_in_hand"):
+            problems.append("заряд в руке")
+        ops = []
+        for eff in cdef.get("effects", []):
+            op = eff.get("op")
+            if op not in SUPPORTED_OPS:
+                problems.append(f"op {op!r}")
+                continue
+            if op == "damage":
+                if isinstance(eff.get("amount"), dict) or eff.get("on_crit"):
+                    problems.append("damage с зарядом/on_crit")
+                    continue
+                if cdef["target"] not in ("enemy", "any"):
+                    problems.append("damage без цели-врага")
+                    continue
+                ops.append(("damage", int(eff.get("amount", 0)), not eff.get("no_crit", False)))
+            elif op == "aoe_damage":
+                bonus_if = [S_IDX[s] for s in eff.get("bonus_if_has_any_status") or []]
+                ops.append(("aoe_damage", int(eff.get("amount", 0)), bonus_if, int(eff.get("bonus", 0))))
+            elif op == "apply":
+                ops.append(("apply", S_IDX[eff["status"]], int(eff.get("stacks", 0)), eff.get("to", "enemy")))
+            elif op == "gain_max_mana":
+                if eff.get("duration", "combat") == "combat":
+                    ops.append(("gain_max_mana", int(eff.get("n", 1))))
+            elif op in ("draw", "gain_mana"):
+                ops.append((op, int(eff.get("n", 1))))
+            else:
+                ops.append((op, int(eff.get("amount", 0))))
+        if problems:
+            raise BatchUnsupported(f"{card_id}{'+' if up else ''}: " + ", ".join(problems))
+        self.id, self.up, self.ops = card_id, up, ops
+        self.cost = int(cdef["cost"])
+        self.exhaust = bool(cdef.get("exhaust", False)) or cdef.get("type") == "upgrade"
+        self.targeted = cdef["target"] in ("enemy", "any")
+        inst = {"id": card_id, "up": up}
+        dmg = int(game.preview_damage(cdef, inst, {}) or 0)
+        block = sum(int(e.get("amount", 0)) for e in cdef.get("effects", []) if e.get("op") == "block")
+        # тот же ключ, что у simulate.GreedyDamagePolicy: (урон, блок)
+        self.prio = dmg * 4096 + block
+
+
+class _Enemy:
+    """Шаблон врага, разложенный по массивам ходов."""
+
+    def __init__(self, tmpl: Dict[str, Any]):
+        moves = tmpl["moves"]
+        for m in moves:
+            if m.get("type") not in M_IDX:
+                raise BatchUnsupported(f"{tmpl['id']}: ход {m.get('type')!r}")
+            if m.get("requires"):
+                raise BatchUnsupported(f"{tmpl['id']}: ход с requires")
+        self.tmpl = tmpl
+        n = len(moves)
+        self.n = n
+        self.type = np.array([M_IDX[m["type"]] for m in moves])
+        self.w = np.array([int(m.get("w", 1)) for m in moves])
+        self.half_w = np.maximum(1, self.w // 2)
+        self.threshold = np.array([float(m["threshold"]) if m.get("threshold") is not None else np.inf for m in moves])
+        self.sets_phase = np.array([bool(m.get("set_phase")) for m in moves])
+        self.dmg = np.array([int(m.get("dmg", 0)) for m in moves])
+        self.status = np.array([S_IDX.get(m.get("status"), -1) for m in moves])
+        self.stacks = np.array([int(m.get("stacks", 0)) for m in moves])
+        self.block = np.array([int(m.get("block", 0)) for m in moves])
+        self.heal = np.array([int(m.get("amount", 0)) for m in moves])
+        self.counter_dmg = np.array([int(m.get("counter_dmg", 0)) for m in moves])
+        self.charge = np.array([m.get("buff") == "arcane_charge" for m in moves])
+        self.overdrive = np.array([m.get("buff") == "arcane_overdrive" for m in moves])
+        self.dmg_mult = np.array([float(m.get("dmg_mult") or 0.0) for m in moves])
+        boost = [m.get("status_boost") or {} for m in moves]
+        self.boost_status = np.array([S_IDX.get(b.get("status"), -1) for b in boost])
+        self.boost = np.array([int(b.get("bonus", 0)) for b in boost])
+        self.immune = np.zeros(len(STATUS_IDS), dtype=bool)
+        for s in tmpl.get("immune_to", []):
+            if s in S_IDX:
+                self.immune[S_IDX[s]] = True
+
+
+def _template(tid: str) -> Dict[str, Any]:
+    return content.ENEMY_INDEX[tid]
+
+
+def _card_ref(ref: CardRef) -> Tuple[str, bool]:
+    if isinstance(ref, str):
+        return (ref[:-1], True) if ref.endswith("+") else (ref, False)
+    return ref[0], bool(ref[1])
+
+
+# ---- пакетный движок ----
+
+class BatchCombat:
+    """B боёв «шаблоны врагов против колоды», исполняемых синхронно.
+
+    После run(): result (1 — победа, -1 — поражение, 0 — не уложились в max_turns),
+    turns и p_hp по каждому бою.
+    """
+
+    def __init__(self, enemies: Sequence[str], deck: Sequence[CardRef], batch: int, *, seed: int = 0,
+                 hp: int = 70, max_hp: Optional[int] = None, mana_max: int = 3, scale: float = 1.0):
+        _need_numpy()
+        self.rng = np.random.default_rng(seed)
+        refs = [_card_ref(r) for r in deck]
+        kinds = sorted(set(refs))
+        errors = []
+        cards = {}
+        for ref in kinds:
+            try:
+                cards[ref] = _Card(*ref)
+            except BatchUnsupported as e:
+                errors.append(str(e))
+        if errors:
+            raise BatchUnsupported("не поддерживается: " + "; ".join(errors))
+        self.kinds = [cards[ref] for ref in kinds]
+        kind_of = {ref: i for i, ref in enumerate(kinds)}
+        self.card_kind = np.array([kind_of[r] for r in refs])
+        self.card_cost = np.array([self.kinds[k].cost for k in self.card_kind])
+        self.card_prio = np.array([self.kinds[k].prio for k in self.card_kind], dtype=np.int64)
+        self.card_exhaust = np.array([self.kinds[k].exhaust for k in self.card_kind])
+
+        self.templates = [_Enemy(_template(t)) for t in enemies]
+        B, E, N, S = batch, len(self.templates), len(refs), len(STATUS_IDS)
+        self.B, self.E, self.N = B, E, N
+        fresh = game.Player(int(hp), int(hp))
+        self.crit = game.crit_chance(fresh)
+        self.crit_mult = game.crit_mult(fresh)
+
+        i64 = np.int64
+        self.p_hp = np.full(B, int(hp), i64)
+        self.p_max = np.full(B, int(max_hp if max_hp is not None else hp), i64)
+        self.p_block = np.zeros(B, i64)
+        self.p_mana_max = np.full(B, int(mana_max), i64)
+        self.p_mana = self.p_mana_max.copy()
+        self.p_st = np.zeros((B, S), i64)
+
+        e_hp = [max(10, int(round(t.tmpl["max_hp"] * scale))) for t in self.templates]
+        self.e_hp = np.tile(np.array(e_hp, i64), (B, 1))
+        self.e_max = self.e_hp.copy()
+        self.e_block = np.zeros((B, E), i64)
+        self.e_st = np.zeros((B, E, S), i64)
+        self.e_bonus = np.zeros((B, E, S), i64)
+        self.e_shifted = np.zeros((B, E), bool)
+        self.e_mult = np.ones((B, E))
+        self.e_charge = np.zeros((B, E), i64)
+        self.e_over = np.zeros((B, E), i64)
+        self.e_counter = np.full((B, E), -1, i64)
+        self.e_next = np.zeros((B, E), i64)
+        self.e_last = np.full((B, E), -1, i64)
+
+        self.loc = np.full((B, N), DRAW, np.int8)
+        self.key = self.rng.random((B, N))
+        self.seq = np.zeros((B, N), i64)
+        self.seq_ctr = np.zeros(B, i64)
+
+        self.turn = np.ones(B, i64)
+        self.result = np.zeros(B, np.int8)
+        self.skip = np.zeros(B, bool)
+
+        everyone = np.ones(B, bool)
+        for j in range(E):
+            self._choose_intent(everyone, j)
+        self._draw_up_to(everyone, HAND_LIMIT)
+
+    # -- служебное --
+
+    @property
+    def active(self):
+        return self.result == 0
+
+    def _rows(self, mask):
+        return np.flatnonzero(mask)
+
+    def _check_win(self, rows):
+        if len(rows):
+            won = rows[(self.e_hp[rows] <= 0).all(axis=1) & (self.result[rows] == 0)]
+            self.result[won] = 1
+
+    def _check_loss(self, rows):
+        if len(rows):
+            lost = rows[(self.p_hp[rows] <= 0) & (self.result[rows] == 0)]
+            self.result[lost] = -1
+
+    @staticmethod
+    def _compute_damage(base, att_weak, att_freeze, def_vuln):
+        # тот же порядок умножений, что в game.compute_damage — до бита те же float
+        dmg = base.astype(float)
+        dmg = np.where(att_weak > 0, dmg * 0.75, dmg)
+        dmg = np.where(att_freeze > 0, dmg * 0.75, dmg)
+        dmg = np.where(def_vuln > 0, dmg * 1.25, dmg)
+        return np.maximum(0, np.rint(dmg)).astype(np.int64)
+
+    def _status_to_player(self, rows, s, stacks):
+        stacks = np.broadcast_to(stacks, rows.shape)
+        ok = stacks > 0
+        self.p_st[rows[ok], s] += stacks[ok]
+
+    def _status_to_enemy(self, rows, j, s, stacks):
+        if self.templates[j].immune[s] or stacks <= 0:
+            return
+        self.e_st[rows, j, s] += stacks
+
+    def _tick_dot(self, hp, st, s):
+        # яд/ожог без бафов игрока: урон = стаки, потом -1
+        on = st[..., s] > 0
+        hp[on] = np.maximum(0, hp[on] - st[..., s][on])
+        st[..., s][on] -= 1
+
+    # -- урон --
+
+    def _hit_enemy(self, rows, j, base, allow_crit):
+        """Игрок бьёт врага j (game.deal_damage: крит, статусы, блок, шипы, контратака)."""
+        if not len(rows):
+            return
+        dmg = np.broadcast_to(np.asarray(base, np.int64), rows.shape).copy()
+        if allow_crit:
+            crit = self.rng.random(len(rows)) < self.crit
+            dmg[crit] = np.rint(dmg[crit] * self.crit_mult).astype(np.int64)
+        st, est = self.p_st[rows], self.e_st[rows, j]
+        dmg = self._compute_damage(dmg, st[:, S_IDX["weak"]], st[:, S_IDX["freeze"]], est[:, S_IDX["vulnerable"]])
+        block = self.e_block[rows, j]
+        taken = np.maximum(0, dmg - block)
+        self.e_block[rows, j] = np.maximum(0, block - dmg)
+        self.e_hp[rows, j] = np.maximum(0, self.e_hp[rows, j] - taken)
+        th = est[:, S_IDX["thorns"]]
+        hit = (th > 0) & (taken > 0)
+        self.p_hp[rows[hit]] = np.maximum(0, self.p_hp[rows[hit]] - th[hit])
+        # телеграфированная контратака снимается любым ударом, срабатывает — если враг жив
+        c = self.e_counter[rows, j]
+        armed = c >= 0
+        if armed.any():
+            self.e_counter[rows[armed], j] = -1
+            fire = armed & (self.e_hp[rows, j] > 0)
+            if fire.any():
+                fr, moves = rows[fire], c[fire]
+                t = self.templates[j]
+                cd = t.counter_dmg[moves]
+                go = cd > 0
+                self._hit_player(fr[go], j, cd[go])
+                st_idx, stacks = t.status[moves], t.stacks[moves]
+                for s in np.unique(st_idx[st_idx >= 0]):
+                    sel = st_idx == s
+                    self._status_to_player(fr[sel], s, stacks[sel])
+
+    def _hit_player(self, rows, j, base):
+        """Враг j бьёт игрока (фазовый множитель, арканные бафы, блок, шипы)."""
+        if not len(rows):
+            return
+        dmg = np.broadcast_to(np.asarray(base, np.int64), rows.shape).copy()
+        mult = self.e_mult[rows, j]
+        m = mult != 1.0
+        dmg[m] = np.rint(dmg[m] * mult[m]).astype(np.int64)
+        ch = self.e_charge[rows, j] > 0
+        if ch.any():
+            dmg[ch] = np.rint(dmg[ch] * 1.15).astype(np.int64)
+            self.e_charge[rows[ch], j] -= 1
+        od = self.e_over[rows, j]
+        ov = od > 0
+        if ov.any():
+            dmg[ov] = np.rint(dmg[ov] * (1.10 + 0.05 * od[ov])).astype(np.int64)
+        est, st = self.e_st[rows, j], self.p_st[rows]
+        dmg = self._compute_damage(dmg, est[:, S_IDX["weak"]], est[:, S_IDX["freeze"]], st[:, S_IDX["vulnerable"]])
+        block = self.p_block[rows]
+        eff_block = np.where(ov, np.floor(block * 0.75).astype(np.int64), block)
+        taken = np.maximum(0, dmg - eff_block)
+        self.p_block[rows] = np.maximum(0, block - dmg)
+        self.p_hp[rows] = np.maximum(0, self.p_hp[rows] - taken)
+        th = st[:, S_IDX["thorns"]]
+        hit = (th > 0) & (taken > 0)
+        self.e_hp[rows[hit], j] = np.maximum(0, self.e_hp[rows[hit], j] - th[hit])
+
+    # -- карты --
+
+    def _draw_up_to(self, mask, n):
+        """draw_to_hand: по одной карте, с перетасовкой сброса, не больше HAND_LIMIT в руке."""
+        rows = self._rows(mask)
+        for _ in range(n):
+            if not len(rows):
+                return
+            loc = self.loc[rows]
+            room = (loc == HAND).sum(axis=1) < HAND_LIMIT
+            rows, loc = rows[room], loc[room]
+            empty = ~(loc == DRAW).any(axis=1)
+            if empty.any():
+                er = rows[empty]
+                disc = self.loc[er] == DISCARD
+                self.loc[er] = np.where(disc, DRAW, self.loc[er])
+                self.key[er] = np.where(disc, self.rng.random((len(er), self.N)), self.key[er])
+                loc = self.loc[rows]
+            can = (loc == DRAW).any(axis=1)
+            rows = rows[can]
+            if not len(rows):
+                return
+            pick = np.where(self.loc[rows] == DRAW, self.key[rows], np.inf).argmin(axis=1)
+            self.loc[rows, pick] = HAND
+            self.seq[rows, pick] = self.seq_ctr[rows]
+            self.seq_ctr[rows] += 1
+
+    def _weakest(self, rows):
+        hp = self.e_hp[rows]
+        return np.where(hp > 0, hp, np.iinfo(np.int64).max).argmin(axis=1)
+
+    def _play_kind(self, rows, kind, tgt):
+        card = self.kinds[kind]
+        for op in card.ops:
+            name = op[0]
+            if name == "damage":
+                for j in range(self.E):
+                    self._hit_enemy(rows[tgt == j], j, op[1], op[2])
+            elif name == "aoe_damage":
+                _, amount, bonus_if, bonus = op
+                for j in range(self.E):
+                    alive = rows[self.e_hp[rows, j] > 0]
+                    if not len(alive):
+                        continue
+                    dmg = np.full(len(alive), amount, np.int64)
+                    if bonus_if:
+                        dmg += bonus * (self.e_st[alive, j][:, bonus_if] > 0).any(axis=1)
+                    self._hit_enemy(alive, j, dmg, True)
+            elif name == "apply":
+                _, s, stacks, to = op
+                if to == "self":
+                    self._status_to_player(rows, s, stacks)
+                else:
+                    for j in range(self.E):
+                        sel = rows[tgt == j] if to == "enemy" else rows[self.e_hp[rows, j] > 0]
+                        self._status_to_enemy(sel, j, s, stacks)
+            elif name == "block":
+                self.p_block[rows] += op[1]
+            elif name == "draw":
+                m = np.zeros(self.B, bool)
+                m[rows] = True
+                self._draw_up_to(m, op[1])
+            elif name == "gain_mana":
+                self.p_mana[rows] += op[1]
+            elif name == "gain_max_mana":
+                self.p_mana_max[rows] += op[1]
+                self.p_mana[rows] += op[1]
+            elif name == "heal":
+                self.p_hp[rows] = np.minimum(self.p_max[rows], self.p_hp[rows] + op[1])
+            elif name == "lose_hp":
+                self.p_hp[rows] = np.maximum(0, self.p_hp[rows] - op[1])
+            elif name == "heal_per_enemy":
+                alive = (self.e_hp[rows] > 0).sum(axis=1)
+                self.p_hp[rows] = np.minimum(self.p_max[rows], self.p_hp[rows] + op[1] * alive)
+
+    def _player_phase(self, mask):
+        from simulate import MAX_PLAYS_PER_TURN
+        rows = self._rows(mask)
+        for _ in range(MAX_PLAYS_PER_TURN):
+            if not len(rows):
+                return
+            loc = self.loc[rows]
+            cand = (loc == HAND) & (self.card_cost[None, :] <= self.p_mana[rows][:, None])
+            rows, cand = rows[cand.any(axis=1)], cand[cand.any(axis=1)]
+            if not len(rows):
+                return
+            score = np.where(cand, self.card_prio[None, :] * SEQ_SPAN - self.seq[rows], np.iinfo(np.int64).min)
+            choice = score.argmax(axis=1)
+            tgt = self._weakest(rows)
+            self.p_mana[rows] -= self.card_cost[choice]
+            self.loc[rows, choice] = LIMBO
+            kinds = self.card_kind[choice]
+            for k in np.unique(kinds):
+                sel = kinds == k
+                self._play_kind(rows[sel], k, np.where(self.kinds[k].targeted, tgt[sel], -1))
+            self.loc[rows, choice] = np.where(self.card_exhaust[choice], EXHAUST, DISCARD)
+            self._check_win(rows)
+            rows = rows[self.result[rows] == 0]
+
+    # -- враги --
+
+    def _choose_intent(self, mask, j):
+        rows = self._rows(mask)
+        if not len(rows):
+            return
+        t = self.templates[j]
+        pct = self.e_hp[rows, j] / np.maximum(1, self.e_max[rows, j])
+        avail = ~(pct[:, None] > t.threshold[None, :])
+        avail &= ~(t.sets_phase[None, :] & self.e_shifted[rows, j][:, None])
+        avail[~avail.any(axis=1)] = True
+        last = self.e_last[rows, j]
+        w = np.where(np.arange(t.n)[None, :] == last[:, None], t.half_w[None, :], t.w[None, :])
+        w = np.where(avail, w, 0)
+        cum = np.cumsum(w, axis=1)
+        r = self.rng.random(len(rows)) * cum[:, -1]
+        ok = avail & (r[:, None] <= cum)
+        fallback = t.n - 1 - avail[:, ::-1].argmax(axis=1)
+        self.e_next[rows, j] = np.where(ok.any(axis=1), ok.argmax(axis=1), fallback)
+
+    def _enemy_act(self, rows, j):
+        t = self.templates[j]
+        mv = self.e_next[rows, j]
+        self.e_last[rows, j] = mv
+        typ = t.type[mv]
+
+        def sel(*names):
+            return np.isin(typ, [M_IDX[n] for n in names])
+
+        hits = sel("attack", "attack_apply")
+        self._hit_player(rows[hits], j, t.dmg[mv[hits]])
+        applies = sel("attack_apply", "apply", "apply_all")
+        if applies.any():
+            ar, am = rows[applies], mv[applies]
+            for s in np.unique(t.status[am]):
+                if s < 0:
+                    continue
+                m = t.status[am] == s
+                stacks = np.maximum(0, t.stacks[am[m]] + self.e_bonus[ar[m], j, s])
+                self._status_to_player(ar[m], s, stacks)
+        # кровоток срабатывает на атакующем
+        bleed_rows = rows[hits]
+        self._tick_bleed(bleed_rows, j)
+        blocks = sel("block", "phase_shift", "counter_prep")
+        self.e_block[rows[blocks], j] += t.block[mv[blocks]]
+        heals = sel("heal")
+        hr = rows[heals]
+        self.e_hp[hr, j] = np.minimum(self.e_max[hr, j], self.e_hp[hr, j] + t.heal[mv[heals]])
+        shifts = sel("phase_shift")
+        if shifts.any():
+            sr, sm = rows[shifts], mv[shifts]
+            self.e_shifted[sr, j] = True
+            self.e_charge[sr, j] += t.charge[sm]
+            self.e_over[sr, j] += t.overdrive[sm]
+            new_mult = t.dmg_mult[sm]
+            self.e_mult[sr, j] = np.where(new_mult > 0, new_mult, self.e_mult[sr, j])
+            bs = t.boost_status[sm]
+            has = bs >= 0
+            self.e_bonus[sr[has], j, bs[has]] += t.boost[sm[has]]
+        counters = sel("counter_prep")
+        self.e_counter[rows[counters], j] = mv[counters]
+
+    def _tick_bleed(self, rows, j):
+        b = S_IDX["bleed"]
+        st = self.e_st[rows, j, b]
+        on = st > 0
+        r = rows[on]
+        self.e_hp[r, j] = np.maximum(0, self.e_hp[r, j] - st[on])
+        self.e_st[r, j, b] -= 1
+
+    def _enemy_phase(self, mask):
+        rows = self._rows(mask)
+        self.e_block[rows] = 0
+        alive = self.e_hp[rows] > 0
+        poison = S_IDX["poison"]
+        st = self.e_st[rows][..., poison]
+        on = alive & (st > 0)
+        self.e_hp[rows] = np.where(on, np.maximum(0, self.e_hp[rows] - st), self.e_hp[rows])
+        self.e_st[rows, :, poison] = np.where(on, st - 1, st)
+        self._check_win(rows)
+        stun, freeze = S_IDX["stun"], S_IDX["freeze"]
+        for j in range(self.E):
+            rows = rows[self.result[rows] == 0]
+            r = rows[self.e_hp[rows, j] > 0]
+            if not len(r):
+                continue
+            stunned = self.e_st[r, j, stun] > 0
+            self.e_st[r[stunned], j, stun] -= 1
+            frozen = ~stunned & (self.e_st[r, j, freeze] > 0)
+            fr = np.flatnonzero(frozen)
+            slip = np.zeros(len(r), bool)
+            slip[fr] = self.rng.random(len(fr)) < 0.30
+            self.e_st[r[slip], j, freeze] -= 1
+            idle = stunned | slip
+            m = np.zeros(self.B, bool)
+            m[r[idle]] = True
+            self._choose_intent(m, j)
+            acting = r[~idle]
+            if not len(acting):
+                continue
+            self._enemy_act(acting, j)
+            self._check_loss(acting)
+            acting = acting[self.result[acting] == 0]
+            self._check_win(acting)
+            acting = acting[(self.result[acting] == 0) & (self.e_hp[acting, j] > 0)]
+            # ожог на враге в конце его действия
+            burn = S_IDX["burn"]
+            bhp, bst = self.e_hp[acting, j], self.e_st[acting, j, burn]
+            on = bst > 0
+            self.e_hp[acting, j] = np.where(on, np.maximum(0, bhp - bst), bhp)
+            self.e_st[acting, j, burn] = np.where(on, bst - 1, bst)
+            self._check_win(acting)
+            acting = acting[(self.result[acting] == 0) & (self.e_hp[acting, j] > 0)]
+            m = np.zeros(self.B, bool)
+            m[acting] = True
+            self._choose_intent(m, j)
+            self._check_win(acting)
+
+    # -- ход целиком --
+
+    def _end_turn(self, mask):
+        rows = self._rows(mask)
+        burn = S_IDX["burn"]
+        st = self.p_st[rows, burn]
+        on = st > 0
+        self.p_hp[rows[on]] = np.maximum(0, self.p_hp[rows[on]] - st[on])
+        self.p_st[rows[on], burn] -= 1
+        self.loc[rows] = np.where(self.loc[rows] == HAND, DISCARD, self.loc[rows])
+
+    def _start_turn(self, mask):
+        rows = self._rows(mask)
+        self.turn[rows] += 1
+        self.p_block[rows] = 0
+        poison = S_IDX["poison"]
+        st = self.p_st[rows, poison]
+        on = st > 0
+        self.p_hp[rows[on]] = np.maximum(0, self.p_hp[rows[on]] - st[on])
+        self.p_st[rows[on], poison] -= 1
+        self._check_loss(rows)
+        rows = rows[self.result[rows] == 0]
+        stun, freeze = S_IDX["stun"], S_IDX["freeze"]
+        stunned = self.p_st[rows, stun] > 0
+        self.p_st[rows[stunned], stun] -= 1
+        frozen = ~stunned & (self.p_st[rows, freeze] > 0)
+        fr = np.flatnonzero(frozen)
+        slip = np.zeros(len(rows), bool)
+        slip[fr] = self.rng.random(len(fr)) < 0.30
+        self.p_st[rows[slip], freeze] -= 1
+        self.skip[:] = False
+        self.skip[rows[stunned | slip]] = True
+        go = rows[~(stunned | slip)]
+        self.p_mana[go] = self.p_mana_max[go]
+        m = np.zeros(self.B, bool)
+        m[go] = True
+        self._draw_up_to(m, HAND_LIMIT)
+
+    def run(self, max_turns: int = 200) -> "BatchCombat":
+        while True:
+            active = self.active & (self.turn <= max_turns)
+            if not active.any():
+                return self
+            playing = active & ~self.skip
+            self._player_phase(playing)
+            self._end_turn(playing & self.active)
+            self._enemy_phase(active & self.active)
+            self._start_turn(active & self.active)
+
+    def summary(self) -> Dict[str, float]:
+        return summarize(self.result == 1, self.result == 0, self.turn, self.p_hp)
+
+
+def summarize(won, timed_out, turns, hp) -> Dict[str, float]:
+    won = np.asarray(won, bool)
+    turns = np.asarray(turns)
+    hp = np.asarray(hp)
+    return {
+        "n": int(len(won)),
+        "win_rate": float(won.mean()) if len(won) else 0.0,
+        "timeouts": int(np.asarray(timed_out, bool).sum()),
+        "mean_turns": float(turns.mean()) if len(turns) else 0.0,
+        "mean_hp_won": float(hp[won].mean()) if won.any() else 0.0,
+    }
+
+
+# ---- скалярная сверка ----
+
+def scalar_encounter(enemies: Sequence[str], deck: Sequence[CardRef], seed: int, *, hp: int = 70,
+                     max_hp: Optional[int] = None, mana_max: int = 3, scale: float = 1.0,
+                     max_turns: int = 200) -> Tuple[int, int, int]:
+    """Тот же бой в game.py с той же жадной политикой. Вернёт (исход, ходов, hp)."""
+    from simulate import GreedyDamagePolicy
+    random.seed(seed)
+    state = game.default_state()
+    game.new_run(state)
+    run = state["run"]
+    run.update({"seed": seed, "rng": {s: 0 for s in game.RNG_STREAMS}, "hp": hp, "max_hp": max_hp if max_hp is not None else hp,
+                "relics": [], "deck": [game.make_card_instance(*_card_ref(r), run=run) for r in deck]})
+    run.pop("room_twist", None)
+    game.start_combat(state, "fight")
+    combat = run["combat"]
+    rng = game.seeded_rng(run)
+    combat["enemies"] = game.Roster(game.instantiate_enemy(_template(t), rng, scale) for t in enemies)
+    for e in combat["enemies"]:
+        game.choose_intent(e, rng)
+    p = combat["player"]
+    p.mana_max = p.mana = mana_max
+    bot = GreedyDamagePolicy(random.Random(seed))
+    while state["screen"] == "COMBAT" and combat["turn"] <= max_turns:
+        game.dispatch(state, bot.on_combat(state, run))
+    if state["screen"] == "COMBAT":
+        return 0, combat["turn"], p.hp
+    won = state["screen"] != "DEFEAT"
+    return (1 if won else -1), combat["turn"], (run["hp"] if won else 0)
+
+
+def validate(enemies: Sequence[str], deck: Sequence[CardRef], n: int = 300, *, seed: int = 0,
+             batch: Optional[int] = None, **kw) -> Dict[str, Dict[str, float]]:
+    """Сводки пакетного и скалярного движков на одних и тех же условиях."""
+    _need_numpy()
+    res = [scalar_encounter(enemies, deck, seed + i, **kw) for i in range(n)]
+    scalar = summarize([r[0] == 1 for r in res], [r[0] == 0 for r in res], [r[1] for r in res], [r[2] for r in res])
+    max_turns = kw.pop("max_turns", 200)
+    batched = BatchCombat(enemies, deck, batch or n, seed=seed, **kw).run(max_turns).summary()
+    return {"scalar": scalar, "batch": batched}
+
+
+def starter_deck_ids() -> List[Tuple[str, bool]]:
+    """Стартовая колода без карт, которых пакетный движок не умеет."""
+    out = []
+    for ci in game.starter_deck():
+        ref = (ci["id"], bool(ci.get("up")))
+        try:
+            _Card(*ref)
+        except BatchUnsupported:
+            continue
+        out.append(ref)
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Пакетная симуляция одного боя на NumPy.")
+    ap.add_argument("enemies", nargs="+", help="id шаблонов врагов (ENEMIES/ELITES/BOSSES)")
+    ap.add_argument("--deck", nargs="+", help="id карт, «+» в конце — улучшенная (по умолчанию стартовая)")
+    ap.add_argument("--batch", type=int, default=10000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--hp", type=int, default=70)
+    ap.add_argument("--scale", type=float, default=1.0)
+    ap.add_argument("--validate", type=int, default=0, metavar="N", help="сверить с game.py на N боях")
+    args = ap.parse_args(argv)
+    _need_numpy()
+    deck = args.deck or starter_deck_ids()
+
+    t0 = time.perf_counter()
+    summary = BatchCombat(args.enemies, deck, args.batch, seed=args.seed, hp=args.hp, scale=args.scale).run().summary()
+    dt = time.perf_counter() - t0
+    print(f"Пакет: {args.batch} боёв за {dt:.2f} c ({args.batch / dt:.0f} боёв/с)")
+    print("  " + ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in summary.items()))
+    if args.validate:
+        t0 = time.perf_counter()
+        rep = validate(args.enemies, deck, args.validate, seed=args.seed, batch=args.batch, hp=args.hp, scale=args.scale)
+        dt = time.perf_counter() - t0
+        print(f"Сверка с game.py ({args.validate} боёв, {dt:.1f} c):")
+        for name, s in rep.items():
+            print(f"  {name:>6}: " + ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in s.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+# benchmarks/bench.py
+# Микробенчмарки горячих путей game.py/server.py на фиксированных сидах.
+#
+#   python benchmarks/bench.py                      # прогнать всё и сравнить с benchmarks/baseline.json
+#   python benchmarks/bench.py -k play_card         # только имена, содержащие подстроку
+#   python benchmarks/bench.py --out results.json   # машиночитаемый результат
+#   python benchmarks/bench.py --save-baseline      # записать текущие цифры как базу
+#
+# Каждый замер — rounds серий по number вызовов; подготовка (setup) в серию не входит.
+# Сравнение идёт по лучшей серии (best_ns — меньше всего шума) с поправкой на скорость
+# машины: рядом с каждым замером пишется время эталонного чистого Python-цикла (calib_ns),
+# снятое тут же, — так поправка ловит и другую машину, и плавающую частоту/соседей.
+# Код выхода 1, если хоть один замер медленнее базы больше чем на --tolerance (замеры за
+# порогом перед этим перемериваются --retries раз: единичный всплеск соседей не валит прогон).
+
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Callable, Tuple
+import argparse, json, os, pickle, platform, random, statistics, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import content
+import game
+import server
+
+FORMAT_VERSION = 1
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCE = 0.30
+SEED = 20240531
+ROUND_SEC = 0.05   # целевая длительность серии (вместе с setup) при автоподборе number
+
+# name -> (setup() -> аргумент, fn(аргумент))
+Bench = Tuple[Callable[[], Any], Callable[[Any], Any]]
+BENCHES: Dict[str, Bench] = {}
+
+
+def bench(name: str, setup: Callable[[], Any] = lambda: None):
+    def deco(fn: Callable[[Any], Any]):
+        BENCHES[name] = (setup, fn)
+        return fn
+    return deco
+
+
+# ---- фиксированные состояния ----
+
+def make_state(seed: int = SEED, *, floor: int = 1, loop: int = 0, extra_cards: int = 0,
+               all_relics: bool = False, room: Optional[str] = None, turns: int = 0) -> Dict[str, Any]:
+    """Забег на заданной глубине; с room — в бою, после turns ходов с полным журналом/сбросом."""
+    random.seed(seed)
+    state = game.default_state()
+    state["entropy"] = {"seed": seed, "ctr": 0}
+    with game.deterministic(state):
+        game.new_run(state)
+        run = state["run"]
+        run["floor"], run["loop"] = floor, loop
+        run["act"] = game.act_for_floor(floor)
+        pick = random.Random(seed)
+        ids = content.card_pool()
+        for i in range(extra_cards):
+            game.add_card_to_deck(run, pick.choice(ids), i % 3 == 0)
+        if all_relics:
+            run["relics"] = list(content.RELIC_IDS)
+        if room:
+            game.start_combat(state, room)
+            _immortal(state)
+            for _ in range(turns):
+                game.end_turn(state)
+    game.adopt_state(state)
+    return state
+
+
+def _immortal(state: Dict[str, Any]) -> None:
+    # бой не должен закончиться посреди замера
+    combat = state["run"]["combat"]
+    p = combat["player"]
+    p.hp = p.max_hp = 10 ** 6
+    for e in combat["enemies"]:
+        e.hp = e.max_hp = 10 ** 6
+
+
+SIZES = {
+    "small": dict(),
+    "medium": dict(floor=6, extra_cards=10, room="fight", turns=4),
+    "endless": dict(floor=9, loop=3, extra_cards=50, all_relics=True, room="elite", turns=12),
+}
+
+_STATES: Dict[str, Dict[str, Any]] = {}
+_BLOBS: Dict[str, bytes] = {}
+
+def fixed_state(size: str) -> Dict[str, Any]:
+    """Общий эталон размера size (только для чтения; менять — через fresh_state)."""
+    if size not in _STATES:
+        _STATES[size] = make_state(**SIZES[size])
+    return _STATES[size]
+
+
+def fresh_state(size: str) -> Dict[str, Any]:
+    # pickle в разы быстрее deepcopy и сохраняет Pile/CombatCard со связью с колодой
+    if size not in _BLOBS:
+        _BLOBS[size] = pickle.dumps(fixed_state(size), pickle.HIGHEST_PROTOCOL)
+    return pickle.loads(_BLOBS[size])
+
+
+def _clone(size: str) -> Callable[[], Dict[str, Any]]:
+    return lambda: fresh_state(size)
+
+
+# ---- бой ----
+
+def _walk_ops(effects: List[dict]):
+    for eff in effects:
+        yield eff.get("op")
+        for key in ("then", "on_crit", "steps"):
+            yield from _walk_ops(eff.get(key) or [])
+        for opt in eff.get("options") or []:
+            yield from _walk_ops(opt.get("effects") or [])
+
+
+def card_for_op() -> Dict[str, str]:
+    """op -> самая короткая карта, в эффектах которой он встречается."""
+    best: Dict[str, Tuple[int, str]] = {}
+    for c in content.CARDS:
+        for op in set(_walk_ops(c["effects"])):
+            if op and (op not in best or len(c["effects"]) < best[op][0]):
+                best[op] = (len(c["effects"]), c["id"])
+    return {op: cid for op, (_, cid) in sorted(best.items())}
+
+
+def _play_setup(card_id: str) -> Callable[[], Tuple[Dict[str, Any], str, Optional[int]]]:
+    cdef = content.get_card_def(card_id)
+    target = 0 if cdef["target"] in ("enemy", "any") else None
+
+    def setup():
+        state = fresh_state("medium")
+        combat = state["run"]["combat"]
+        combat["pending"] = None
+        combat["phase"] = "player"
+        combat["player"]["mana"] = 99
+        inst = game.make_card_instance(card_id, run=state["run"])
+        combat["hand"].append(inst)
+        return state, inst["uid"], target
+    return setup
+
+
+def _play(args):
+    state, uid, target = args
+    game.play_card(state, uid, target)
+
+
+for _op, _cid in card_for_op().items():
+    bench(f"play_card[{_op}]", _play_setup(_cid))(_play)
+
+
+@bench("end_turn", _clone("medium"))
+def _end_turn(state):
+    game.end_turn(state)
+
+
+@bench("enemy_turn", _clone("medium"))
+def _enemy_turn(state):
+    game.enemy_turn(state)
+
+
+def _run_only(size: str, room: str):
+    def setup():
+        state = fresh_state(size)
+        state["run"]["combat"] = None
+        return state, room
+    return setup
+
+
+for _room in ("fight", "elite", "boss"):
+    @bench(f"start_combat[{_room}]", _run_only("medium", _room))
+    def _start_combat(args):
+        state, room = args
+        game.start_combat(state, room)
+
+
+# ---- карта и клиент ----
+
+@bench("build_path_map", lambda: fixed_state("small")["run"])
+def _build_path_map(run):
+    game.build_path_map(run, use_run_rng=False)
+
+
+for _size in SIZES:
+    @bench(f"sanitize_for_client[{_size}]", (lambda s: lambda: fixed_state(s))(_size))
+    def _sanitize(state):
+        game.sanitize_for_client(state)
+
+
+# ---- сохранение ----
+
+# server.SAVE_DIR на время прогона указывает во временный каталог (см. run_benches)
+for _size in SIZES:
+    @bench(f"save_load_roundtrip[{_size}]", (lambda s: lambda: (f"bench_{s}", fresh_state(s)))(_size))
+    def _save_load(args):
+        sid, state = args
+        server.save_state(sid, state)
+        server.load_state(sid)
+
+
+# ---- замер ----
+
+def calibrate() -> int:
+    """Время эталонного цикла в нс: грубая мера скорости машины/интерпретатора."""
+    def work():
+        d: Dict[int, int] = {}
+        for i in range(20_000):
+            d[i & 255] = d.get(i & 255, 0) + i
+        return d
+    best = None
+    for _ in range(5):
+        t0 = time.perf_counter_ns()
+        work()
+        dt = time.perf_counter_ns() - t0
+        best = dt if best is None else min(best, dt)
+    return int(best)
+
+
+def measure(setup: Callable[[], Any], fn: Callable[[Any], Any], *, rounds: int = 5,
+            number: Optional[int] = None) -> Dict[str, Any]:
+    """Нс на вызов: лучшая и медианная серия. number=None — подобрать под ROUND_SEC."""
+    perf = time.perf_counter_ns
+    if number is None:
+        t0 = perf()
+        arg = setup()
+        fn(arg)
+        once = max(1, perf() - t0)
+        number = max(5, min(10_000, int(ROUND_SEC * 1e9 / once)))
+    per_call: List[float] = []
+    for _ in range(rounds):
+        args = [setup() for _ in range(number)]
+        total = 0
+        for arg in args:
+            t0 = perf()
+            fn(arg)
+            total += perf() - t0
+        per_call.append(total / number)
+    return {"best_ns": round(min(per_call)), "median_ns": round(statistics.median(per_call)),
+            "number": number, "rounds": rounds}
+
+
+def run_benches(pattern: str = "", *, rounds: int = 5, number: Optional[int] = None,
+                verbose: bool = False, names: Optional[List[str]] = None) -> Dict[str, Any]:
+    prev, prev_dir = game.LOG_VERBOSITY, server.SAVE_DIR
+    game.set_log_verbosity(1)   # как на сервере: журнал боя включён
+    tmp = tempfile.TemporaryDirectory(prefix="mprl_bench_")
+    server.SAVE_DIR = tmp.name
+    results: Dict[str, Any] = {}
+    try:
+        for name, (setup, fn) in BENCHES.items():
+            if (pattern and pattern not in name) or (names is not None and name not in names):
+                continue
+            calib = calibrate()
+            results[name] = measure(setup, fn, rounds=rounds, number=number)
+            results[name]["calib_ns"] = min(calib, calibrate())
+            if verbose:
+                print(f"{name:40s} {_fmt(results[name]['best_ns']):>10s}", file=sys.stderr)
+    finally:
+        game.set_log_verbosity(prev)
+        server.SAVE_DIR = prev_dir
+        tmp.cleanup()
+    return {"version": FORMAT_VERSION, "python": platform.python_version(),
+            "machine": platform.machine(), "results": results}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = DEFAULT_TOLERANCE) -> List[Dict[str, Any]]:
+    """Строки сравнения по общим замерам; ratio уже поправлен на скорость машины."""
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        scale = cur["calib_ns"] / base["calib_ns"] if cur.get("calib_ns") and base.get("calib_ns") else 1.0
+        ratio = cur["best_ns"] / max(1.0, base["best_ns"] * scale)
+        rows.append({"name": name, "base_ns": base["best_ns"], "best_ns": cur["best_ns"],
+                     "ratio": round(ratio, 3), "regressed": ratio > 1.0 + tolerance})
+    return rows
+
+
+def _dump(obj: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def _fmt(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.1f} µs"
+    return f"{ns:.0f} ns"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Микробенчмарки game.py/server.py с порогом регрессий.")
+    ap.add_argument("-k", dest="pattern", default="", help="только замеры, чьё имя содержит подстроку")
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--number", type=int, default=None, help="вызовов в серии (по умолчанию — автоподбор)")
+    ap.add_argument("--out", help="записать результаты в JSON")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                    help="допустимое замедление относительно базы (0.30 = +30%%)")
+    ap.add_argument("--retries", type=int, default=1, help="сколько раз перемерить замеры за порогом")
+    ap.add_argument("--save-baseline", action="store_true", help="записать результаты как новую базу")
+    ap.add_argument("--list", action="store_true", help="только перечислить замеры")
+    args = ap.parse_args(argv)
+
+    if args.list:
+        print("\n".join(name for name in BENCHES if args.pattern in name))
+        return 0
+
+    current = run_benches(args.pattern, rounds=args.rounds, number=args.number, verbose=True)
+    if args.save_baseline:
+        _dump(current, args.baseline)
+        print(f"база записана: {args.baseline} ({len(current['results'])} замеров)")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"базы нет ({args.baseline}) — сравнивать не с чем")
+        if args.out:
+            _dump(current, args.out)
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, args.tolerance)
+    for _ in range(args.retries):
+        bad = [r["name"] for r in rows if r["regressed"]]
+        if not bad:
+            break
+        again = run_benches(rounds=args.rounds, number=args.number, names=bad)["results"]
+        for name, res in again.items():
+            old = current["results"][name]
+            if res["best_ns"] / res["calib_ns"] < old["best_ns"] / old["calib_ns"]:
+                current["results"][name] = res
+        rows = compare(current, baseline, args.tolerance)
+    if args.out:
+        _dump(dict(current, comparison=rows), args.out)
+
+    for r in rows:
+        mark = "РЕГРЕССИЯ" if r["regressed"] else ""
+        print(f"{r['name']:40s} {_fmt(r['base_ns']):>10s} -> {_fmt(r['best_ns']):>10s}  x{r['ratio']:.2f} {mark}")
+    bad = [r["name"] for r in rows if r["regressed"]]
+    if bad:
+        print(f"\n{len(bad)} замер(ов) медленнее базы больше чем на {args.tolerance:.0%}: {', '.join(bad)}")
+        return 1
+    print(f"\nOK: {len(rows)} замеров в пределах {args.tolerance:.0%} от базы")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
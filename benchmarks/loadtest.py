@@ -0,0 +1,437 @@
+# benchmarks/loadtest.py
+# Нагрузочный прогон HTTP API: N синтетических сессий, W параллельных «игроков».
+#
+#   python benchmarks/loadtest.py --sessions 64 --workers 16 --duration 20
+#   python benchmarks/loadtest.py --url http://192.168.1.5:5173 --sessions 200 --workers 32
+#   python benchmarks/loadtest.py --in-process --actions 2000 --out load.json
+#
+# Каждая сессия создаётся через /api/bootstrap, дальше ботом simulate.py ходит через
+# /api/action ровно как фронт: шлёт base_rev, накладывает патч на свою копию state
+# (при ошибке — перезапрашивает bootstrap). Отчёт: действий/с, p50/p95/p99 задержки и
+# байты ответа по типам действий.
+#
+# Без --url поднимается server.app на 127.0.0.1 (свободный порт, werkzeug, поток на запрос)
+# со своим SessionCache и сейвами во временном каталоге; --in-process обходится без сокетов
+# (Flask test client). В обоих локальных режимах генератор и сервер делят один GIL —
+# для цифр «под железо» сервер лучше запускать отдельным процессом и давать --url.
+
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple
+import argparse, http.client, json, os, random, sys, tempfile, threading, time, urllib.parse
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import simulate
+
+PERCENTILES = (50, 95, 99)
+MAX_ACTIONS_PER_RUN = 3000   # страховка от зависшего забега: начать заново
+
+
+# ---- транспорт ----
+
+class HttpTransport:
+    """Одно keep-alive соединение на рабочий поток; при разрыве — переподключение."""
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        u = urllib.parse.urlsplit(base_url)
+        self.host, self.port = u.hostname or "127.0.0.1", u.port or 80
+        self.prefix = u.path.rstrip("/")
+        self.timeout = timeout
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def post(self, path: str, payload: Dict[str, Any]) -> Tuple[int, bytes]:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request("POST", self.prefix + path, body, {"Content-Type": "application/json"})
+                resp = self.conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.HTTPException, ConnectionError, OSError):
+                self.close()
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class InProcessTransport:
+    """Flask test client: без сокетов и HTTP-парсинга, только WSGI-стек и сам сервер."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, path: str, payload: Dict[str, Any]) -> Tuple[int, bytes]:
+        resp = self.client.post(path, json=payload)
+        return resp.status_code, resp.get_data()
+
+    def close(self) -> None:
+        pass
+
+
+# ---- клиентская копия состояния (как applyJsonPatch в static/app.js) ----
+
+def _decode_pointer(path: str) -> List[str]:
+    return [t.replace("~1", "/").replace("~0", "~") for t in path.split("/")[1:]]
+
+
+def apply_patch(doc: Any, ops: List[Dict[str, Any]]) -> Any:
+    for op in ops:
+        keys = _decode_pointer(op["path"])
+        if not keys:
+            if op["op"] == "remove":
+                raise ValueError("patch: remove root")
+            doc = op["value"]
+            continue
+        parent = doc
+        for k in keys[:-1]:
+            parent = parent[int(k)] if isinstance(parent, list) else parent[k]
+            if not isinstance(parent, (dict, list)):
+                raise ValueError(f"patch: bad path {op['path']}")
+        last = keys[-1]
+        if isinstance(parent, list):
+            idx = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(idx, op["value"])
+            elif op["op"] == "remove":
+                del parent[idx]
+            elif op["op"] == "replace":
+                parent[idx] = op["value"]
+            else:
+                raise ValueError(f"patch: op {op['op']}")
+        else:
+            if op["op"] in ("add", "replace"):
+                parent[last] = op["value"]
+            elif op["op"] == "remove":
+                del parent[last]
+            else:
+                raise ValueError(f"patch: op {op['op']}")
+    return doc
+
+
+# ---- статистика ----
+
+class Stats:
+    """Задержки (мс) и размеры ответов по типам действий; по экземпляру на поток, потом merge."""
+
+    def __init__(self):
+        self.lat: Dict[str, List[float]] = defaultdict(list)
+        self.bytes: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.patches = 0
+        self.full = 0
+        self.resyncs = 0
+
+    def add(self, kind: str, ms: float, size: int, ok: bool) -> None:
+        self.lat[kind].append(ms)
+        self.bytes[kind] += size
+        if not ok:
+            self.errors[kind] += 1
+
+    def merge(self, other: "Stats") -> None:
+        for k, v in other.lat.items():
+            self.lat[k].extend(v)
+        for k, v in other.bytes.items():
+            self.bytes[k] += v
+        for k, v in other.errors.items():
+            self.errors[k] += v
+        self.patches += other.patches
+        self.full += other.full
+        self.resyncs += other.resyncs
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Ближайший ранг: p-й перцентиль уже отсортированного списка."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def report(stats: Stats, elapsed: float, *, exclude: Tuple[str, ...] = ("bootstrap",)) -> Dict[str, Any]:
+    rows: Dict[str, Any] = {}
+    total = 0
+    for kind in sorted(stats.lat, key=lambda k: (-len(stats.lat[k]), k)):
+        lat = sorted(stats.lat[kind])
+        n = len(lat)
+        if kind not in exclude:
+            total += n
+        rows[kind] = {
+            "count": n,
+            "errors": stats.errors.get(kind, 0),
+            **{f"p{p}_ms": round(percentile(lat, p), 3) for p in PERCENTILES},
+            "max_ms": round(lat[-1], 3),
+            "mean_ms": round(sum(lat) / n, 3),
+            "bytes_mean": round(stats.bytes[kind] / n),
+            "bytes_total": stats.bytes[kind],
+        }
+    return {"elapsed_s": round(elapsed, 3), "actions": total,
+            "actions_per_s": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+            "patch_responses": stats.patches, "full_responses": stats.full, "resyncs": stats.resyncs,
+            "by_action": rows}
+
+
+def format_report(rep: Dict[str, Any]) -> str:
+    lines = [f"{rep['actions']} действий за {rep['elapsed_s']:.1f} c: {rep['actions_per_s']:.1f} действий/с; "
+             f"ответов патчем {rep['patch_responses']}, полным state {rep['full_responses']}, "
+             f"пересинхронизаций {rep['resyncs']}",
+             f"{'действие':18s} {'n':>7s} {'ошиб':>5s} {'p50 мс':>8s} {'p95 мс':>8s} {'p99 мс':>8s} "
+             f"{'max мс':>8s} {'байт/отв':>9s}"]
+    for kind, r in rep["by_action"].items():
+        lines.append(f"{kind:18s} {r['count']:>7d} {r['errors']:>5d} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+                     f"{r['p99_ms']:>8.2f} {r['max_ms']:>8.2f} {r['bytes_mean']:>9d}")
+    return "\n".join(lines)
+
+
+# ---- игрок ----
+
+class Player:
+    """Одна синтетическая сессия: sid, своя копия state и бот, который выбирает действия."""
+
+    def __init__(self, seed: int, policy: str):
+        self.bot = simulate.POLICIES[policy](random.Random(seed))
+        self.sid: Optional[str] = None
+        self.state: Optional[Dict[str, Any]] = None
+        self.rev: Optional[str] = None
+        self.actions_in_run = 0
+
+    def next_action(self) -> Dict[str, Any]:
+        st = self.state or {}
+        screen = st.get("screen")
+        if self.actions_in_run >= MAX_ACTIONS_PER_RUN or screen in ("MENU", "DEFEAT"):
+            self.actions_in_run = 0
+            return {"type": "NEW_RUN"}
+        if screen == "VICTORY":
+            return {"type": "CONTINUE_ENDLESS"}
+        if screen == "INHERIT":
+            slots = (st.get("inherit") or {}).get("slots", [])
+            slot = next((s["slot"] for s in slots if s.get("picked") is None), 0)
+            return {"type": "INHERIT_PICK", "slot": slot, "idx": 0}
+        self.actions_in_run += 1
+        return self.bot.act(_hydrate(st))
+
+
+def _hydrate(view: Dict[str, Any]) -> Dict[str, Any]:
+    """Бой во view — только combat_view (то, что рисует клиент); боту simulate.py нужен
+    run["combat"], собираем его оттуда. Карты во view полные (card_view), цена с учётом
+    боевых скидок — eff_cost, её и возвращаем боту как temp_cost_mod."""
+    run = view.get("run") or {}
+    cv = run.get("combat_view")
+    if not cv:
+        return view
+    hand = [{**c, "temp_cost_mod": int(c["cost"]) - int(c["eff_cost"])} for c in cv.get("hand", [])]
+    combat = {"turn": cv.get("turn"), "player": cv["player"], "enemies": cv["enemies"], "hand": hand,
+              "discard_pile": cv.get("discard_pile_cards", []), "pending": cv.get("pending")}
+    return {**view, "run": {**run, "combat": combat}}
+
+
+def _call(transport, stats: Stats, kind: str, path: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    t0 = time.perf_counter()
+    try:
+        status, body = transport.post(path, payload)
+    except Exception:
+        stats.add(kind, (time.perf_counter() - t0) * 1000, 0, False)
+        return None
+    ms = (time.perf_counter() - t0) * 1000
+    ok = status == 200
+    data = None
+    if ok:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            ok = False
+    stats.add(kind, ms, len(body), ok)
+    return data
+
+
+def bootstrap(transport, stats: Stats, player: Player) -> bool:
+    data = _call(transport, stats, "bootstrap", "/api/bootstrap", {"sid": player.sid} if player.sid else {})
+    if not data or "state" not in data:
+        return False
+    player.sid = data["sid"]
+    player.state = data["state"]
+    player.rev = data.get("rev")
+    return True
+
+
+def step(transport, stats: Stats, player: Player) -> None:
+    try:
+        action = player.next_action()
+    except Exception:
+        # бот не понял state (новый экран, битая копия) — как фронт: перезапросить целиком
+        stats.resyncs += 1
+        player.state = None
+        bootstrap(transport, stats, player)
+        return
+    kind = str(action.get("type"))
+    data = _call(transport, stats, kind, "/api/action", {"sid": player.sid, "action": action, "base_rev": player.rev})
+    if data is None:
+        bootstrap(transport, stats, player)
+        return
+    if "patch" in data and player.state is not None:
+        stats.patches += 1
+        try:
+            player.state = apply_patch(player.state, data["patch"])
+        except (ValueError, KeyError, IndexError, TypeError):
+            stats.resyncs += 1
+            bootstrap(transport, stats, player)
+            return
+    else:
+        stats.full += 1
+        player.state = data.get("state")
+    player.rev = data.get("rev")
+
+
+# ---- прогон ----
+
+def run_load(transport_factory, *, sessions: int = 16, workers: int = 4, duration: Optional[float] = 10.0,
+             actions: Optional[int] = None, policy: str = "greedy", seed: int = 1,
+             think_ms: float = 0.0) -> Dict[str, Any]:
+    """Создать sessions сессий и гонять их workers потоками до duration секунд или actions действий."""
+    players = [Player(seed + i, policy) for i in range(sessions)]
+    workers = max(1, min(workers, sessions))
+    # сессии делятся между потоками поровну; поток ходит своими по кругу
+    shards = [players[i::workers] for i in range(workers)]
+    all_stats = [Stats() for _ in range(workers)]
+    budget = [actions if actions is not None else float("inf")]
+    budget_lock = threading.Lock()
+    clock = [0.0, 0.0]   # начало, дедлайн — выставляются разом, когда все сессии созданы
+
+    def start() -> None:
+        clock[0] = time.perf_counter()
+        clock[1] = clock[0] + (duration if duration is not None else float("inf"))
+
+    ready = threading.Barrier(workers + 1, action=start)
+
+    def take() -> bool:
+        with budget_lock:
+            if budget[0] <= 0:
+                return False
+            budget[0] -= 1
+            return True
+
+    def worker(idx: int) -> None:
+        transport = transport_factory()
+        stats = all_stats[idx]
+        try:
+            for p in shards[idx]:
+                bootstrap(transport, stats, p)
+            ready.wait()
+            i = 0
+            while time.perf_counter() < clock[1] and take():
+                p = shards[idx][i % len(shards[idx])]
+                i += 1
+                if p.sid is None and not bootstrap(transport, stats, p):
+                    continue
+                step(transport, stats, p)
+                if think_ms:
+                    time.sleep(think_ms / 1000.0)
+        finally:
+            transport.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), name=f"load-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - clock[0]
+    total = Stats()
+    for s in all_stats:
+        total.merge(s)
+    rep = report(total, elapsed)
+    rep.update(sessions=sessions, workers=workers, policy=policy)
+    return rep
+
+
+class LocalServer:
+    """server.app на loopback-порту со своим SessionCache и временным каталогом сейвов."""
+
+    def __init__(self, *, in_process: bool = False, cache_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None):
+        import server
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+        self.server_mod = server
+        self.tmp = tempfile.TemporaryDirectory(prefix="mprl_load_")
+        self.prev = (server.SAVE_DIR, server.SESSIONS)
+        server.SAVE_DIR = self.tmp.name
+        server.SESSIONS = server.SessionCache(
+            max_size=cache_size if cache_size is not None else server.CACHE_SIZE,
+            flush_interval=flush_interval if flush_interval is not None else server.FLUSH_INTERVAL_SEC)
+        self.httpd = None
+        self.thread = None
+        self.url = ""
+        if not in_process:
+            self.httpd = make_server("127.0.0.1", 0, server.app, threaded=True, request_handler=QuietHandler)
+            self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+            self.thread = threading.Thread(target=self.httpd.serve_forever, name="load-server", daemon=True)
+            self.thread.start()
+
+    def transport_factory(self):
+        if self.httpd is None:
+            return lambda: InProcessTransport(self.server_mod.app)
+        return lambda: HttpTransport(self.url)
+
+    def close(self) -> None:
+        server = self.server_mod
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        server.SESSIONS.close()
+        server.SAVE_DIR, server.SESSIONS = self.prev
+        self.tmp.cleanup()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Нагрузочный прогон /api/bootstrap + /api/action.")
+    ap.add_argument("--url", help="адрес уже запущенного сервера (иначе — локальный на 127.0.0.1)")
+    ap.add_argument("--in-process", action="store_true", help="без сокетов: Flask test client")
+    ap.add_argument("--sessions", type=int, default=32)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=10.0, help="секунд нагрузки")
+    ap.add_argument("--actions", type=int, default=None, help="остановиться после стольких действий")
+    ap.add_argument("--policy", choices=sorted(simulate.POLICIES), default="greedy")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--think-ms", type=float, default=0.0, help="пауза «игрока» между действиями")
+    ap.add_argument("--cache-size", type=int, default=None, help="MPRL_CACHE_SIZE локального сервера")
+    ap.add_argument("--flush-interval", type=float, default=None, help="MPRL_FLUSH_INTERVAL локального сервера")
+    ap.add_argument("--out", help="записать отчёт в JSON")
+    args = ap.parse_args(argv)
+
+    local = None
+    if args.url:
+        factory = lambda: HttpTransport(args.url)
+    else:
+        local = LocalServer(in_process=args.in_process, cache_size=args.cache_size,
+                            flush_interval=args.flush_interval)
+        factory = local.transport_factory()
+    try:
+        rep = run_load(factory, sessions=args.sessions, workers=args.workers,
+                       duration=args.duration if args.actions is None else None, actions=args.actions,
+                       policy=args.policy, seed=args.seed, think_ms=args.think_ms)
+    finally:
+        if local is not None:
+            local.close()
+    rep["target"] = args.url or ("in-process" if args.in_process else local.url)
+    print(format_report(rep))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rep, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    return 1 if any(r["errors"] for r in rep["by_action"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
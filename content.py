@@ -2,7 +2,7 @@
 # Данные: карты, враги, события. Держим в одном месте, чтобы проект оставался компактным (<=10 файлов).
 
 from __future__ import annotations
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, FrozenSet, Iterable
 import random
 import copy
 
@@ -585,12 +585,57 @@ CURSES: List[Dict[str, Any]] = [
 
 CURSE_INDEX: Dict[str, Dict[str, Any]] = {c["id"]: c for c in CURSES}
 
-def get_card_def(card_id: str, upgraded: bool=False) -> Dict[str, Any]:
-    """Вернёт копию описания карты с учётом апгрейда (+)."""
-    base_src = CARD_INDEX.get(card_id) or CURSE_INDEX.get(card_id)
-    if not base_src:
-        raise KeyError(card_id)
-    base = copy.deepcopy(base_src)
+# --------------------------
+# Неизменяемые описания карт
+# --------------------------
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("описания карт только для чтения — скопируй перед изменением")
+
+
+class FrozenDict(dict):
+    """dict только для чтения: сериализуется и сравнивается как обычный dict."""
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """list только для чтения: сериализуется и сравнивается как обычный list."""
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def freeze(obj: Any) -> Any:
+    """Рекурсивно заморозить dict/list (для общих таблиц, которые никто не должен править)."""
+    if isinstance(obj, dict):
+        return FrozenDict((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return FrozenList(freeze(v) for v in obj)
+    return obj
+
+
+def _build_card_def(src: Dict[str, Any], upgraded: bool) -> Dict[str, Any]:
+    base = copy.deepcopy(src)
     if upgraded:
         if base.get("desc_up") is not None:
             base["desc"] = base["desc_up"]
@@ -605,7 +650,35 @@ def get_card_def(card_id: str, upgraded: bool=False) -> Dict[str, Any]:
     base.pop("desc_up", None)
     base.pop("cost_up", None)
     base.pop("effects_up", None)
-    return base
+    return freeze(base)
+
+# (card_id, upgraded) -> замороженное описание; собирается при импорте, а для карт,
+# которые контент-пак переопределил, — заново в build_indexes
+CARD_DEFS: Dict[Tuple[str, bool], Dict[str, Any]] = {}
+# card_id -> копия исходника, из которого собраны его CARD_DEFS (по ней видно переопределение)
+_CARD_DEF_SRC: Dict[str, Dict[str, Any]] = {}
+
+def get_card_def(card_id: str, upgraded: bool=False) -> Dict[str, Any]:
+    """Вернёт общее (только для чтения) описание карты с учётом апгрейда (+)."""
+    key = (card_id, bool(upgraded))
+    d = CARD_DEFS.get(key)
+    if d is None:
+        # карта добавлена после импорта (контент-пак) — соберём по требованию
+        src = CARD_INDEX.get(card_id) or CURSE_INDEX.get(card_id)
+        if not src:
+            raise KeyError(card_id)
+        d = CARD_DEFS[key] = _build_card_def(src, key[1])
+        _CARD_DEF_SRC.setdefault(card_id, copy.deepcopy(src))
+    return d
+
+def _refresh_card_defs() -> None:
+    # исходник карты поменялся (или карта новая) — старые замороженные описания выбрасываем
+    for src in CARDS + CURSES:
+        cid = src["id"]
+        if _CARD_DEF_SRC.get(cid) != src:
+            for up in (False, True):
+                CARD_DEFS[(cid, up)] = _build_card_def(src, up)
+            _CARD_DEF_SRC[cid] = copy.deepcopy(src)
 
 # --------------------------
 # Бафы (для upgrade-карт) — просто id -> описание и «хуки»
@@ -930,14 +1003,102 @@ def weighted_choice(rng: random.Random, items: List[dict], weight_key: str="w")
     return items[-1]
 
 def sample_cards(rng: random.Random, rarity: Optional[str]=None, k: int=1) -> List[str]:
-    pool = [c for c in CARDS if (rarity is None or c["rarity"] == rarity)]
-    return [rng.choice(pool)["id"] for _ in range(k)] if pool else []
+    pool = card_pool(rarity)
+    return [rng.choice(pool) for _ in range(k)] if pool else []
 
 def random_card_reward(rng: random.Random, k: int=3) -> List[str]:
     # В награде — смешанные редкости с весами
     ids: List[str] = []
     for _ in range(k):
-        r = weighted_choice(rng, [{"r":rr,"w":RARITY_WEIGHTS[rr]} for rr in RARITIES], "w")["r"]
-        ids.append(rng.choice([c for c in CARDS if c["rarity"] == r])["id"])
+        r = weighted_choice(rng, _RARITY_ITEMS, "w")["r"]
+        ids.append(rng.choice(card_pool(r)))
     return ids
 
+# --------------------------
+# Индексы пулов: собираются один раз (build_indexes), генерация наград,
+# магазина, сундуков и боёв берёт готовые кортежи и не сканирует списки.
+# Порядок внутри пула — порядок в CARDS/ENEMIES/RELICS, так что rng.choice
+# по пулу выбирает то же, что выбирал по отфильтрованному списку.
+# --------------------------
+CARDS_BY_RARITY: Dict[str, Tuple[str, ...]] = {}
+CARDS_BY_TAG: Dict[str, FrozenSet[str]] = {}     # тег -> id карт (и проклятий) с ним
+CARD_TAGS: Dict[str, FrozenSet[str]] = {}        # id карты -> её теги
+ENEMY_TIER_POOLS: Dict[int, Tuple[Dict[str, Any], ...]] = {}   # tier -> враги с tier <= его
+ENEMY_INDEX: Dict[str, Dict[str, Any]] = {}      # id -> шаблон (обычные, элиты, боссы)
+CARD_IDS: Tuple[str, ...] = ()
+RELIC_IDS: Tuple[str, ...] = ()
+RELIC_POS: Dict[str, int] = {}                   # id реликвии -> позиция в RELIC_IDS
+CURSE_IDS: Tuple[str, ...] = ()
+_RARITY_ITEMS: Tuple[Dict[str, Any], ...] = ()
+
+def build_indexes() -> None:
+    """Пересобрать индексы (при импорте; после правки контента контент-паком — ещё раз)."""
+    global CARD_IDS, RELIC_IDS, CURSE_IDS, _RARITY_ITEMS
+    ids = [c["id"] for c in CARDS + CURSES]
+    if len(set(ids)) != len(ids):
+        dup = sorted({cid for cid in ids if ids.count(cid) > 1})
+        raise ValueError(f"повторяющиеся id карт: {', '.join(dup)} (переопределять — заменой в CARDS/CURSES)")
+    CARD_INDEX.clear()
+    CARD_INDEX.update((c["id"], c) for c in CARDS)
+    CURSE_INDEX.clear()
+    CURSE_INDEX.update((c["id"], c) for c in CURSES)
+    _refresh_card_defs()
+    CARD_IDS = tuple(c["id"] for c in CARDS)
+    CARDS_BY_RARITY.clear()
+    for r in RARITIES:
+        CARDS_BY_RARITY[r] = tuple(c["id"] for c in CARDS if c["rarity"] == r)
+    CARD_TAGS.clear()
+    postings: Dict[str, List[str]] = {}
+    for c in CARDS + CURSES:
+        CARD_TAGS[c["id"]] = frozenset(c.get("tags", ()))
+        for t in c.get("tags", ()):
+            postings.setdefault(t, []).append(c["id"])
+    CARDS_BY_TAG.clear()
+    CARDS_BY_TAG.update((t, frozenset(ids)) for t, ids in postings.items())
+    ENEMY_TIER_POOLS.clear()
+    for tier in sorted({int(e.get("tier", 1)) for e in ENEMIES}):
+        ENEMY_TIER_POOLS[tier] = tuple(e for e in ENEMIES if int(e.get("tier", 1)) <= tier)
+    ENEMY_INDEX.clear()
+    ENEMY_INDEX.update((e["id"], e) for e in ENEMIES + ELITES + BOSSES)
+    RELIC_IDS = tuple(r["id"] for r in RELICS)
+    RELIC_POS.clear()
+    RELIC_POS.update((rid, i) for i, rid in enumerate(RELIC_IDS))
+    CURSE_IDS = tuple(c["id"] for c in CURSES)
+    _RARITY_ITEMS = tuple({"r": r, "w": RARITY_WEIGHTS[r]} for r in RARITIES)
+
+def card_pool(rarity: Optional[str] = None) -> Tuple[str, ...]:
+    """id карт указанной редкости (None — все карты)."""
+    if rarity is None:
+        return CARD_IDS
+    return CARDS_BY_RARITY.get(rarity, ())
+
+def cards_with_tag(tag: str) -> FrozenSet[str]:
+    return CARDS_BY_TAG.get(tag, frozenset())
+
+def enemy_pool(max_tier: int) -> Tuple[Dict[str, Any], ...]:
+    """Обычные враги с tier <= max_tier; если таких нет — все обычные."""
+    best = None
+    for tier in ENEMY_TIER_POOLS:
+        if tier <= max_tier:
+            best = tier
+    return ENEMY_TIER_POOLS[best] if best is not None else tuple(ENEMIES)
+
+def sample_relic(rng: random.Random, owned: Iterable[str] = ()) -> Optional[str]:
+    """Случайная ещё не полученная реликвия (None — все получены).
+
+    Пул без полученных не собираем: номер берётся как rng.choice по отфильтрованному
+    списку, а i-я свободная реликвия находится сдвигом по позициям полученных — O(|owned|)
+    вместо прохода по RELIC_IDS, и сиды дают прежние реликвии.
+    """
+    taken = sorted({RELIC_POS[r] for r in owned if r in RELIC_POS})
+    free = len(RELIC_IDS) - len(taken)
+    if free <= 0:
+        return None
+    i = rng.choice(range(free))
+    for pos in taken:
+        if pos > i:
+            break
+        i += 1
+    return RELIC_IDS[i]
+
+build_indexes()
@@ -2,8 +2,9 @@
 # Сердце игры: генерация забега, карта/этажи, бой, награды, автосейв-структура.
 
 from __future__ import annotations
-from typing import Dict, Any, List, Optional, Tuple
-import os, json, time, uuid, random, copy, math
+from typing import Dict, Any, List, Optional, Tuple, Callable
+import os, json, time, uuid, random, copy, math, zlib, hashlib, functools, threading, contextlib, operator
+from collections import deque
 
 import content
 
@@ -20,7 +21,26 @@ def clamp(v: int, lo: int, hi: int) -> int:
 def deep(obj):
     return copy.deepcopy(obj)
 
-def make_uid(prefix="c") -> str:
+_B36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def to_base36(n: int) -> str:
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _B36[r] + out
+        if not n:
+            return out
+
+def make_uid(prefix="c", run: Optional[Dict[str, Any]] = None) -> str:
+    # внутри забега — монотонный счётчик забега в base36 («c1k», «n2f»): коротко и детерминированно;
+    # старые сейвы с uid вида card_3f9a1c0b2e грузятся как есть — с новыми они не пересекаются
+    if run is not None:
+        n = int(run.get("uid_next", 0))
+        run["uid_next"] = n + 1
+        return prefix[0] + to_base36(n)
+    rng = getattr(_ENTROPY, "rng", None)
+    if rng is not None:
+        return f"{prefix}_{rng.getrandbits(40):010x}"
     return f"{prefix}_{uuid.uuid4().hex[:10]}"
 
 def act_for_floor(floor: int) -> int:
@@ -51,22 +71,623 @@ def max_enemy_tier_for_floor(floor: int, loop: int = 0) -> int:
     return 1
 
 
-def enemy_pool_for_floor(run: Dict[str, Any]) -> List[Dict[str, Any]]:
+def enemy_pool_for_floor(run: Dict[str, Any]) -> Tuple[Dict[str, Any], ...]:
     floor = int(run.get("floor", 1))
     loop = int(run.get("loop", 0))
     tier = max_enemy_tier_for_floor(floor, loop)
-    pool = [e for e in content.ENEMIES if int(e.get("tier", 1)) <= tier]
-    return pool or content.ENEMIES
-
-def seeded_rng(run: Dict[str, Any]) -> random.Random:
-    # детерминированный rng через счётчик
-    seed = int(run.get("seed", 12345))
-    ctr = int(run.get("rng_ctr", 0))
-    run["rng_ctr"] = ctr + 1
-    mix = (seed ^ (ctr * 0x9E3779B1)) & 0xFFFFFFFF
-    return random.Random(mix)
-
-def starter_deck() -> List[Dict[str, Any]]:
+    return content.enemy_pool(tier)
+
+# ---- детерминированный rng ----
+# Счётчиковый генератор: i-е число потока — SplitMix64(key + i·γ), состояние — пара (key, ctr).
+# Конструируется за пару арифметических операций, в отличие от random.Random(seed)
+# (инициализация ~2.5 КБ состояния Mersenne Twister на каждый вызов seeded_rng).
+# Потоки независимы: розыгрыш в бою не сдвигает карту, магазин — награды.
+
+RNG_STREAMS = ("combat", "map", "rewards", "events", "shop")
+
+_M64 = (1 << 64) - 1
+_GAMMA = 0x9E3779B97F4A7C15
+
+def _mix64(z: int) -> int:
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _M64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _M64
+    return z ^ (z >> 31)
+
+@functools.lru_cache(maxsize=1024)
+def _stream_base(seed: int, stream: str) -> int:
+    h = zlib.crc32(stream.encode("utf-8"))
+    return _mix64((int(seed) & _M64) ^ (h << 32) ^ h)
+
+def rng_key(seed: int, stream: str, idx: int) -> int:
+    """Ключ idx-го генератора потока stream забега с сидом seed."""
+    return _mix64((_stream_base(int(seed), stream) + (idx + 1) * _GAMMA) & _M64)
+
+class CounterRng(random.Random):
+    """random.Random поверх SplitMix64: тот же API (random/randint/choice/sample/shuffle/uniform…),
+    но без состояния Mersenne Twister — seed() его не инициализирует."""
+
+    def __init__(self, key: int = 0, ctr: int = 0):
+        self._key = int(key) & _M64
+        self._ctr = int(ctr)
+
+    def seed(self, a=None, version=2):
+        # hash() строк и байтов солится на процесс (PYTHONHASHSEED) — берём стабильный дайджест
+        if a is None:
+            key = 0
+        elif isinstance(a, int):
+            key = a
+        else:
+            key = int.from_bytes(hashlib.sha256(repr(a).encode("utf-8")).digest()[:8], "little")
+        self._key = _mix64(key & _M64)
+        self._ctr = 0
+
+    def getstate(self):
+        return (self._key, self._ctr)
+
+    def setstate(self, state):
+        self._key, self._ctr = int(state[0]) & _M64, int(state[1])
+
+    def _next64(self) -> int:
+        self._ctr = c = self._ctr + 1
+        z = (self._key + c * _GAMMA) & _M64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _M64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _M64
+        return z ^ (z >> 31)
+
+    def random(self) -> float:
+        return (self._next64() >> 11) * (1.0 / 9007199254740992.0)
+
+    def _randbelow(self, n: int) -> int:
+        # умножение вместо отбраковки: смещение порядка n/2^64, зато одно число на вызов
+        return (self._next64() * n) >> 64 if n < (1 << 32) else self._randbelow_with_getrandbits(n)
+
+    def getrandbits(self, k: int) -> int:
+        if k <= 64:
+            return self._next64() >> (64 - k) if k else 0
+        out, n = 0, 0
+        while n < k:
+            out |= self._next64() << n
+            n += 64
+        return out & ((1 << k) - 1)
+
+    def __reduce__(self):
+        return (self.__class__, self.getstate())
+
+def migrate_rng(run: Dict[str, Any]) -> Dict[str, int]:
+    """Счётчики потоков забега; старый сейв с единым rng_ctr продолжает каждый поток с него."""
+    streams = run.get("rng")
+    if streams is None:
+        base = int(run.pop("rng_ctr", 0) or 0)
+        streams = run["rng"] = {s: base for s in RNG_STREAMS}
+    return streams
+
+def seeded_rng(run: Dict[str, Any], stream: str = "combat") -> random.Random:
+    # детерминированный rng: (сид забега, поток, номер вызова в потоке)
+    streams = migrate_rng(run)
+    idx = int(streams.get(stream, 0))
+    streams[stream] = idx + 1
+    return CounterRng(rng_key(run.get("seed", 12345), stream, idx))
+
+# ---- детерминированный режим ----
+# Внутри забега всё случайное идёт от run["seed"]. Вне его энтропию брали new_run (сид забега),
+# make_uid (uuid4) и наследие (время). Под `with deterministic(state):` они берут числа из
+# state["entropy"] = {"seed", "ctr"}, так что (состояние, список действий) однозначно задают итог:
+# на этом держатся повтор журнала и replay.py.
+
+_ENTROPY = threading.local()
+
+@contextlib.contextmanager
+def deterministic(state: Dict[str, Any]):
+    ent = state.get("entropy")
+    if not isinstance(ent, dict):
+        ent = state["entropy"] = {"seed": random.randint(1, 2_000_000_000), "ctr": 0}
+    prev = getattr(_ENTROPY, "rng", None)
+    rng = _ENTROPY.rng = CounterRng(rng_key(ent["seed"], "entropy", 0), int(ent.get("ctr", 0)))
+    try:
+        yield rng
+    finally:
+        ent["ctr"] = rng.getstate()[1]
+        _ENTROPY.rng = prev
+
+def entropy_rng():
+    """Источник сидов/uid вне забега: счётчиковый под deterministic(), иначе модульный random."""
+    return getattr(_ENTROPY, "rng", None) or random
+
+# ---- стопки карт ----
+# Колода и боевые стопки — Pile: обычный список dict'ов (так и сохраняется, и уходит клиенту),
+# плюс индекс uid -> карта для поиска и изъятия без прохода по списку. append/pop/remove
+# поддерживают индекс на ходу; прочие изменения (перемешивание, срезы) его сбрасывают,
+# и он пересобирается при следующем обращении по uid.
+
+PILE_KEYS = ("draw_pile", "discard_pile", "exhaust_pile", "hand")
+
+class Pile(list):
+    __slots__ = ("_by_uid",)
+
+    def __init__(self, cards=()):
+        super().__init__(cards)
+        self._by_uid = None
+
+    def __reduce_ex__(self, protocol):
+        return (self.__class__, (list(self),))
+
+    def _index(self) -> Dict[Any, Dict[str, Any]]:
+        if self._by_uid is None:
+            self._by_uid = {c.get("uid"): c for c in self}
+        return self._by_uid
+
+    def get(self, uid) -> Optional[Dict[str, Any]]:
+        return self._index().get(uid)
+
+    def take(self, uid) -> Optional[Dict[str, Any]]:
+        """Изъять карту по uid (порядок остальных сохраняется)."""
+        c = self._index().pop(uid, None)
+        if c is not None:
+            self._drop(c)
+        return c
+
+    def _drop(self, c):
+        # по идентичности: list.remove сравнивал бы через ==, а у записей это сверка всех полей
+        for i, x in enumerate(self):
+            if x is c:
+                super().__delitem__(i)
+                return
+        raise ValueError("карты нет в стопке")
+
+    def append(self, c):
+        super().append(c)
+        if self._by_uid is not None:
+            self._by_uid[c.get("uid")] = c
+
+    def pop(self, i=-1):
+        c = super().pop(i)
+        if self._by_uid is not None:
+            self._by_uid.pop(c.get("uid"), None)
+        return c
+
+    def remove(self, c):
+        self._drop(c)
+        if self._by_uid is not None:
+            self._by_uid.pop(c.get("uid"), None)
+
+    # остальные изменения состава — просто сбросить индекс
+    def extend(self, cards):
+        self._by_uid = None
+        super().extend(cards)
+
+    def insert(self, i, c):
+        self._by_uid = None
+        super().insert(i, c)
+
+    def clear(self):
+        self._by_uid = None
+        super().clear()
+
+    def __setitem__(self, i, v):
+        self._by_uid = None
+        super().__setitem__(i, v)
+
+    def __delitem__(self, i):
+        self._by_uid = None
+        super().__delitem__(i)
+
+    def __iadd__(self, cards):
+        self._by_uid = None
+        return super().__iadd__(cards)
+
+_UNSET = object()
+
+class CombatCard(dict):
+    """Карта в бою: ссылка на экземпляр колоды (base) плюс собственные боевые поля.
+
+    Сам dict хранит только uid и то, что записано за бой (charge, temp_cost_mod…) — так он
+    и сохраняется; id и up читаются из base. Запись любого поля ложится в оверлей и
+    затеняет base, колода при этом не меняется.
+    """
+    __slots__ = ("base",)
+
+    def __init__(self, base: Dict[str, Any], fields: Optional[Dict[str, Any]] = None):
+        super().__init__(fields or {"uid": base["uid"]})
+        self.base = base
+
+    def __reduce_ex__(self, protocol):
+        return (self.__class__, (self.base, dict(self)))
+
+    def __missing__(self, key):
+        return self.base[key]
+
+    def get(self, key, default=None):
+        v = dict.get(self, key, _UNSET)
+        return self.base.get(key, default) if v is _UNSET else v
+
+def _link_combat_card(c: Dict[str, Any], deck) -> Dict[str, Any]:
+    # из сейва: {"uid"} (+ боевые поля) -> оверлей над картой колоды; полная копия старого
+    # формата тоже становится оверлеем, но со всеми полями своими
+    if isinstance(c, CombatCard) or not isinstance(deck, Pile):
+        return c
+    base = deck.get(c.get("uid"))
+    return CombatCard(base, c) if base is not None else c
+
+def find_card(cards: List[Dict[str, Any]], uid: str) -> Optional[Dict[str, Any]]:
+    if isinstance(cards, Pile):
+        return cards.get(uid)
+    return next((c for c in cards if c.get("uid") == uid), None)
+
+def take_card(cards: List[Dict[str, Any]], uid: str) -> Optional[Dict[str, Any]]:
+    if isinstance(cards, Pile):
+        return cards.take(uid)
+    for i, c in enumerate(cards):
+        if c.get("uid") == uid:
+            return cards.pop(i)
+    return None
+
+def adopt_piles(state: Dict[str, Any]) -> None:
+    """Стопки из загруженного JSON (обычные списки) -> Pile. Зовётся на входе в движок."""
+    run = state.get("run")
+    if not run:
+        return
+    if isinstance(run.get("deck"), list) and not isinstance(run["deck"], Pile):
+        run["deck"] = Pile(CardInstance.from_dict(c) if isinstance(c, dict) else c for c in run["deck"])
+    combat = run.get("combat")
+    if combat:
+        deck = run.get("deck")
+        for key in PILE_KEYS:
+            cards = combat.get(key)
+            if isinstance(cards, list) and not isinstance(cards, Pile):
+                combat[key] = Pile(_link_combat_card(c, deck) for c in cards)
+
+# ---- записи движка: карты колоды и участники боя ----
+# Экземпляры карт колоды, игрок и враги живут как объекты со __slots__: атрибуты вместо
+# поиска по ключу и без словаря на каждый объект. Статусы — восемь фиксированных слотов.
+# В сейв и клиенту уходит прежний dict: to_dict() в save_state (json_default) и
+# sanitize_for_client, from_dict() в adopt_state на входе в движок.
+
+class Record:
+    """Запись со __slots__, которую можно читать и писать и по ключу сейва.
+
+    Движок работает с атрибутами; ключи — для кода, который видит и живое состояние,
+    и view клиента (бот simulate.py), для тестов и контент-паков. Ключи вне FIELDS
+    (старые сейвы, моды) хранятся в extra и сохраняются как есть; поля из OPTIONAL
+    со значением None в dict не попадают — как отсутствующий ключ.
+    """
+    __slots__ = ("extra",)
+    FIELDS: Tuple[str, ...] = ()
+    OPTIONAL: frozenset = frozenset()
+    _KEYS: frozenset = frozenset()
+
+    def __init_subclass__(cls, **kw):
+        super().__init_subclass__(**kw)
+        cls._KEYS = frozenset(cls.FIELDS)
+
+    def __getitem__(self, key):
+        if key in self._KEYS:
+            v = getattr(self, key)
+            if v is not None or key not in self.OPTIONAL:
+                return v
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _UNSET) is not _UNSET
+
+    def __setitem__(self, key, value):
+        if key in self._KEYS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {}
+        for k in self.FIELDS:
+            v = getattr(self, k)
+            if v is not None or k not in self.OPTIONAL:
+                d[k] = v
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    @classmethod
+    def _extra_of(cls, d: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return {k: v for k, v in d.items() if k not in cls._KEYS} or None
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, Record) else other)
+        return NotImplemented
+
+    def __reduce_ex__(self, protocol):
+        return (self.from_dict, (self.to_dict(),))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class CardInstance(Record):
+    """Карта колоды: uid, id и улучшена ли. Боевые поля пишутся в CombatCard поверх неё."""
+    __slots__ = ("uid", "id", "up")
+    FIELDS = ("uid", "id", "up")
+
+    def __init__(self, uid: str, id: str, up: bool = False, extra: Optional[Dict[str, Any]] = None):
+        self.uid = uid
+        self.id = id
+        self.up = up
+        self.extra = extra
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {"uid": self.uid, "id": self.id, "up": self.up}
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "CardInstance":
+        return cls(d.get("uid"), d.get("id"), bool(d.get("up", False)), cls._extra_of(d))
+
+
+STATUS_SLOTS = tuple(content.STATUSES)
+_STATUS_SET = frozenset(STATUS_SLOTS)
+
+class Statuses:
+    """Стаки статусов: слот на каждый из content.STATUSES, 0 — статуса нет.
+
+    Снаружи — как dict ненулевых стаков (в этом виде и сохраняется).
+    """
+    __slots__ = STATUS_SLOTS
+
+    def __init__(self, stacks: Optional[Dict[str, int]] = None):
+        for s in STATUS_SLOTS:
+            setattr(self, s, 0)
+        if stacks:
+            for s, n in stacks.items():
+                self[s] = n
+
+    def __setitem__(self, status: str, n: int):
+        if status not in _STATUS_SET:
+            raise ValueError(f"неизвестный статус {status!r}")
+        setattr(self, status, max(0, int(n)))
+
+    def __getitem__(self, status: str) -> int:
+        n = getattr(self, status, 0) if status in _STATUS_SET else 0
+        if not n:
+            raise KeyError(status)
+        return n
+
+    def get(self, status: str, default=None):
+        n = getattr(self, status, 0) if status in _STATUS_SET else 0
+        return n if n else default
+
+    def __contains__(self, status) -> bool:
+        return bool(self.get(status))
+
+    def __iter__(self):
+        return (s for s in STATUS_SLOTS if getattr(self, s))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def items(self):
+        return [(s, getattr(self, s)) for s in self]
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Statuses, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __reduce_ex__(self, protocol):
+        return (self.__class__, (self.to_dict(),))
+
+    def __repr__(self):
+        return f"Statuses({self.to_dict()!r})"
+
+
+class Combatant(Record):
+    """Общее у игрока и врага. hp — свойство: при переходе через 0 оно переключает alive
+    и сдвигает счётчик живых в Roster, где стоит враг."""
+    __slots__ = ("name", "_hp", "max_hp", "block", "statuses", "buffs", "alive")
+    # у игрока нет фаз и иммунитетов — только чтение; у Enemy это слоты
+    vars = content.freeze({})
+    status_immunities = ()
+    _roster = None
+
+    def _init_common(self, name, hp, max_hp, block, statuses, buffs, extra):
+        self.name = name
+        self._hp = hp
+        self.alive = hp > 0
+        self.max_hp = max_hp
+        self.block = block
+        self.statuses = statuses if isinstance(statuses, Statuses) else Statuses(statuses)
+        self.buffs = buffs if buffs is not None else {}
+        self.extra = extra
+
+    def _set_hp(self, hp: int):
+        self._hp = hp
+        if (hp > 0) is not self.alive:
+            self.alive = not self.alive
+            roster = self._roster
+            if roster is not None:
+                roster.alive += 1 if self.alive else -1
+
+    hp = property(operator.attrgetter("_hp"), _set_hp)
+
+    def __setitem__(self, key, value):
+        if key == "statuses" and not isinstance(value, Statuses):
+            value = Statuses(value)
+        Record.__setitem__(self, key, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = Record.to_dict(self)
+        d["statuses"] = self.statuses.to_dict()
+        return d
+
+
+class Player(Combatant):
+    __slots__ = ("mana", "mana_max", "crit")
+    FIELDS = ("name", "hp", "max_hp", "block", "mana_max", "mana", "statuses", "buffs", "crit")
+
+    def __init__(self, hp: int, max_hp: int, *, name: str = "Игрок", block: int = 0, mana: int = 3,
+                 mana_max: int = 3, statuses=None, buffs=None, crit: float = content.CRIT_BASE_CHANCE,
+                 extra: Optional[Dict[str, Any]] = None):
+        self._init_common(name, hp, max_hp, block, statuses, buffs, extra)
+        self.mana = mana
+        self.mana_max = mana_max
+        self.crit = crit
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Player":
+        return cls(int(d.get("hp", 0)), int(d.get("max_hp", 0)), name=d.get("name", "Игрок"),
+                   block=int(d.get("block", 0)), mana=int(d.get("mana", 0)), mana_max=int(d.get("mana_max", 3)),
+                   statuses=d.get("statuses"), buffs=d.get("buffs"), crit=d.get("crit", content.CRIT_BASE_CHANCE),
+                   extra=cls._extra_of(d))
+
+
+class Enemy(Combatant):
+    __slots__ = ("id", "vars", "status_immunities", "tier", "intent", "last_move",
+                 "moves", "next", "next_move", "_roster")
+    FIELDS = ("id", "name", "hp", "max_hp", "block", "statuses", "buffs", "vars", "status_immunities",
+              "tier", "intent", "last_move", "moves", "next", "next_move")
+    # moves — только у врагов без таблицы ходов; next/next_move — после choose_intent
+    OPTIONAL = frozenset({"moves", "next", "next_move"})
+
+    def __init__(self, id: str, name: str, hp: int, max_hp: int, *, block: int = 0, statuses=None, buffs=None,
+                 vars: Optional[Dict[str, Any]] = None, status_immunities=(), tier: int = 1, intent=None,
+                 last_move: Optional[str] = None, moves=None, next: Optional[str] = None, next_move=None,
+                 extra: Optional[Dict[str, Any]] = None):
+        self._roster = None
+        self._init_common(name, hp, max_hp, block, statuses, buffs, extra)
+        self.id = id
+        self.vars = vars if vars is not None else {}
+        self.status_immunities = list(status_immunities)
+        self.tier = tier
+        self.intent = intent
+        self.last_move = last_move
+        self.moves = moves
+        self.next = next
+        self.next_move = next_move
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Enemy":
+        return cls(d.get("id"), d.get("name", ""), int(d.get("hp", 0)), int(d.get("max_hp", 0)),
+                   block=int(d.get("block", 0)), statuses=d.get("statuses"), buffs=d.get("buffs"),
+                   vars=d.get("vars"), status_immunities=d.get("status_immunities", ()),
+                   tier=int(d.get("tier", 1)), intent=d.get("intent"), last_move=d.get("last_move"),
+                   moves=d.get("moves"), next=d.get("next"), next_move=d.get("next_move"),
+                   extra=cls._extra_of(d))
+
+
+class Roster(list):
+    """Враги боя плюс счётчик живых (alive) — его ведут сами враги при смене hp,
+    так что «все мертвы» — сравнение с нулём, а не проход по списку."""
+    __slots__ = ("alive",)
+
+    def __init__(self, enemies=()):
+        super().__init__(enemies)
+        self.alive = 0
+        for e in self:
+            self._link(e)
+
+    def _link(self, e: Enemy):
+        e._roster = self
+        self.alive += e.alive
+
+    def __reduce_ex__(self, protocol):
+        return (self.__class__, (list(self),))
+
+    def append(self, e: Enemy):
+        super().append(e)
+        self._link(e)
+
+
+def json_default(obj: Any) -> Any:
+    """default= для json.dumps живого состояния: записи -> dict сейва, журнал боя -> строки."""
+    if isinstance(obj, (Record, Statuses)):
+        return obj.to_dict()
+    return list(obj)
+
+def adopt_state(state: Dict[str, Any]) -> None:
+    """JSON из сейва/теста -> живые структуры движка: стопки (adopt_piles), игрок и враги.
+    Зовётся на входе в движок (apply_action, start_combat, загрузка сессии); уже живые
+    объекты не трогает."""
+    adopt_piles(state)
+    combat = _combat_of(state)
+    if combat:
+        _adopt_combat(combat)
+
+def _combat_of(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    run = state.get("run")
+    return run.get("combat") if run else None
+
+def _adopt_combat(combat: Dict[str, Any]) -> Optional[List[Tuple[Any, Any]]]:
+    """Игрок и враги из dict -> записи. Пары (что было, чем заменили) — для _restore_plain;
+    None, если всё уже живое."""
+    p, enemies = combat.get("player"), combat.get("enemies")
+    if not isinstance(p, dict) and (enemies is None or isinstance(enemies, Roster)):
+        return None
+    swapped = []
+    if isinstance(p, dict):
+        combat["player"] = Player.from_dict(p)
+        swapped.append((p, combat["player"]))
+    if enemies is not None and not isinstance(enemies, Roster):
+        roster = Roster()
+        for e in enemies:
+            if isinstance(e, dict):
+                e2 = Enemy.from_dict(e)
+                swapped.append((e, e2))
+                e = e2
+            roster.append(e)
+        combat["enemies"] = roster
+        swapped.append((enemies, roster))
+    return swapped
+
+def _restore_plain(combat: Dict[str, Any], swapped: List[Tuple[Any, Any]]) -> None:
+    """Обратно к dict'ам вызывающего: те же объекты, поля — из записей."""
+    back = {id(rec): plain for plain, rec in swapped}
+    for plain, rec in swapped:
+        if isinstance(plain, dict):
+            plain.clear()
+            plain.update(rec.to_dict())
+    p = combat.get("player")
+    combat["player"] = back.get(id(p), p)
+    enemies = combat.get("enemies")
+    plain = back.get(id(enemies))
+    if plain is not None:
+        # враги, появившиеся за вызов (призыв), остаются записями — они читаются и по ключу
+        plain[:] = [back.get(id(e), e) for e in enemies]
+        combat["enemies"] = plain
+
+def _accepts_plain(combat_of: Optional[Callable[[Any], Optional[Dict[str, Any]]]] = _combat_of):
+    """Точку входа движка можно звать и с боем из обычных dict'ов (тесты, моды, скрипты):
+    на время вызова игрок и враги становятся записями, после — снова те же dict'ы с новыми
+    полями. Живое состояние проходит насквозь без копий. combat_of=None — первый аргумент
+    и есть бой; остальные аргументы-dict'ы подменяются их записями."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def entry(first, *args, **kw):
+            combat = combat_of(first) if combat_of else first
+            swapped = _adopt_combat(combat) if combat else None
+            if swapped is None:
+                return fn(first, *args, **kw)
+            recs = {id(plain): rec for plain, rec in swapped}
+            args = tuple(recs.get(id(a), a) for a in args)
+            try:
+                return fn(first, *args, **kw)
+            finally:
+                _restore_plain(combat, swapped)
+        return entry
+    return wrap
+
+def starter_deck(run: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     # 10 стартовых карт (простые, без классов)
     # Немного всего, чтобы было куда билдиться.
     base = [
@@ -81,27 +702,21 @@ def starter_deck() -> List[Dict[str, Any]]:
         ("RUNE_SLASH", False),
         ("CHAIN_PULL", False),
     ]
-    return [make_card_instance(cid, up) for cid, up in base]
+    return Pile(make_card_instance(cid, up, run) for cid, up in base)
 
-def make_card_instance(card_id: str, upgraded: bool=False) -> Dict[str, Any]:
-    return {
-        "uid": make_uid("card"),
-        "id": card_id,
-        "up": bool(upgraded),
-        # мета-поля (не обязаны быть у всех):
-        "note": "",
-    }
+def make_card_instance(card_id: str, upgraded: bool=False, run: Optional[Dict[str, Any]] = None) -> CardInstance:
+    return CardInstance(make_uid("card", run), card_id, bool(upgraded))
 
 def add_card_to_deck(run: Dict[str, Any], card_id: str, upgraded: bool=False) -> Dict[str, Any]:
-    inst = make_card_instance(card_id, upgraded)
-    run.setdefault("deck", []).append(inst)
+    inst = make_card_instance(card_id, upgraded, run)
+    run.setdefault("deck", Pile()).append(inst)
     return inst
 
 def add_curse_to_deck(run: Dict[str, Any], curse_id: Optional[str] = None, rng: Optional[random.Random] = None) -> Dict[str, Any]:
-    r = rng or random.Random()
-    cid = curse_id or r.choice(content.CURSES)["id"]
-    inst = make_card_instance(cid, False)
-    run.setdefault("deck", []).append(inst)
+    r = rng or entropy_rng()
+    cid = curse_id or r.choice(content.CURSE_IDS)
+    inst = make_card_instance(cid, False, run)
+    run.setdefault("deck", Pile()).append(inst)
     return inst
 
 def is_curse_card(card_def: Dict[str, Any]) -> bool:
@@ -116,11 +731,7 @@ def grant_relic(run: Dict[str, Any], relic_id: str) -> None:
         run["relics"].append(relic_id)
 
 def random_relic(rng: random.Random, owned: Optional[List[str]] = None) -> Optional[str]:
-    owned = owned or []
-    pool = [r for r in content.RELICS if r["id"] not in owned]
-    if not pool:
-        return None
-    return rng.choice(pool)["id"]
+    return content.sample_relic(rng, owned or ())
 
 def ensure_rarity_pity(run: Dict[str, Any]) -> Dict[str, int]:
     rp = run.get("rarity_pity") or {}
@@ -158,8 +769,7 @@ def generate_card_choices(run: Dict[str, Any], rng: random.Random, k: int = 3) -
         rarities[-1] = "uncommon"
     ids: List[str] = []
     for r in rarities:
-        pool = [c for c in content.CARDS if c["rarity"] == r]
-        ids.append(rng.choice(pool)["id"])
+        ids.append(rng.choice(content.card_pool(r)))
     return ids
 
 def card_cost(card_def: Dict[str, Any], inst: Dict[str, Any]) -> int:
@@ -167,56 +777,112 @@ def card_cost(card_def: Dict[str, Any], inst: Dict[str, Any]) -> int:
     mod = int(inst.get("temp_cost_mod", 0))
     return max(0, base - mod)
 
-def crit_chance(player: Dict[str, Any]) -> float:
-    base = float(player.get("crit", content.CRIT_BASE_CHANCE))
+def crit_chance(player: Player) -> float:
+    buffs = player.buffs
     bonus = 0.0
-    bonus += 0.10 * buff_count(player, "crit_plus_10")
-    bonus += 0.15 * buff_count(player, "crit_plus_15")
-    bonus += 0.25 * buff_count(player, "crit_godmode")
-    return clamp(int((base + bonus) * 1000), 0, 1000) / 1000.0
+    if buffs:
+        bonus += 0.10 * buffs.get("crit_plus_10", 0)
+        bonus += 0.15 * buffs.get("crit_plus_15", 0)
+        bonus += 0.25 * buffs.get("crit_godmode", 0)
+    return clamp(int((player.crit + bonus) * 1000), 0, 1000) / 1000.0
+
+def crit_mult(player: Player) -> float:
+    return 2.0 + float(player.buffs.get("crit_godmode", 0))
 
-def crit_mult(player: Dict[str, Any]) -> float:
-    return 2.0 + float(buff_count(player, "crit_godmode"))
+# Стаки статусов — int-слоты Statuses (0 — нет статуса), бафы — dict без нулей:
+# пишутся только через status_add/status_set/add_buff/consume_buff.
 
-def status_get(ent: Dict[str, Any], status: str) -> int:
-    return int(ent.get("statuses", {}).get(status, 0))
+def status_get(ent: Combatant, status: str) -> int:
+    try:
+        return getattr(ent.statuses, status, 0)
+    except AttributeError:  # участник боя как dict сейва
+        st = ent.get("statuses")
+        return st.get(status, 0) if st else 0
 
-def status_add(ent: Dict[str, Any], status: str, stacks: int, *, combat: Optional[Dict[str, Any]] = None, source: Optional[str] = None) -> bool:
+def status_add(ent: Combatant, status: str, stacks: int, *, combat: Optional[Dict[str, Any]] = None, source: Optional[str] = None) -> bool:
     if stacks <= 0:
         return False
-    immune = set(ent.get("status_immunities", []))
-    if status in immune:
+    if status in ent.status_immunities:
         if combat and source:
-            log(combat, f"{ent.get('name', 'Цель')} игнорирует {status}.")
+            log(combat, "{} игнорирует {}.", ent.name or "Цель", status)
         return False
-    ent.setdefault("statuses", {})
-    ent["statuses"][status] = int(ent["statuses"].get(status, 0)) + int(stacks)
+    st = ent.statuses
+    st[status] = getattr(st, status, 0) + int(stacks)
     return True
 
-def status_set(ent: Dict[str, Any], status: str, stacks: int):
-    ent.setdefault("statuses", {})
-    if stacks <= 0:
-        ent["statuses"].pop(status, None)
-    else:
-        ent["statuses"][status] = int(stacks)
+def status_set(ent: Combatant, status: str, stacks: int):
+    ent.statuses[status] = stacks if stacks > 0 else 0
 
 
-def status_with_bonus(attacker: Optional[Dict[str, Any]], status: str, stacks: int) -> int:
-    bonus_map = (attacker or {}).get("vars", {}).get("status_bonus", {}) or {}
-    return max(0, stacks + int(bonus_map.get(status, 0)))
+def status_with_bonus(attacker: Optional[Combatant], status: str, stacks: int) -> int:
+    bonus_map = attacker.vars.get("status_bonus") if attacker is not None else None
+    return max(0, stacks + int(bonus_map.get(status, 0))) if bonus_map else max(0, stacks)
 
 
-def buff_count(ent: Dict[str, Any], buff: str) -> int:
-    return int(ent.get("buffs", {}).get(buff, 0))
+def buff_count(ent: Combatant, buff: str) -> int:
+    try:
+        return ent.buffs.get(buff, 0)
+    except AttributeError:  # участник боя как dict сейва
+        return (ent.get("buffs") or {}).get(buff, 0)
 
-def status_dec(ent: Dict[str, Any], status: str, dec: int=1):
+def status_dec(ent: Combatant, status: str, dec: int=1):
     s = status_get(ent, status) - dec
     status_set(ent, status, s)
 
-def log(combat: Dict[str, Any], msg: str):
-    combat.setdefault("log", [])
-    combat["log"].append(msg)
-    combat["log"] = combat["log"][-80:]  # ограничим историю
+# ---- журнал боя ----
+# Живой журнал — кольцо фиксированной ёмкости из (шаблон, аргументы); текст собирается только
+# при чтении/сериализации. В сейв и клиенту уходит обычный список строк.
+LOG_CAPACITY = 80
+# 0 — не вести журнал вовсе (симуляции/бенчмарки), 1 — обычный
+LOG_VERBOSITY = 1
+
+
+def set_log_verbosity(level: int) -> None:
+    global LOG_VERBOSITY
+    LOG_VERBOSITY = int(level)
+
+
+class CombatLog:
+    __slots__ = ("entries",)
+
+    def __init__(self, lines=()):
+        self.entries = deque(lines, maxlen=LOG_CAPACITY)
+
+    def add(self, msg: str, args: tuple = ()):
+        self.entries.append((msg, args) if args else msg)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, i: int) -> str:
+        e = self.entries[i]
+        return e if isinstance(e, str) else e[0].format(*e[1])
+
+    def __iter__(self):
+        for e in self.entries:
+            yield e if isinstance(e, str) else e[0].format(*e[1])
+
+    def render(self) -> List[str]:
+        return list(self)
+
+
+def log(combat: Dict[str, Any], msg: str, *args: Any):
+    """Записать строку в журнал боя: msg — шаблон str.format, args подставятся при чтении."""
+    if LOG_VERBOSITY <= 0:
+        return
+    buf = combat.get("log")
+    if not isinstance(buf, CombatLog):
+        # бой из сейва/теста: список строк -> кольцо
+        buf = combat["log"] = CombatLog(buf or ())
+    buf.add(msg, args)
+
+
+def render_log(combat: Dict[str, Any]) -> None:
+    """Заменить журнал боя списком строк — в копии боя для сейва; живой бой так не трогают,
+    иначе следующий log() начнёт новое кольцо."""
+    buf = combat.get("log")
+    if isinstance(buf, CombatLog):
+        combat["log"] = buf.render()
 
 # ---- состояние/сейвы ----
 
@@ -239,19 +905,54 @@ def default_state() -> Dict[str, Any]:
         },
     }
 
+# Внутренняя кухня, которой нет во view: бой и колода уходят как combat_view/deck_view
+VIEW_HIDDEN = frozenset({"entropy", "journal_seq"})
+RUN_VIEW_HIDDEN = frozenset({"combat", "deck", "rng", "rarity_pity", "uid_next"})
+# поля рана, которые только заменяют целиком (на месте не правят) — во view идут как есть
+RUN_VIEW_SHARED = frozenset({"path_map", "room_choices"})
+
+_SCALARS = frozenset({str, int, bool, float, type(None)})
+
+def _detached(obj: Any) -> Any:
+    """Своя копия для view: dict/list копируются, записи -> dict сейва, оверлей боя -> карта
+    целиком. Замороженное (content.freeze) и скаляры не копируются — они не меняются."""
+    t = type(obj)
+    if t is dict:
+        return {k: (v if type(v) in _SCALARS else _detached(v)) for k, v in obj.items()}
+    if t is list:
+        return [v if type(v) in _SCALARS else _detached(v) for v in obj]
+    if t in _SCALARS or isinstance(obj, (content.FrozenDict, content.FrozenList)):
+        return obj
+    if isinstance(obj, CombatCard):
+        d = _detached(obj.base)
+        d.update((k, _detached(v)) for k, v in obj.items())
+        return d
+    if isinstance(obj, (Record, Statuses)):
+        obj = obj.to_dict()
+    if isinstance(obj, dict):
+        return {k: (v if type(v) in _SCALARS else _detached(v)) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, CombatLog)):
+        return [v if type(v) in _SCALARS else _detached(v) for v in obj]
+    return obj
+
+def _run_view(live: Dict[str, Any]) -> Dict[str, Any]:
+    run = {k: (v if k in RUN_VIEW_SHARED or type(v) in _SCALARS else _detached(v))
+           for k, v in live.items() if k not in RUN_VIEW_HIDDEN}
+    run["act"] = act_for_floor(run.get("floor", 1))
+    # Заполняем удобные поля для фронта
+    run["deck_view"] = [card_view(ci) for ci in live.get("deck", [])]
+    run["relics_view"] = [content.RELIC_INDEX[rid] for rid in run.get("relics", []) if rid in content.RELIC_INDEX]
+    combat = live.get("combat")
+    run["combat_view"] = combat_view(combat) if combat else None
+    return run
+
 def sanitize_for_client(state: Dict[str, Any]) -> Dict[str, Any]:
-    # Делаем "view": добавим карточные дефы в нужных местах, без лишней внутренней кухни.
-    st = deep(state)
-    run = st.get("run")
-    if run:
-        run["act"] = act_for_floor(run.get("floor", 1))
-        # Заполняем удобные поля для фронта
-        run["deck_view"] = [card_view(ci) for ci in run.get("deck", [])]
-        run["relics_view"] = [content.RELIC_INDEX[rid] for rid in run.get("relics", []) if rid in content.RELIC_INDEX]
-        if run.get("combat"):
-            run["combat_view"] = combat_view(run["combat"])
-        else:
-            run["combat_view"] = None
+    # Делаем "view": только то, что рисует клиент, с карточными дефами в нужных местах.
+    # View от живого состояния не зависит: всё, что меняется на месте, копируется
+    # (_detached), общими остаются только RUN_VIEW_SHARED (их не правят, а заменяют целиком)
+    # и замороженный контент. Так что view можно сразу отдавать и сравнивать со следующим.
+    st = {k: (_run_view(v) if k == "run" and v else v if type(v) in _SCALARS else _detached(v))
+          for k, v in state.items() if k not in VIEW_HIDDEN}
     # Контент — для кодекса/рендера
     st["content_summary"] = {
         "rarities": content.RARITIES,
@@ -305,13 +1006,24 @@ def continue_run(state: Dict[str, Any]) -> None:
         state["screen"] = "MAP"
     state["updated_at"] = now_ts()
 
+def _card_ident(inst: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+    """uid, id, up карты — из слотов CardInstance, в том числе под оверлеем боя."""
+    t = type(inst)
+    if t is CardInstance:
+        return inst.uid, inst.id, inst.up
+    if t is CombatCard and type(inst.base) is CardInstance:
+        base = inst.base
+        return dict.get(inst, "uid", base.uid), dict.get(inst, "id", base.id), dict.get(inst, "up", base.up)
+    return inst["uid"], inst["id"], inst.get("up", False)
+
 def card_view(inst: Dict[str, Any]) -> Dict[str, Any]:
-    d = content.get_card_def(inst["id"], upgraded=bool(inst.get("up", False)))
+    uid, cid, up = _card_ident(inst)
+    d = content.get_card_def(cid, upgraded=bool(up))
     v = {
-        "uid": inst["uid"],
-        "id": inst["id"],
-        "up": bool(inst.get("up", False)),
-        "name": d["name"] + ("+" if inst.get("up") else ""),
+        "uid": uid,
+        "id": cid,
+        "up": bool(up),
+        "name": d["name"] + ("+" if up else ""),
         "rarity": d["rarity"],
         "type": d["type"],
         "cost": d["cost"],
@@ -325,18 +1037,22 @@ def card_view(inst: Dict[str, Any]) -> Dict[str, Any]:
     return v
 
 def combat_view(combat: Dict[str, Any]) -> Dict[str, Any]:
-    # В бою нужен ещё charge/temp_cost_mod, чтобы красиво показывать
-    v = deep(combat)
+    # Только то, что рисует клиент: стопки — счётчиками (сброс — последними картами),
+    # карты — целиком (card_view), без внутренностей врагов. Всё собирается заново.
+    log_ = combat.get("log")
+    v = {
+        "turn": combat.get("turn"),
+        "phase": combat.get("phase"),
+        "log": log_.render() if isinstance(log_, CombatLog) else list(log_ or ()),
+    }
     # заменим карты в руке на view с динамикой
     hand = []
     for inst in combat.get("hand", []):
-        d = content.get_card_def(inst["id"], upgraded=bool(inst.get("up", False)))
-        dmg_preview = preview_damage(d, inst, combat)
         hv = card_view(inst)
-        hv["uid"] = inst["uid"]
+        d = content.get_card_def(hv["id"], upgraded=hv["up"])
         hv["eff_cost"] = card_cost(d, inst)
         hv["charge"] = int(inst.get("charge", 0))
-        hv["dmg_preview"] = dmg_preview
+        hv["dmg_preview"] = preview_damage(d, inst, combat)
         hand.append(hv)
     v["hand"] = hand
     v["draw_count"] = len(combat.get("draw_pile", []))
@@ -344,32 +1060,32 @@ def combat_view(combat: Dict[str, Any]) -> Dict[str, Any]:
     v["discard_pile_cards"] = [card_view(ci) for ci in combat.get("discard_pile", [])][-18:]
     v["exhaust_count"] = len(combat.get("exhaust_pile", []))
     # игрок
-    p = combat.get("player", {})
+    p = combat["player"]
     v["player"] = {
-        "hp": p.get("hp", 0),
-        "max_hp": p.get("max_hp", 0),
-        "block": p.get("block", 0),
-        "mana": p.get("mana", 0),
-        "mana_max": p.get("mana_max", 0),
-        "statuses": p.get("statuses", {}),
-        "buffs": p.get("buffs", {}),
+        "hp": p.hp,
+        "max_hp": p.max_hp,
+        "block": p.block,
+        "mana": p.mana,
+        "mana_max": p.mana_max,
+        "statuses": p.statuses.to_dict(),
+        "buffs": dict(p.buffs),
         "crit": round(crit_chance(p), 3),
     }
     # враги
     enemies = []
     for e in combat.get("enemies", []):
         enemies.append({
-            "id": e["id"],
-            "name": e["name"],
-            "hp": e["hp"],
-            "max_hp": e["max_hp"],
-            "block": e.get("block", 0),
-            "statuses": e.get("statuses", {}),
-            "intent": e.get("intent", {}),
+            "id": e.id,
+            "name": e.name,
+            "hp": e.hp,
+            "max_hp": e.max_hp,
+            "block": e.block,
+            "statuses": e.statuses.to_dict(),
+            "intent": _detached(e.intent),
         })
     v["enemies"] = enemies
     # pending
-    v["pending"] = combat.get("pending", None)
+    v["pending"] = _detached(combat.get("pending", None))
     return v
 
 def preview_damage(card_def: Dict[str, Any], inst: Dict[str, Any], combat: Dict[str, Any]) -> Optional[int]:
@@ -395,12 +1111,12 @@ def preview_damage(card_def: Dict[str, Any], inst: Dict[str, Any], combat: Dict[
 
 def new_run(state: Dict[str, Any], *, keep_cards: Optional[List[Dict[str, Any]]] = None) -> None:
     """Создать новый забег. keep_cards — 0..3 карты, которые заменят 3 слабые стартовые."""
-    run_seed = random.randint(1, 2_000_000_000)
+    run_seed = entropy_rng().randint(1, 2_000_000_000)
     diff = int(state.get("settings", {}).get("difficulty", 1))
     run = {
         "id": make_uid("run"),
         "seed": run_seed,
-        "rng_ctr": 0,
+        "rng": {s: 0 for s in RNG_STREAMS},
         "started_at": now_ts(),
         "difficulty": diff,
         "loop": 0,           # бесконечные циклы после победы
@@ -410,7 +1126,8 @@ def new_run(state: Dict[str, Any], *, keep_cards: Optional[List[Dict[str, Any]]]
         "max_hp": 70,
         "hp": 70,
         "rarity_pity": {"rare": 0, "legendary": 0},
-        "deck": starter_deck(),
+        "uid_next": 0,       # счётчик uid карт и узлов карты (make_uid)
+        "deck": [],
         "relics": ["STARTER_SEAL"],
         "combat": None,
         "room": None,
@@ -425,6 +1142,8 @@ def new_run(state: Dict[str, Any], *, keep_cards: Optional[List[Dict[str, Any]]]
         "current_node": None,
     }
 
+    run["deck"] = starter_deck(run)
+
     # Наследование: заменим 3 «простых» карты на выбранные, но оставим 10 карт в старте.
     if keep_cards:
         # выбросим из стартовой колоды 3 самых «простых» по приоритету
@@ -439,10 +1158,10 @@ def new_run(state: Dict[str, Any], *, keep_cards: Optional[List[Dict[str, Any]]]
                     break
         # добавим выбранные (клон с новым uid)
         for kc in keep_cards[:3]:
-            run["deck"].append(make_card_instance(kc["id"], bool(kc.get("up", False))))
+            run["deck"].append(make_card_instance(kc["id"], bool(kc.get("up", False)), run))
         # если всё равно не 10 (вдруг), добьём стартером
         while len(run["deck"]) < 10:
-            run["deck"].append(make_card_instance("ARCANE_JAB", False))
+            run["deck"].append(make_card_instance("ARCANE_JAB", False, run))
         while len(run["deck"]) > 10:
             run["deck"].pop()
 
@@ -490,7 +1209,7 @@ def room_label_and_hint(room_type: str, act: int) -> Tuple[str, str]:
 
 
 def build_path_map(run: Dict[str, Any], *, use_run_rng: bool = True) -> Dict[str, Any]:
-    rng = seeded_rng(run) if use_run_rng else random.Random(int(run.get("seed", 12345)) ^ 0xC0FFEE)
+    rng = seeded_rng(run, "map") if use_run_rng else CounterRng(rng_key(run.get("seed", 12345), "path_map", 0))
     lanes = 5
     floors: List[List[Dict[str, Any]]] = []
     prev_layer: List[Dict[str, Any]] = []
@@ -512,7 +1231,7 @@ def build_path_map(run: Dict[str, Any], *, use_run_rng: bool = True) -> Dict[str
             })
             label, hint = room_label_and_hint(rtype, act)
             node = {
-                "id": make_uid("node"),
+                "id": make_uid("node", run),
                 "type": rtype,
                 "label": label,
                 "hint": hint,
@@ -591,7 +1310,7 @@ ROOM_TWISTS = [
 
 def maybe_roll_room_twist(state: Dict[str, Any], room_type: str) -> Optional[Dict[str, Any]]:
     run = state["run"]
-    rng = seeded_rng(run)
+    rng = seeded_rng(run, "map")
     if rng.random() >= 0.5:
         run.pop("room_twist", None)
         return None
@@ -606,12 +1325,12 @@ def maybe_roll_room_twist(state: Dict[str, Any], room_type: str) -> Optional[Dic
 # ---- бой ----
 
 def apply_relics_on_combat_start(run: Dict[str, Any], combat: Dict[str, Any]) -> None:
-    p = combat.get("player", {})
+    p = combat["player"]
     if has_relic(run, "STARTER_SEAL"):
-        p["mana_max"] += 1
-        p["mana"] += 1
+        p.mana_max += 1
+        p.mana += 1
     if has_relic(run, "BLOOD_VIAL"):
-        p["hp"] = min(int(p.get("max_hp", 0)), int(p.get("hp", 0)) + 5)
+        p.hp = min(p.max_hp, p.hp + 5)
         log(combat, "Сосуд крови: лечение +5 HP.")
     if has_relic(run, "ECHO_CORE"):
         log(combat, "Ядро эха: награда даст +1 выбор карты.")
@@ -620,6 +1339,7 @@ def apply_relics_on_combat_start(run: Dict[str, Any], combat: Dict[str, Any]) ->
 
 
 def start_combat(state: Dict[str, Any], room_type: str) -> None:
+    adopt_state(state)
     run = state["run"]
     rng = seeded_rng(run)
 
@@ -631,7 +1351,7 @@ def start_combat(state: Dict[str, Any], room_type: str) -> None:
         room_type = "boss"
 
     # Выберем врагов
-    enemies: List[Dict[str, Any]] = []
+    enemies: List[Enemy] = []
     if room_type == "boss":
         boss_tmpl = content.BOSSES[act-1]
         enemies = [instantiate_enemy(boss_tmpl, rng, scale)]
@@ -649,25 +1369,11 @@ def start_combat(state: Dict[str, Any], room_type: str) -> None:
         enemies = [instantiate_enemy(rng.choice(pool), rng, scale) for _ in range(n)]
 
     # Состояние игрока в бою
-    player = {
-        "name": "Игрок",
-        "hp": int(run["hp"]),
-        "max_hp": int(run["max_hp"]),
-        "block": 0,
-        "mana_max": 3,
-        "mana": 3,
-        "statuses": {},
-        "buffs": {},   # бафы «до конца боя»
-        "crit": content.CRIT_BASE_CHANCE,
-    }
+    # бафы игрока — «до конца боя»
+    player = Player(int(run["hp"]), int(run["max_hp"]))
 
-    # Скопируем колоду в боевой экземпляр
-    draw_pile = []
-    for ci in run["deck"]:
-        inst = deep(ci)
-        inst["charge"] = 0
-        inst["temp_cost_mod"] = 0
-        draw_pile.append(inst)
+    # Боевые карты — оверлеи над колодой: charge/temp_cost_mod появятся в них по мере записи
+    draw_pile = Pile(CombatCard(ci) for ci in run["deck"])
 
     rng.shuffle(draw_pile)
 
@@ -675,13 +1381,13 @@ def start_combat(state: Dict[str, Any], room_type: str) -> None:
         "turn": 1,
         "phase": "player",
         "player": player,
-        "enemies": enemies,
+        "enemies": Roster(enemies),
         "draw_pile": draw_pile,
-        "discard_pile": [],
-        "exhaust_pile": [],
-        "hand": [],
+        "discard_pile": Pile(),
+        "exhaust_pile": Pile(),
+        "hand": Pile(),
         "pending": None,
-        "log": [],
+        "log": CombatLog(),
     }
 
     apply_relics_on_combat_start(run, combat)
@@ -700,41 +1406,30 @@ def start_combat(state: Dict[str, Any], room_type: str) -> None:
             status_add(player, "poison", stacks, combat=combat, source=twist["name"])
             for e in combat["enemies"]:
                 status_add(e, "poison", stacks, combat=combat, source=twist["name"])
-            log(combat, f"{twist['name']}: все получают {stacks} Яда.")
+            log(combat, "{}: все получают {} Яда.", twist["name"], stacks)
         if twist.get("start_reflect"):
-            add_buff(player, "reflect_half_1turn")
-            log(combat, f"{twist['name']}: твоё первое попадание отражает урон.")
+            add_buff(player, "reflect_half_1turn", combat=combat)
+            log(combat, "{}: твоё первое попадание отражает урон.", twist["name"])
 
-    log(combat, f"Этаж {run['floor']}, акт {run['act']}. В бой!")
+    log(combat, "Этаж {}, акт {}. В бой!", run["floor"], run["act"])
     run["combat"] = combat
     state["screen"] = "COMBAT"
     state["updated_at"] = now_ts()
 
-def instantiate_enemy(tmpl: Dict[str, Any], rng: random.Random, scale: float) -> Dict[str, Any]:
+def instantiate_enemy(tmpl: Dict[str, Any], rng: random.Random, scale: float) -> Enemy:
     hp = int(round(tmpl["max_hp"] * scale))
     hp = max(10, hp)
-    e = {
-        "id": tmpl["id"],
-        "name": tmpl["name"],
-        "hp": hp,
-        "max_hp": hp,
-        "block": 0,
-        "statuses": {},
-        "buffs": {},
-        "vars": {"phase": tmpl.get("phase", "base"), "status_bonus": {}},
-        "status_immunities": list(tmpl.get("immune_to", [])),
-        "tier": int(tmpl.get("tier", 1)),
-        "moves": deep(tmpl["moves"]),
-        "intent": None,
-        "last_move": None,
-    }
-    return e
+    # ходы берутся из общей MOVE_TABLES по id шаблона; копия — только если таблицы нет
+    moves = deep(tmpl["moves"]) if tmpl["id"] not in MOVE_TABLES else None
+    return Enemy(tmpl["id"], tmpl["name"], hp, hp,
+                 vars={"phase": tmpl.get("phase", "base"), "status_bonus": {}},
+                 status_immunities=tmpl.get("immune_to", ()), tier=int(tmpl.get("tier", 1)), moves=moves)
 
 
-def move_available(enemy: Dict[str, Any], move: Dict[str, Any]) -> bool:
-    phase = enemy.get("vars", {}).get("phase", "base")
-    hp = float(enemy.get("hp", 0))
-    hp_pct = hp / float(enemy.get("max_hp", 1)) if enemy.get("max_hp") else 1.0
+def move_available(enemy: Enemy, move: Dict[str, Any]) -> bool:
+    phase = enemy.vars.get("phase", "base")
+    hp = float(enemy.hp)
+    hp_pct = hp / float(enemy.max_hp) if enemy.max_hp else 1.0
     req = move.get("requires", {}) or {}
     if move.get("threshold") is not None and hp_pct > float(move.get("threshold", 1.0)):
         return False
@@ -749,8 +1444,32 @@ def move_available(enemy: Dict[str, Any], move: Dict[str, Any]) -> bool:
     return True
 
 
-def choose_intent(enemy: Dict[str, Any], rng: random.Random):
-    moves = enemy.get("moves", [])
+def choose_intent(enemy: Enemy, rng: random.Random):
+    table = None if enemy.moves is not None else MOVE_TABLES.get(enemy.id)
+    if table is None:
+        _choose_intent_inline(enemy, rng)
+        return
+    max_hp = enemy.max_hp
+    pct = float(enemy.hp) / float(max_hp) if max_hp else 1.0
+    avail = table.available(enemy.vars.get("phase", "base"), pct)
+    last = table.index.get(enemy.last_move) if enemy.last_move else None
+    i = table.sample(avail, last if last in avail else None, rng)
+    enemy.next_move = None
+    enemy.intent = table.intents[i]
+    enemy.next = table.moves[i]["id"]
+
+def enemy_next_move(enemy: Enemy) -> Optional[Dict[str, Any]]:
+    """Ход, выбранный choose_intent: из таблицы шаблона или (старые сейвы) из самого врага."""
+    move = enemy.next_move
+    if move is None and enemy.next is not None:
+        table = MOVE_TABLES.get(enemy.id)
+        i = table.index.get(enemy.next) if table else None
+        move = table.moves[i] if i is not None else None
+    return move
+
+def _choose_intent_inline(enemy: Enemy, rng: random.Random):
+    # враги с собственным списком "moves" (сейвы до таблиц ходов, самодельные враги в тестах)
+    moves = enemy.moves or []
     available = [m for m in moves if move_available(enemy, m)]
     if not available:
         available = moves
@@ -758,7 +1477,7 @@ def choose_intent(enemy: Dict[str, Any], rng: random.Random):
     weighted = []
     for m in available:
         w = int(m.get("w", 1))
-        if enemy.get("last_move") and enemy["last_move"] == m.get("id"):
+        if enemy.last_move and enemy.last_move == m.get("id"):
             w = max(1, w // 2)
         weighted.append({"m": m, "w": w})
     total = sum(x["w"] for x in weighted)
@@ -770,8 +1489,8 @@ def choose_intent(enemy: Dict[str, Any], rng: random.Random):
         if r <= acc:
             pick = x["m"]
             break
-    enemy["intent"] = summarize_move(pick)
-    enemy["next_move"] = pick
+    enemy.intent = summarize_move(pick)
+    enemy.next_move = pick
 
 def summarize_move(move: Dict[str, Any]) -> Dict[str, Any]:
     t = move.get("type")
@@ -795,6 +1514,105 @@ def summarize_move(move: Dict[str, Any]) -> Dict[str, Any]:
         return {"type":"weird","name":move["name"],"desc":move.get("desc","")}
     return {"type":"weird","name":move.get("name","?")}
 
+# ---- таблицы ходов врагов ----
+# Собираются при загрузке контента, по одной на шаблон: замороженные ходы, готовые сводки
+# намерений и alias-таблицы (метод Уолкера/Воуза) для каждого набора доступных ходов —
+# с обычными весами и с ополовиненным весом последнего хода. Бросок намерения —
+# одно rng.random() и O(1) выбор вместо списка кандидатов и линейного прохода по весам.
+# Враг хранит только id шаблона и id следующего хода ("next").
+
+class MoveTable:
+    __slots__ = ("tid", "moves", "intents", "index", "_rows", "_alias")
+
+    def __init__(self, tmpl: Dict[str, Any]):
+        self.tid = tmpl["id"]
+        self.moves = tuple(content.freeze(m) for m in tmpl["moves"])
+        self.intents = tuple(content.freeze(summarize_move(m)) for m in self.moves)
+        self.index = {m["id"]: i for i, m in enumerate(self.moves)}
+        self._rows: Dict[str, tuple] = {}
+        self._alias: Dict[tuple, tuple] = {}
+        phases = {tmpl.get("phase", "base"), "base"} | {m["set_phase"] for m in self.moves if m.get("set_phase")}
+        cuts = {0.0, 1.0}
+        for m in self.moves:
+            for c in (m.get("threshold"), (m.get("requires") or {}).get("hp_pct_below")):
+                if c is not None:
+                    cuts |= {float(c), math.nextafter(float(c), -1.0), math.nextafter(float(c), 2.0)}
+        # все наборы, достижимые по фазе и порогам HP, — сразу с обеими версиями весов
+        for ph in phases:
+            for pct in cuts:
+                avail = self.available(ph, pct)
+                for last in (None,) + avail:
+                    self._alias_for(avail, last)
+
+    def _rows_for(self, phase: str) -> tuple:
+        # статическая часть move_available: фазовые условия; пороги HP остаются на бросок
+        rows = []
+        for i, m in enumerate(self.moves):
+            req = m.get("requires") or {}
+            if m.get("set_phase") and phase == m["set_phase"]:
+                continue
+            if req.get("phase_is") and phase != req["phase_is"]:
+                continue
+            if req.get("phase_not") and phase == req["phase_not"]:
+                continue
+            thr = float(m["threshold"]) if m.get("threshold") is not None else None
+            below = float(req["hp_pct_below"]) if req.get("hp_pct_below") is not None else None
+            rows.append((i, thr, below))
+        return tuple(rows)
+
+    def available(self, phase: str, pct: float) -> tuple:
+        rows = self._rows.get(phase)
+        if rows is None:
+            rows = self._rows[phase] = self._rows_for(phase)
+        avail = tuple(i for i, thr, below in rows
+                      if (thr is None or pct <= thr) and (below is None or pct < below))
+        return avail or tuple(range(len(self.moves)))
+
+    def _alias_for(self, avail: tuple, last: Optional[int]) -> tuple:
+        key = (avail, last)
+        t = self._alias.get(key)
+        if t is None:
+            w = []
+            for i in avail:
+                wi = int(self.moves[i].get("w", 1))
+                w.append(max(1, wi // 2) if i == last else wi)
+            t = self._alias[key] = _alias_table(w)
+        return t
+
+    def sample(self, avail: tuple, last: Optional[int], rng: random.Random) -> int:
+        prob, alias = self._alias_for(avail, last)
+        u = rng.random() * len(avail)
+        k = int(u)
+        return avail[k] if u - k < prob[k] else avail[alias[k]]
+
+
+def _alias_table(weights: List[int]) -> Tuple[tuple, tuple]:
+    n = len(weights)
+    total = sum(weights)
+    if total <= 0:
+        # как и раньше при нулевой сумме — первый ход
+        return (1.0,) + (0.0,) * (n - 1), (0,) * n
+    scaled = [w * n / total for w in weights]
+    prob, alias = [1.0] * n, list(range(n))
+    small = [i for i, x in enumerate(scaled) if x < 1.0]
+    large = [i for i, x in enumerate(scaled) if x >= 1.0]
+    while small and large:
+        lo, hi = small.pop(), large.pop()
+        prob[lo], alias[lo] = scaled[lo], hi
+        scaled[hi] += scaled[lo] - 1.0
+        (small if scaled[hi] < 1.0 else large).append(hi)
+    return tuple(prob), tuple(alias)
+
+
+MOVE_TABLES: Dict[str, MoveTable] = {}
+
+def compile_move_tables() -> None:
+    MOVE_TABLES.clear()
+    for tmpl in content.ENEMIES + content.ELITES + content.BOSSES:
+        # ход без id не сослаться из сейва — такой шаблон живёт по-старому, с копией moves
+        if all(m.get("id") for m in tmpl["moves"]):
+            MOVE_TABLES[tmpl["id"]] = MoveTable(tmpl)
+
 def draw_to_hand(combat: Dict[str, Any], n: int, rng: random.Random):
     for _ in range(n):
         if len(combat["hand"]) >= 6:
@@ -803,7 +1621,7 @@ def draw_to_hand(combat: Dict[str, Any], n: int, rng: random.Random):
             # мешаем сброс в колоду
             if combat["discard_pile"]:
                 combat["draw_pile"] = combat["discard_pile"]
-                combat["discard_pile"] = []
+                combat["discard_pile"] = Pile()
                 rng.shuffle(combat["draw_pile"])
                 log(combat, "Перетасовка сброса в колоду.")
             else:
@@ -813,16 +1631,10 @@ def draw_to_hand(combat: Dict[str, Any], n: int, rng: random.Random):
         combat["hand"].append(inst)
 
 def find_hand_card(combat: Dict[str, Any], uid: str) -> Optional[Dict[str, Any]]:
-    for c in combat.get("hand", []):
-        if c.get("uid") == uid:
-            return c
-    return None
+    return find_card(combat.get("hand", []), uid)
 
 def remove_hand_card(combat: Dict[str, Any], uid: str) -> Optional[Dict[str, Any]]:
-    for i, c in enumerate(combat.get("hand", [])):
-        if c.get("uid") == uid:
-            return combat["hand"].pop(i)
-    return None
+    return take_card(combat.get("hand", []), uid)
 
 def enemy_by_index(combat: Dict[str, Any], idx: int) -> Optional[Dict[str, Any]]:
     enemies = combat.get("enemies", [])
@@ -832,93 +1644,100 @@ def enemy_by_index(combat: Dict[str, Any], idx: int) -> Optional[Dict[str, Any]]
 
 # ---- применение урона/блока ----
 
-def compute_damage(attacker: Dict[str, Any], defender: Dict[str, Any], base: int) -> int:
+def compute_damage(attacker: Combatant, defender: Combatant, base: int) -> int:
     dmg = float(base)
+    st = attacker.statuses
     # weak на атакующем
-    if status_get(attacker, "weak") > 0:
+    if st.weak > 0:
         dmg *= 0.75
     # freeze на атакующем: тоже -25%
-    if status_get(attacker, "freeze") > 0:
+    if st.freeze > 0:
         dmg *= 0.75
     # vulnerable на защищающемся
-    if status_get(defender, "vulnerable") > 0:
+    if defender.statuses.vulnerable > 0:
         dmg *= 1.25
     return max(0, int(round(dmg)))
 
-def deal_damage(combat: Dict[str, Any], attacker: Dict[str, Any], defender: Dict[str, Any], amount: int, *, allow_crit: bool=True, source: str="") -> Tuple[int,bool]:
+def _deal_damage(combat: Dict[str, Any], attacker: Combatant, defender: Combatant, amount: int, *, allow_crit: bool=True, source: str="") -> Tuple[int,bool]:
     rng = combat.get("_rng")
     if rng is None:
         rng = random.Random(0)
+    player = combat["player"]
     dmg = int(amount)
     is_crit = False
-    if allow_crit and attacker is combat.get("player"):
+    if allow_crit and attacker is player:
         cc = crit_chance(attacker)
         if rng.random() < cc:
             is_crit = True
             dmg = int(round(dmg * crit_mult(attacker)))
 
     # фазы/бафы врагов
-    bonus_mult = float(attacker.get("vars", {}).get("dmg_mult", 1.0))
+    bonus_mult = float(attacker.vars.get("dmg_mult", 1.0))
     if bonus_mult != 1.0:
         dmg = int(round(dmg * bonus_mult))
     overdrive_active = False
-    charge = buff_count(attacker, "arcane_charge")
-    if charge:
-        dmg = int(round(dmg * 1.15))
-        consume_buff(attacker, "arcane_charge", 1)
-    overdrive = buff_count(attacker, "arcane_overdrive")
-    if overdrive:
-        overdrive_active = True
-        dmg = int(round(dmg * (1.10 + 0.05 * overdrive)))
+    buffs = attacker.buffs
+    if buffs:
+        if buffs.get("arcane_charge"):
+            dmg = int(round(dmg * 1.15))
+            consume_buff(attacker, "arcane_charge", 1, combat=combat)
+        overdrive = buffs.get("arcane_overdrive", 0)
+        if overdrive:
+            overdrive_active = True
+            dmg = int(round(dmg * (1.10 + 0.05 * overdrive)))
 
     incoming = compute_damage(attacker, defender, dmg)
     dmg = incoming
 
     # блок
-    block = int(defender.get("block", 0))
+    block = defender.block
     pierce = 0.25 if overdrive_active else 0.0
     effective_block = int(math.floor(block * (1 - pierce)))
     taken = max(0, dmg - effective_block)
-    defender["block"] = max(0, block - dmg)
-    defender["hp"] = max(0, int(defender.get("hp", 0)) - taken)
+    defender.block = max(0, block - dmg)
+    defender.hp = max(0, defender.hp - taken)
 
     # thorns
-    th = status_get(defender, "thorns")
+    th = defender.statuses.thorns
     if th > 0 and taken > 0 and attacker is not defender:
-        attacker["hp"] = max(0, int(attacker.get("hp", 0)) - th)
-        log(combat, f"Шипы: {th} урона в ответ.")
+        attacker.hp = max(0, attacker.hp - th)
+        log(combat, "Шипы: {} урона в ответ.", th)
 
     # отражение (только на игроке)
-    if defender is combat.get("player"):
+    if defender is player:
         half_reflect = buff_count(defender, "reflect_half_1turn")
         full_reflect = buff_count(defender, "reflect_full_1turn")
         if (half_reflect or full_reflect) and incoming > 0:
             mult = 1.0 if full_reflect else 0.5 * half_reflect
             reflect = int(math.floor(incoming * mult))
             if attacker is not defender and reflect > 0:
-                attacker["hp"] = max(0, int(attacker.get("hp", 0)) - reflect)
-                log(combat, f"Зеркальная защита отражает {reflect} урона.")
+                attacker.hp = max(0, attacker.hp - reflect)
+                log(combat, "Зеркальная защита отражает {} урона.", reflect)
 
     if source:
-        log(combat, f"{source}: {dmg}{' (КРИТ!)' if is_crit else ''}")
+        log(combat, "{}: {}{}", source, dmg, " (КРИТ!)" if is_crit else "")
 
     # телеграфируемая контратака (у врагов)
-    if defender is not combat.get("player") and attacker is combat.get("player"):
-        counter = defender.get("vars", {}).pop("counter_ready", None)
-        if counter and defender.get("hp", 0) > 0:
+    if defender is not player and attacker is player:
+        counter = defender.vars.pop("counter_ready", None) if defender.vars else None
+        if counter and defender.alive:
             counter_name = counter.get("name", "Контратака")
             c_dmg = int(counter.get("dmg", 0))
             if c_dmg > 0:
-                deal_damage(combat, defender, attacker, c_dmg, allow_crit=False, source=f"{defender.get('name','Враг')} — {counter_name}")
+                _deal_damage(combat, defender, attacker, c_dmg, allow_crit=False, source=f"{defender.name or 'Враг'} — {counter_name}")
             c_status = counter.get("status")
             c_stacks = int(counter.get("stacks", 0))
             if c_status and c_stacks:
                 status_add(attacker, c_status, c_stacks, combat=combat, source=counter_name)
-            log(combat, f"{defender.get('name','Враг')} отвечает: {counter_name}.")
+            log(combat, "{} отвечает: {}.", defender.name or "Враг", counter_name)
     return taken, is_crit
 
+# снаружи (тесты, скрипты) можно звать с игроком/врагами-dict'ами; внутри движка — _deal_damage
+deal_damage = _accepts_plain(None)(_deal_damage)
+
 # ---- эффекты карт ----
 
+@_accepts_plain()
 def play_card(state: Dict[str, Any], card_uid: str, target: Optional[int]) -> None:
     run = state["run"]
     combat = run.get("combat")
@@ -940,7 +1759,8 @@ def play_card(state: Dict[str, Any], card_uid: str, target: Optional[int]) -> No
         log(combat, "Проклятья не разыграть — их нужно переждать или убрать.")
         return
     cost = card_cost(cdef, inst)
-    if combat["player"]["mana"] < cost:
+    p = combat["player"]
+    if p.mana < cost:
         log(combat, "Недостаточно маны.")
         return
 
@@ -951,27 +1771,27 @@ def play_card(state: Dict[str, Any], card_uid: str, target: Optional[int]) -> No
             log(combat, "Нужна цель.")
             return
         tgt = enemy_by_index(combat, int(target))
-        if not tgt or tgt["hp"] <= 0:
+        if not tgt or not tgt.alive:
             log(combat, "Цель недоступна.")
             return
     elif cdef["target"] == "all_enemies":
         tgt = None
     elif cdef["target"] == "self":
-        tgt = combat["player"]
+        tgt = p
     else:
         tgt = None
 
     # платим ману
-    combat["player"]["mana"] -= cost
+    p.mana -= cost
 
     # разыгрываем
     remove_hand_card(combat, card_uid)
 
     # хук: bounce_next (вернуть следующую сыгранную карту)
     bounced = False
-    if buff_count(combat["player"], "bounce_next"):
+    if buff_count(p, "bounce_next"):
         # этот баф потребляется, а карта вернётся в руку (кроме exhaust/upgrade)
-        consume_buff(combat["player"], "bounce_next", 1)
+        consume_buff(p, "bounce_next", 1, combat=combat)
         bounced = True
 
     # применим эффекты
@@ -992,228 +1812,624 @@ def play_card(state: Dict[str, Any], card_uid: str, target: Optional[int]) -> No
             combat["discard_pile"].append(inst)
 
     # проверка победы
-    if all(e["hp"] <= 0 for e in combat["enemies"]):
+    if not combat["enemies"].alive:
         win_combat(state)
         return
 
     state["updated_at"] = now_ts()
 
-def resolve_card_effects(state: Dict[str, Any], combat: Dict[str, Any], inst: Dict[str, Any], cdef: Dict[str, Any], target_ent: Optional[Dict[str, Any]]):
-    p = combat["player"]
-    enemies = combat["enemies"]
+# ---- компиляция эффектов карт ----
+# DSL эффектов (content.CARDS -> effects/effects_up) один раз превращается в список
+# готовых шагов-замыканий: поля разобраны и проверены заранее, на розыгрыше — только вызовы.
+# Все op живут в одном реестре EFFECT_OPS: и карта целиком, и вложенные then/on_crit/combo/
+# choose_one/«после сброса» видят один и тот же набор.
 
-    # Особые эффекты: choose_one — фронту нужно выбрать
-    for eff in cdef.get("effects", []):
-        if eff.get("op") == "choose_one":
-            combat["pending"] = {
-                "type": "choose_one",
-                "card_uid": inst["uid"],
-                "options": eff.get("options", []),
-            }
-            log(combat, "Выбери эффект карты.")
-            return
+class EffectCompileError(ValueError):
+    pass
 
-    for idx, eff in enumerate(cdef.get("effects", [])):
-        op = eff.get("op")
-        if op == "damage":
-            amt = eff.get("amount", 0)
-            base = 0
-            if isinstance(amt, dict) and amt.get("plus_charge"):
-                base = int(amt.get("base", 0)) + int(inst.get("charge", 0))
-            else:
-                base = int(amt)
-            no_crit = bool(eff.get("no_crit", False))
-            taken, was_crit = deal_damage(combat, p, target_ent, base, allow_crit=not no_crit, source=cdef["name"])
-            # on_crit
-            if was_crit and eff.get("on_crit"):
-                resolve_effect_list(state, combat, eff["on_crit"], p, target_ent)
-            # buff: burn_on_hit
-            if target_ent:
-                burn_boost = buff_count(p, "burn_on_hit")
-                burn_boost_2 = buff_count(p, "burn_on_hit_2")
-                burn_total = burn_boost + (2 * burn_boost_2)
-                if burn_total:
-                    status_add(target_ent, "burn", burn_total, combat=combat, source=cdef["name"])
-            # echo_attack_half consumes once
-            if target_ent:
-                echo_stacks = buff_count(p, "echo_attack_half")
-                if echo_stacks:
-                    consume_buff(p, "echo_attack_half", echo_stacks)
-                    half = int(math.floor(base * 0.5))
-                    for _ in range(echo_stacks):
-                        deal_damage(combat, p, target_ent, half, allow_crit=False, source=cdef["name"]+" (эхо)")
-        elif op == "aoe_damage":
-            base = int(eff.get("amount", 0))
-            bonus = 0
-            bonus_if = eff.get("bonus_if_has_any_status")
-            if bonus_if:
-                # бонус к каждому врагу индивидуально
-                for e in enemies:
-                    if e["hp"] <= 0: 
-                        continue
-                    dmg = base
-                    if any(status_get(e, s) > 0 for s in bonus_if):
-                        dmg += int(eff.get("bonus", 0))
-                    deal_damage(combat, p, e, dmg, allow_crit=True, source=cdef["name"])
-            else:
-                for e in enemies:
-                    if e["hp"] > 0:
-                        deal_damage(combat, p, e, base, allow_crit=True, source=cdef["name"])
-        elif op == "block":
-            p["block"] = int(p.get("block", 0)) + int(eff.get("amount", 0))
-            log(combat, f"{cdef['name']}: +{eff.get('amount',0)} Блока.")
-        elif op == "apply":
-            status = eff.get("status")
-            stacks = int(eff.get("stacks", 0))
-            to = eff.get("to", "enemy")
-            if to == "enemy":
-                if target_ent: status_add(target_ent, status, stacks, combat=combat, source=cdef["name"])
-            elif to == "all_enemies":
-                for e in enemies:
-                    if e["hp"] > 0: status_add(e, status, stacks, combat=combat, source=cdef["name"])
-            elif to == "self":
-                status_add(p, status, stacks, combat=combat, source=cdef["name"])
-            log(combat, f"{cdef['name']}: {content.STATUSES.get(status,{}).get('name',status)} +{stacks}.")
-        elif op == "draw":
-            draw_to_hand(combat, n=int(eff.get("n", 1)), rng=combat["_rng"])
-            log(combat, f"{cdef['name']}: добор {eff.get('n',1)}.")
-        elif op == "gain_mana":
-            p["mana"] = int(p.get("mana", 0)) + int(eff.get("n", 1))
-            log(combat, f"{cdef['name']}: +{eff.get('n',1)} маны.")
-        elif op == "gain_max_mana":
-            n = int(eff.get("n", 1))
-            dur = eff.get("duration", "combat")
-            if dur == "combat":
-                p["mana_max"] = int(p.get("mana_max", 0)) + n
-                p["mana"] = int(p.get("mana", 0)) + n
-                log(combat, f"{cdef['name']}: +{n} макс.маны (бой).")
-        elif op == "heal":
-            amt = int(eff.get("amount", 0))
-            p["hp"] = min(int(p["max_hp"]), int(p["hp"]) + amt)
-            log(combat, f"{cdef['name']}: +{amt} HP.")
-        elif op == "lose_hp":
-            amt = int(eff.get("amount", 0))
-            p["hp"] = max(0, int(p["hp"]) - amt)
-            log(combat, f"{cdef['name']}: -{amt} HP.")
-        elif op == "heal_per_enemy":
-            amt = int(eff.get("amount", 0))
-            alive = sum(1 for e in enemies if e["hp"] > 0)
-            heal = amt * alive
-            p["hp"] = min(int(p["max_hp"]), int(p["hp"]) + heal)
-            log(combat, f"{cdef['name']}: +{heal} HP.")
-        elif op == "discard_choose":
-            after = cdef.get("effects", [])[idx+1:]
-            target_idx = None
-            if target_ent and target_ent in enemies:
-                try:
-                    target_idx = enemies.index(target_ent)
-                except ValueError:
-                    target_idx = None
-            combat["pending"] = {
-                "type":"discard_choose",
-                "n":int(eff.get("n",1)),
-                "after_effects": after,
-                "target_idx": target_idx,
-            }
-            log(combat, "Выбери карты для сброса.")
-            return
-        elif op == "discard_random":
-            n = int(eff.get("n", 1))
-            do_discard_random(combat, n=n)
-            log(combat, f"{cdef['name']}: случайный сброс {n}.")
-        elif op == "take_from_discard":
-            combat["pending"] = {"type":"take_from_discard","n":int(eff.get("n",1)),
-                                 "reduce_cost": int(eff.get("reduce_cost",0))}
-            log(combat, "Выбери карту из сброса.")
+
+class EffectContext:
+    """Всё, что нужно шагу программы: где играем, кем, по кому и от чьего имени пишем в лог."""
+    __slots__ = ("state", "combat", "p", "enemies", "inst", "cdef", "target", "source")
+
+    def __init__(self, state, combat, p, inst, cdef, target, source):
+        self.state = state
+        self.combat = combat
+        self.p = p
+        self.enemies = combat.get("enemies", [])
+        self.inst = inst
+        self.cdef = cdef
+        self.target = target
+        self.source = source
+
+
+# шаг программы: вернёт True, если программа должна остановиться (ждём выбор игрока)
+EffectStep = Callable[[EffectContext], Optional[bool]]
+EffectProgram = Tuple[EffectStep, ...]
+# компилятор op: (эффект, весь список, индекс эффекта в нём, список ошибок) -> шаг
+EffectCompiler = Callable[[Dict[str, Any], List[dict], int, Optional[List[str]]], EffectStep]
+
+EFFECT_OPS: Dict[str, EffectCompiler] = {}
+# id(замороженного списка эффектов) -> (список, программа): общие описания карт живут вечно
+_PROGRAM_CACHE: Dict[int, Tuple[Any, EffectProgram]] = {}
+
+_APPLY_TARGETS = ("enemy", "all_enemies", "self")
+
+
+def register_effect_op(op: str, compiler: EffectCompiler, *, replace: bool = False) -> None:
+    """Зарегистрировать op эффекта (например, из контент-пака).
+
+    Уже скомпилированные программы сбрасываются, чтобы подхватить новый обработчик.
+    """
+    if op in EFFECT_OPS and not replace:
+        raise ValueError(f"op {op!r} уже зарегистрирован")
+    EFFECT_OPS[op] = compiler
+    _PROGRAM_CACHE.clear()
+
+
+def effect_op(op: str):
+    def deco(compiler: EffectCompiler) -> EffectCompiler:
+        register_effect_op(op, compiler)
+        return compiler
+    return deco
+
+
+def run_effects(program: EffectProgram, ctx: EffectContext) -> bool:
+    for step in program:
+        if step(ctx):
+            return True
+    return False
+
+
+def _check_status(status: Any) -> str:
+    if status not in content.STATUSES:
+        raise ValueError(f"неизвестный статус {status!r}")
+    return status
+
+
+def _check_buff(buff: Any) -> str:
+    if buff not in content.BUFFS:
+        raise ValueError(f"неизвестный баф {buff!r}")
+    return buff
+
+
+@effect_op("damage")
+def _op_damage(eff, effects, idx, errors):
+    amt = eff.get("amount", 0)
+    if isinstance(amt, dict) and amt.get("plus_charge"):
+        fixed, plus_charge = int(amt.get("base", 0)), True
+    else:
+        fixed, plus_charge = int(amt), False
+    allow_crit = not bool(eff.get("no_crit", False))
+    on_crit = compile_effects(eff["on_crit"], errors=errors) if eff.get("on_crit") else ()
+
+    def step(ctx):
+        p, tgt, name = ctx.p, ctx.target, ctx.source
+        if not tgt:
             return
-        elif op == "add_buff":
-            buff = eff.get("buff")
-            add_buff(p, buff)
-            log(combat, f"{cdef['name']}: баф «{content.BUFFS.get(buff,{}).get('name',buff)}».")
-            # некоторые бафы сразу меняют параметры
-            if buff in ("battery","battery_plus"):
-                inc = 2 if buff=="battery" else 3
-                p["mana_max"] += inc
-                p["mana"] += inc
-        elif op == "if_hand_has_tag":
-            tag = eff.get("tag")
-            if any(tag in content.get_card_def(ci["id"], bool(ci.get("up"))).get("tags", []) for ci in combat["hand"]):
-                resolve_effect_list(state, combat, eff.get("then", []), p, target_ent)
-        elif op == "if_enemy_hp_below":
-            if target_ent and target_ent["max_hp"] > 0:
-                if (target_ent["hp"] / target_ent["max_hp"]) < float(eff.get("pct", 0.5)):
-                    resolve_effect_list(state, combat, eff.get("then", []), p, target_ent)
-        elif op == "dot_detach_explode":
-            if not target_ent: 
+        base = fixed
+        if plus_charge and ctx.inst:
+            base += int(ctx.inst.get("charge", 0))
+        taken, was_crit = _deal_damage(ctx.combat, p, tgt, base, allow_crit=allow_crit, source=name)
+        # on_crit
+        if was_crit and on_crit and run_effects(on_crit, ctx):
+            return True
+        # on_attack_hit бафы: ожог и эхо (эхо расходуется целиком)
+        hit = {"burn": 0, "echo": 0}
+        fire_buff_hook(ctx.combat, "on_attack_hit", hit)
+        if hit["burn"]:
+            status_add(tgt, "burn", hit["burn"], combat=ctx.combat, source=name)
+        echo_stacks = hit["echo"]
+        if echo_stacks:
+            consume_buff(p, "echo_attack_half", echo_stacks, combat=ctx.combat)
+            half = int(math.floor(base * 0.5))
+            for _ in range(echo_stacks):
+                _deal_damage(ctx.combat, p, tgt, half, allow_crit=False, source=name + " (эхо)")
+    return step
+
+
+@effect_op("aoe_damage")
+def _op_aoe_damage(eff, effects, idx, errors):
+    base = int(eff.get("amount", 0))
+    bonus_if = [_check_status(s) for s in eff.get("bonus_if_has_any_status") or []]
+    bonus = int(eff.get("bonus", 0))
+
+    def step(ctx):
+        for e in ctx.enemies:
+            if not e.alive:
                 continue
-            statuses = eff.get("statuses", [])
-            mult = float(eff.get("mult", 1.0))
-            total = 0
-            for s in statuses:
-                total += status_get(target_ent, s)
-                status_set(target_ent, s, 0)
-            dmg = int(round(total * mult))
-            if dmg > 0:
-                deal_damage(combat, p, target_ent, dmg, allow_crit=False, source=cdef["name"])
-        elif op == "combo":
-            for step in eff.get("steps", []):
-                # reuse resolve_effect_list
-                resolve_effect_list(state, combat, [step], p, target_ent)
+            dmg = base
+            # бонус к каждому врагу индивидуально
+            if bonus_if and any(status_get(e, s) > 0 for s in bonus_if):
+                dmg += bonus
+            _deal_damage(ctx.combat, ctx.p, e, dmg, allow_crit=True, source=ctx.source)
+    return step
+
+
+@effect_op("block")
+def _op_block(eff, effects, idx, errors):
+    amount = int(eff.get("amount", 0))
+
+    def step(ctx):
+        ctx.p.block += amount
+        log(ctx.combat, "{}: +{} Блока.", ctx.source, amount)
+    return step
+
+
+@effect_op("apply")
+def _op_apply(eff, effects, idx, errors):
+    status = _check_status(eff.get("status"))
+    stacks = int(eff.get("stacks", 0))
+    to = eff.get("to", "enemy")
+    if to not in _APPLY_TARGETS:
+        raise ValueError(f"неизвестная цель {to!r}")
+    status_name = content.STATUSES[status]["name"]
+
+    def step(ctx):
+        name = ctx.source
+        if to == "enemy":
+            if ctx.target:
+                status_add(ctx.target, status, stacks, combat=ctx.combat, source=name)
+        elif to == "all_enemies":
+            for e in ctx.enemies:
+                if e.alive:
+                    status_add(e, status, stacks, combat=ctx.combat, source=name)
         else:
-            # неизвестное — пропускаем (архитектура расширяемая)
-            pass
-
-def resolve_effect_list(state: Dict[str, Any], combat: Dict[str, Any], effects: List[dict], p: Dict[str, Any], target_ent: Optional[Dict[str, Any]]):
-    # Мини-исполнитель эффектов для вложенных then/on_crit и т.п.
+            status_add(ctx.p, status, stacks, combat=ctx.combat, source=name)
+        log(ctx.combat, "{}: {} +{}.", name, status_name, stacks)
+    return step
+
+
+@effect_op("draw")
+def _op_draw(eff, effects, idx, errors):
+    n = int(eff.get("n", 1))
+
+    def step(ctx):
+        draw_to_hand(ctx.combat, n=n, rng=ctx.combat["_rng"])
+        log(ctx.combat, "{}: добор {}.", ctx.source, n)
+    return step
+
+
+@effect_op("gain_mana")
+def _op_gain_mana(eff, effects, idx, errors):
+    n = int(eff.get("n", 1))
+
+    def step(ctx):
+        ctx.p.mana += n
+        log(ctx.combat, "{}: +{} маны.", ctx.source, n)
+    return step
+
+
+@effect_op("gain_max_mana")
+def _op_gain_max_mana(eff, effects, idx, errors):
+    n = int(eff.get("n", 1))
+    dur = eff.get("duration", "combat")
+
+    def step(ctx):
+        if dur == "combat":
+            p = ctx.p
+            p.mana_max += n
+            p.mana += n
+            log(ctx.combat, "{}: +{} макс.маны (бой).", ctx.source, n)
+    return step
+
+
+@effect_op("heal")
+def _op_heal(eff, effects, idx, errors):
+    amt = int(eff.get("amount", 0))
+
+    def step(ctx):
+        p = ctx.p
+        p.hp = min(p.max_hp, p.hp + amt)
+        log(ctx.combat, "{}: +{} HP.", ctx.source, amt)
+    return step
+
+
+@effect_op("lose_hp")
+def _op_lose_hp(eff, effects, idx, errors):
+    amt = int(eff.get("amount", 0))
+
+    def step(ctx):
+        p = ctx.p
+        p.hp = max(0, p.hp - amt)
+        log(ctx.combat, "{}: -{} HP.", ctx.source, amt)
+    return step
+
+
+@effect_op("heal_per_enemy")
+def _op_heal_per_enemy(eff, effects, idx, errors):
+    amt = int(eff.get("amount", 0))
+
+    def step(ctx):
+        p = ctx.p
+        heal = amt * ctx.enemies.alive
+        p.hp = min(p.max_hp, p.hp + heal)
+        log(ctx.combat, "{}: +{} HP.", ctx.source, heal)
+    return step
+
+
+@effect_op("discard_choose")
+def _op_discard_choose(eff, effects, idx, errors):
+    n = int(eff.get("n", 1))
+    after = effects[idx+1:]
+    compile_effects(after, errors=errors)  # только проверка: исполнится после выбора
+
+    def step(ctx):
+        enemies, target_ent = ctx.enemies, ctx.target
+        target_idx = None
+        if target_ent and target_ent in enemies:
+            try:
+                target_idx = enemies.index(target_ent)
+            except ValueError:
+                target_idx = None
+        ctx.combat["pending"] = {
+            "type":"discard_choose",
+            "n":n,
+            "after_effects": list(after),
+            "target_idx": target_idx,
+        }
+        log(ctx.combat, "Выбери карты для сброса.")
+        return True
+    return step
+
+
+@effect_op("discard_random")
+def _op_discard_random(eff, effects, idx, errors):
+    n = int(eff.get("n", 1))
+
+    def step(ctx):
+        do_discard_random(ctx.combat, n=n)
+        log(ctx.combat, "{}: случайный сброс {}.", ctx.source, n)
+    return step
+
+
+@effect_op("take_from_discard")
+def _op_take_from_discard(eff, effects, idx, errors):
+    n = int(eff.get("n", 1))
+    reduce_cost = int(eff.get("reduce_cost", 0))
+
+    def step(ctx):
+        ctx.combat["pending"] = {"type":"take_from_discard","n":n, "reduce_cost": reduce_cost}
+        log(ctx.combat, "Выбери карту из сброса.")
+        return True
+    return step
+
+
+@effect_op("add_buff")
+def _op_add_buff(eff, effects, idx, errors):
+    buff = _check_buff(eff.get("buff"))
+    buff_name = content.BUFFS[buff]["name"]
+
+    def step(ctx):
+        p = ctx.p
+        add_buff(p, buff, combat=ctx.combat)
+        log(ctx.combat, "{}: баф «{}».", ctx.source, buff_name)
+        # некоторые бафы сразу меняют параметры
+        if buff in ("battery","battery_plus"):
+            inc = 2 if buff=="battery" else 3
+            p.mana_max += inc
+            p.mana += inc
+    return step
+
+
+@effect_op("if_hand_has_tag")
+def _op_if_hand_has_tag(eff, effects, idx, errors):
+    tag = eff.get("tag")
+    then = compile_effects(eff.get("then", []), errors=errors)
+
+    def step(ctx):
+        tagged = content.cards_with_tag(tag)
+        if any(ci["id"] in tagged for ci in ctx.combat["hand"]):
+            return run_effects(then, ctx)
+    return step
+
+
+@effect_op("if_enemy_hp_below")
+def _op_if_enemy_hp_below(eff, effects, idx, errors):
+    pct = float(eff.get("pct", 0.5))
+    then = compile_effects(eff.get("then", []), errors=errors)
+
+    def step(ctx):
+        tgt = ctx.target
+        if tgt and tgt.max_hp > 0:
+            if (tgt.hp / tgt.max_hp) < pct:
+                return run_effects(then, ctx)
+    return step
+
+
+@effect_op("dot_detach_explode")
+def _op_dot_detach_explode(eff, effects, idx, errors):
+    statuses = [_check_status(s) for s in eff.get("statuses", [])]
+    mult = float(eff.get("mult", 1.0))
+
+    def step(ctx):
+        tgt = ctx.target
+        if not tgt:
+            return
+        total = 0
+        for s in statuses:
+            total += status_get(tgt, s)
+            status_set(tgt, s, 0)
+        dmg = int(round(total * mult))
+        if dmg > 0:
+            _deal_damage(ctx.combat, ctx.p, tgt, dmg, allow_crit=False, source=ctx.source)
+    return step
+
+
+@effect_op("combo")
+def _op_combo(eff, effects, idx, errors):
+    steps = compile_effects(eff.get("steps", []), errors=errors)
+
+    def step(ctx):
+        return run_effects(steps, ctx)
+    return step
+
+
+@effect_op("choose_one")
+def _op_choose_one(eff, effects, idx, errors):
+    options = eff.get("options", [])
+    for opt in options:
+        compile_effects(opt.get("effects", []), errors=errors)
+
+    def step(ctx):
+        ctx.combat["pending"] = {
+            "type": "choose_one",
+            "card_uid": ctx.inst["uid"] if ctx.inst else None,
+            "options": options,
+        }
+        log(ctx.combat, "Выбери эффект карты.")
+        return True
+    return step
+
+
+def compile_effects(effects: List[dict], *, errors: Optional[List[str]] = None) -> EffectProgram:
+    """Скомпилировать список эффектов в программу.
+
+    Неизвестные op и битые поля пишутся в errors (если передан) и в программу не попадают.
+    """
+    frozen = isinstance(effects, content.FrozenList)
+    if frozen:
+        hit = _PROGRAM_CACHE.get(id(effects))
+        if hit is not None and hit[0] is effects:
+            return hit[1]
+    source = effects
+    # choose_one перехватывает весь список: фронту нужно выбрать
     for eff in effects:
+        if eff.get("op") == "choose_one":
+            effects = [eff]
+            break
+    program: List[EffectStep] = []
+    for idx, eff in enumerate(effects):
         op = eff.get("op")
-        if op == "draw":
-            draw_to_hand(combat, n=int(eff.get("n", 1)), rng=combat["_rng"])
-        elif op == "gain_mana":
-            inc = int(eff.get("n", 1))
-            p["mana"] = int(p.get("mana", 0)) + inc
-            log(combat, f"Эффект: +{inc} маны.")
-        elif op == "block":
-            p["block"] += int(eff.get("amount", 0))
-        elif op == "apply":
-            status = eff.get("status")
-            stacks = int(eff.get("stacks", 0))
-            to = eff.get("to", "enemy")
-            if to == "enemy" and target_ent:
-                status_add(target_ent, status, stacks, combat=combat, source="Эффект")
-        elif op == "damage":
-            if target_ent:
-                deal_damage(combat, p, target_ent, int(eff.get("amount", 0)), allow_crit=True, source="Эффект")
-        elif op == "add_buff":
-            add_buff(p, eff.get("buff"))
-        elif op == "heal":
-            amt = int(eff.get("amount", 0))
-            p["hp"] = min(int(p["max_hp"]), int(p.get("hp", 0)) + amt)
-        elif op == "lose_hp":
-            p["hp"] = max(0, int(p.get("hp", 0)) - int(eff.get("amount", 0)))
-        elif op == "heal_per_enemy":
-            amt = int(eff.get("amount", 0))
-            alive = sum(1 for e in combat.get("enemies", []) if e.get("hp", 0) > 0)
-            p["hp"] = min(int(p["max_hp"]), int(p.get("hp", 0)) + amt * alive)
-        else:
-            pass
+        compiler = EFFECT_OPS.get(op)
+        if compiler is None:
+            # неизвестное — пропускаем (архитектура расширяемая), но сообщаем
+            if errors is not None:
+                errors.append(f"op {op!r} не зарегистрирован")
+            continue
+        try:
+            program.append(compiler(eff, effects, idx, errors))
+        except (TypeError, ValueError, KeyError) as e:
+            if errors is not None:
+                errors.append(f"op {op!r}: {e}")
+    result = tuple(program)
+    if frozen:
+        _PROGRAM_CACHE[id(source)] = (source, result)
+    return result
+
+
+def card_program(cdef: Dict[str, Any], errors: Optional[List[str]] = None) -> EffectProgram:
+    return compile_effects(cdef.get("effects", []), errors=errors)
+
+
+def compile_content() -> None:
+    """Проверить и скомпилировать эффекты всех карт, пересобрать индексы пулов и таблицы
+    ходов врагов (вызывается при импорте; после правок контент-паком можно вызвать ещё раз)."""
+    # сначала индексы и описания карт: переопределённая карта должна компилироваться уже новой;
+    # программы старых описаний больше не нужны
+    content.build_indexes()
+    _PROGRAM_CACHE.clear()
+    problems: List[str] = []
+    for c in content.CARDS + content.CURSES:
+        for up in (False, True):
+            errors: List[str] = []
+            card_program(content.get_card_def(c["id"], upgraded=up), errors)
+            problems.extend(f"{c['id']}{'+' if up else ''}: {e}" for e in errors)
+    if problems:
+        raise EffectCompileError("Ошибки в эффектах карт:\n" + "\n".join(problems))
+    compile_move_tables()
 
-def add_buff(ent: Dict[str, Any], buff: str):
-    ent.setdefault("buffs", {})
-    ent["buffs"][buff] = int(ent["buffs"].get(buff, 0)) + 1
 
+def resolve_card_effects(state: Dict[str, Any], combat: Dict[str, Any], inst: Dict[str, Any], cdef: Dict[str, Any], target_ent: Optional[Dict[str, Any]]):
+    ctx = EffectContext(state, combat, combat["player"], inst, cdef, target_ent, cdef["name"])
+    run_effects(card_program(cdef), ctx)
 
-def consume_buff(ent: Dict[str, Any], buff: str, amount: int = 1) -> int:
+def resolve_effect_list(state: Dict[str, Any], combat: Dict[str, Any], effects: List[dict], p: Dict[str, Any], target_ent: Optional[Dict[str, Any]]):
+    # Эффекты вне розыгрыша карты: «после сброса», выбор из choose_one и т.п.
+    ctx = EffectContext(state, combat, p, None, None, target_ent, "Эффект")
+    run_effects(compile_effects(effects), ctx)
+
+def add_buff(ent: Combatant, buff: str, combat: Optional[Dict[str, Any]] = None):
+    ent.buffs[buff] = ent.buffs.get(buff, 0) + 1
+    if combat is not None and ent is combat.get("player"):
+        _subscribe_buff(combat, buff)
+
+
+def consume_buff(ent: Combatant, buff: str, amount: int = 1, combat: Optional[Dict[str, Any]] = None) -> int:
     """Уменьшает стаки бафа и возвращает оставшееся количество."""
     if amount <= 0:
         return buff_count(ent, buff)
-    ent.setdefault("buffs", {})
-    cur = int(ent["buffs"].get(buff, 0))
+    buffs = ent.buffs
+    cur = buffs.get(buff, 0)
     if cur <= amount:
-        ent["buffs"].pop(buff, None)
+        buffs.pop(buff, None)
+        if combat is not None and ent is combat.get("player"):
+            _unsubscribe_buff(combat, buff)
         return 0
-    ent["buffs"][buff] = cur - amount
-    return ent["buffs"][buff]
+    buffs[buff] = cur - amount
+    return buffs[buff]
+
+# ---- хуки бафов ----
+# content.BUFFS[*]["hooks"] объявляет, где баф срабатывает. В бою держим индекс
+# hook -> активные бафы игрока (combat["_buff_hooks"], как _rng — не сохраняется),
+# чтобы точка хука обходила только то, что реально висит на игроке.
+
+# hook -> buff -> обработчик(combat, p, stacks, acc)
+BUFF_HOOKS: Dict[str, Dict[str, Callable[..., None]]] = {}
+# порядок бафов в каталоге: в нём хуки и срабатывают (лог/ГСЧ не зависят от порядка покупки)
+_BUFF_ORDER = {b: i for i, b in enumerate(content.BUFFS)}
+
+
+def buff_hook(hook: str, *buffs: str):
+    def deco(fn):
+        for b in buffs:
+            BUFF_HOOKS.setdefault(hook, {})[b] = fn
+        return fn
+    return deco
+
+
+def _buff_index(combat: Dict[str, Any]) -> Dict[str, List[str]]:
+    idx = combat.get("_buff_hooks")
+    if idx is None:
+        idx = combat["_buff_hooks"] = {}
+        for b in combat["player"].buffs:
+            _subscribe_buff(combat, b)
+    return idx
+
+
+def _subscribe_buff(combat: Dict[str, Any], buff: str):
+    idx = combat.get("_buff_hooks")
+    if idx is None:
+        return  # индекс ещё не строился — соберётся целиком при первом обращении
+    for hook in content.BUFFS.get(buff, {}).get("hooks", []):
+        subs = idx.setdefault(hook, [])
+        if buff not in subs:
+            subs.append(buff)
+            subs.sort(key=lambda b: _BUFF_ORDER.get(b, len(_BUFF_ORDER)))
+
+
+def _unsubscribe_buff(combat: Dict[str, Any], buff: str):
+    idx = combat.get("_buff_hooks")
+    if idx is None:
+        return
+    for hook in content.BUFFS.get(buff, {}).get("hooks", []):
+        subs = idx.get(hook)
+        if subs and buff in subs:
+            subs.remove(buff)
+
+
+def buff_subscribers(combat: Dict[str, Any], hook: str) -> List[Tuple[str, int]]:
+    """Активные бафы игрока на хуке: [(buff, stacks)] в порядке каталога."""
+    subs = _buff_index(combat).get(hook)
+    if not subs:
+        return []
+    buffs = combat["player"].buffs
+    out = []
+    for b in subs:
+        stacks = buffs.get(b, 0)
+        if stacks > 0:
+            out.append((b, stacks))
+    return out
+
+
+def fire_buff_hook(combat: Dict[str, Any], hook: str, acc: Optional[Dict[str, int]] = None):
+    handlers = BUFF_HOOKS.get(hook, {})
+    p = combat["player"]
+    for b, stacks in buff_subscribers(combat, hook):
+        fn = handlers.get(b)
+        if fn:
+            fn(combat, p, b, stacks, acc)
+
+
+@buff_hook("turn_end_player", "eclipse", "eclipse_plus")
+def _hook_eclipse(combat, p, buff, stacks, acc):
+    name, n = ("Затмение", 2 * stacks) if buff == "eclipse" else ("Затмение+", 3 * stacks)
+    for e in combat["enemies"]:
+        if e.alive:
+            status_add(e, "poison", n, combat=combat, source=name)
+            status_add(e, "burn", n, combat=combat, source=name)
+    log(combat, "{0}: всем врагам +{1} яд/+{1} ожог.", name, n)
+
+
+@buff_hook("turn_end_player", "phoenix_heart", "phoenix_heart_plus")
+def _hook_phoenix_burn(combat, p, buff, stacks, acc):
+    name, n = ("Сердце феникса", 1 * stacks) if buff == "phoenix_heart" else ("Сердце феникса+", 2 * stacks)
+    for e in combat["enemies"]:
+        if e.alive:
+            status_add(e, "burn", n, combat=combat, source=name)
+    log(combat, "{}: всем врагам +Ожог.", name)
+
+
+@buff_hook("turn_end_player", "venom_rain", "venom_rain_plus")
+def _hook_venom_rain(combat, p, buff, stacks, acc):
+    name, n = ("Ядовитая призма", 2 * stacks) if buff == "venom_rain" else ("Ядовитая призма+", 3 * stacks)
+    for e in combat["enemies"]:
+        if e.alive:
+            status_add(e, "poison", n, combat=combat, source=name)
+    log(combat, "{}: всем врагам +{} Яда.", name, n)
+
+
+# начало хода: бафы только копят прибавки, start_player_turn применяет их одним логом
+# buff -> (мана, блок тату, лечение, блок регенерации) за стак
+_TURN_START_GAINS = {
+    "battery": (1, 0, 0, 0),
+    "battery_plus": (1, 0, 0, 0),
+    "ward_small": (0, 2, 0, 0),
+    "ward_medium": (0, 3, 0, 0),
+    "regen_small": (0, 0, 2, 0),
+    "regen_medium": (0, 0, 3, 0),
+    "regen_guard": (0, 0, 4, 2),
+    "regen_guard_plus": (0, 0, 5, 3),
+    "phoenix_heart": (0, 0, 6, 0),
+    "phoenix_heart_plus": (0, 0, 7, 0),
+}
+
+
+@buff_hook("turn_start_player", *_TURN_START_GAINS)
+def _hook_turn_start_gains(combat, p, buff, stacks, acc):
+    mana, ward, heal, block = _TURN_START_GAINS[buff]
+    acc["mana"] += mana * stacks
+    # тату даёт блок за сам факт наличия и ещё раз за каждый стак
+    acc["ward"] += ward * (stacks + 1)
+    acc["heal"] += heal * stacks
+    acc["block"] += block * stacks
+
+
+@buff_hook("on_discard", "mana_on_discard")
+def _hook_mana_on_discard(combat, p, buff, stacks, acc):
+    p.mana += stacks
+    log(combat, "Баф: сброс -> +{} маны.", stacks)
+
+
+@buff_hook("on_discard", "mana_block_on_discard")
+def _hook_mana_block_on_discard(combat, p, buff, stacks, acc):
+    p.mana += stacks
+    p.block += stacks
+    log(combat, "Баф: сброс -> +{0} мана и +{0} Блок.", stacks)
+
+
+@buff_hook("on_discard", "draw_on_discard")
+def _hook_draw_on_discard(combat, p, buff, stacks, acc):
+    draw_to_hand(combat, n=stacks, rng=combat["_rng"])
+    log(combat, "Баф: сброс -> добор {}.", stacks)
+
+
+@buff_hook("on_discard", "draw_block_on_discard")
+def _hook_draw_block_on_discard(combat, p, buff, stacks, acc):
+    draw_to_hand(combat, n=stacks, rng=combat["_rng"])
+    p.block += stacks
+    log(combat, "Баф: сброс -> добор {0} и +{0} Блок.", stacks)
+
+
+# попадание атакой: ожог накладывается одной пачкой, эхо — после него
+@buff_hook("on_attack_hit", "burn_on_hit", "burn_on_hit_2")
+def _hook_burn_on_hit(combat, p, buff, stacks, acc):
+    acc["burn"] += stacks if buff == "burn_on_hit" else 2 * stacks
+
+
+@buff_hook("on_attack_hit", "echo_attack_half")
+def _hook_echo_attack(combat, p, buff, stacks, acc):
+    acc["echo"] += stacks
 
 def do_discard_random(combat: Dict[str, Any], n: int):
     rng = combat.get("_rng") or random.Random(0)
@@ -1233,28 +2449,11 @@ def do_discard_random(combat: Dict[str, Any], n: int):
     return
 
 def trigger_on_discard(combat: Dict[str, Any], card_inst: Dict[str, Any]):
-    p = combat["player"]
-    mana_on_discard = buff_count(p, "mana_on_discard")
-    if mana_on_discard:
-        p["mana"] += mana_on_discard
-        log(combat, f"Баф: сброс -> +{mana_on_discard} маны.")
-    mana_block_on_discard = buff_count(p, "mana_block_on_discard")
-    if mana_block_on_discard:
-        p["mana"] += mana_block_on_discard
-        p["block"] += mana_block_on_discard
-        log(combat, f"Баф: сброс -> +{mana_block_on_discard} мана и +{mana_block_on_discard} Блок.")
-    draw_on_discard = buff_count(p, "draw_on_discard")
-    if draw_on_discard:
-        draw_to_hand(combat, n=draw_on_discard, rng=combat["_rng"])
-        log(combat, f"Баф: сброс -> добор {draw_on_discard}.")
-    draw_block_on_discard = buff_count(p, "draw_block_on_discard")
-    if draw_block_on_discard:
-        draw_to_hand(combat, n=draw_block_on_discard, rng=combat["_rng"])
-        p["block"] += draw_block_on_discard
-        log(combat, f"Баф: сброс -> добор {draw_block_on_discard} и +{draw_block_on_discard} Блок.")
+    fire_buff_hook(combat, "on_discard")
 
 # ---- pending выборы ----
 
+@_accepts_plain()
 def resolve_pending(state: Dict[str, Any], payload: Dict[str, Any]) -> None:
     run = state["run"]
     combat = run.get("combat")
@@ -1294,13 +2493,7 @@ def resolve_pending(state: Dict[str, Any], payload: Dict[str, Any]) -> None:
         uid = payload.get("uid")
         if not uid:
             return
-        # найдём в сбросе
-        disc = combat.get("discard_pile", [])
-        pick = None
-        for i, c in enumerate(disc):
-            if c.get("uid") == uid:
-                pick = disc.pop(i)
-                break
+        pick = take_card(combat.get("discard_pile", []), uid)
         if pick:
             # опционально: -cost
             red = int(pending.get("reduce_cost", 0))
@@ -1316,16 +2509,17 @@ def resolve_pending(state: Dict[str, Any], payload: Dict[str, Any]) -> None:
         opts = pending.get("options", [])
         if 0 <= idx < len(opts):
             effs = opts[idx].get("effects", [])
-            resolve_effect_list(state, combat, effs, combat["player"], None)
+            # снимаем выбор до эффектов: вложенный эффект может поставить новый
             combat["pending"] = None
-            log(combat, f"Выбрано: {opts[idx].get('label','')}")
+            log(combat, "Выбрано: {}", opts[idx].get("label",""))
+            resolve_effect_list(state, combat, effs, combat["player"], None)
             state["updated_at"] = now_ts()
         return
 
 # ---- проклятья ----
 
 def apply_curse_penalties(combat: Dict[str, Any]) -> None:
-    p = combat.get("player", {})
+    p = combat["player"]
     for c in list(combat.get("hand", [])):
         cdef = content.get_card_def(c["id"], upgraded=bool(c.get("up", False)))
         if not is_curse_card(cdef):
@@ -1333,18 +2527,19 @@ def apply_curse_penalties(combat: Dict[str, Any]) -> None:
         eff = cdef.get("curse_effect", {})
         if eff.get("lose_hp"):
             dmg = int(eff.get("lose_hp", 0))
-            p["hp"] = max(0, int(p.get("hp", 0)) - dmg)
-            log(combat, f"{cdef['name']}: -{dmg} HP.")
+            p.hp = max(0, p.hp - dmg)
+            log(combat, "{}: -{} HP.", cdef["name"], dmg)
         if eff.get("apply_status"):
             st = eff["apply_status"].get("status")
             stacks = int(eff["apply_status"].get("stacks", 0))
             status_add(p, st, stacks, combat=combat, source=cdef["name"])
-            log(combat, f"{cdef['name']}: на тебя накладывается {content.STATUSES.get(st,{}).get('name', st)}.")
+            log(combat, "{}: на тебя накладывается {}.", cdef["name"], content.STATUSES.get(st,{}).get("name", st))
         if eff.get("next_draw_penalty"):
             combat["_curse_draw_penalty"] = int(combat.get("_curse_draw_penalty", 0)) + int(eff.get("next_draw_penalty", 0))
 
 # ---- конец хода ----
 
+@_accepts_plain()
 def end_turn(state: Dict[str, Any]) -> None:
     run = state["run"]
     combat = run.get("combat")
@@ -1361,51 +2556,13 @@ def end_turn(state: Dict[str, Any]) -> None:
     apply_curse_penalties(combat)
 
     # turn_end_player бафы
-    eclipse = buff_count(p, "eclipse")
-    if eclipse:
-        for e in combat["enemies"]:
-            if e["hp"] > 0:
-                status_add(e, "poison", 2 * eclipse, combat=combat, source="Затмение")
-                status_add(e, "burn", 2 * eclipse, combat=combat, source="Затмение")
-        log(combat, f"Затмение: всем врагам +{2 * eclipse} яд/+{2 * eclipse} ожог.")
-    eclipse_plus = buff_count(p, "eclipse_plus")
-    if eclipse_plus:
-        for e in combat["enemies"]:
-            if e["hp"] > 0:
-                status_add(e, "poison", 3 * eclipse_plus, combat=combat, source="Затмение+")
-                status_add(e, "burn", 3 * eclipse_plus, combat=combat, source="Затмение+")
-        log(combat, f"Затмение+: всем врагам +{3 * eclipse_plus} яд/+{3 * eclipse_plus} ожог.")
-    if "phoenix_heart" in p.get("buffs", {}):
-        stacks = int(p["buffs"].get("phoenix_heart", 1))
-        for e in combat["enemies"]:
-            if e["hp"] > 0:
-                status_add(e, "burn", 1 * stacks, combat=combat, source="Сердце феникса")
-        log(combat, "Сердце феникса: всем врагам +Ожог.")
-    if "phoenix_heart_plus" in p.get("buffs", {}):
-        stacks = int(p["buffs"].get("phoenix_heart_plus", 1))
-        for e in combat["enemies"]:
-            if e["hp"] > 0:
-                status_add(e, "burn", 2 * stacks, combat=combat, source="Сердце феникса+")
-        log(combat, "Сердце феникса+: всем врагам +Ожог.")
-    venom = buff_count(p, "venom_rain")
-    if venom:
-        for e in combat["enemies"]:
-            if e["hp"] > 0:
-                status_add(e, "poison", 2 * venom, combat=combat, source="Ядовитая призма")
-        log(combat, f"Ядовитая призма: всем врагам +{2 * venom} Яда.")
-    venom_plus = buff_count(p, "venom_rain_plus")
-    if venom_plus:
-        for e in combat["enemies"]:
-            if e["hp"] > 0:
-                status_add(e, "poison", 3 * venom_plus, combat=combat, source="Ядовитая призма+")
-        log(combat, f"Ядовитая призма+: всем врагам +{3 * venom_plus} Яда.")
-
+    fire_buff_hook(combat, "turn_end_player")
 
     # burn tick на игроке (конец хода игрока)
     tick_burn(combat, p, owner="player")
 
     # сбрасываем не-зарядные
-    new_hand = []
+    new_hand = Pile()
     for c in combat["hand"]:
         cdef = content.get_card_def(c["id"], upgraded=bool(c.get("up", False)))
         if cdef.get("stays_in_hand"):
@@ -1428,6 +2585,7 @@ def end_turn(state: Dict[str, Any]) -> None:
     # новый ход игрока
     start_player_turn(state)
 
+@_accepts_plain()
 def start_player_turn(state: Dict[str, Any]) -> None:
     run = state["run"]
     combat = run.get("combat")
@@ -1440,16 +2598,16 @@ def start_player_turn(state: Dict[str, Any]) -> None:
 
         p = combat["player"]
         # одноходовые отражения очищаются к новому ходу
-        p.get("buffs", {}).pop("reflect_half_1turn", None)
-        p.get("buffs", {}).pop("reflect_full_1turn", None)
+        p.buffs.pop("reflect_half_1turn", None)
+        p.buffs.pop("reflect_full_1turn", None)
         # блок обнуляется в начале своего хода (как в StS)
-        p["block"] = 0
+        p.block = 0
 
         # dot tick на игроке (яд)
         tick_poison(combat, p, owner="player")
 
         # если умер от яда
-        if p["hp"] <= 0:
+        if not p.alive:
             lose_combat(state)
             return
 
@@ -1478,71 +2636,45 @@ def start_player_turn(state: Dict[str, Any]) -> None:
         combat["phase"] = "player"
 
         # мана: refill
-        p["mana"] = int(p.get("mana_max", 3))
-        # battery: в начале хода +1 мана за стак
-        battery_stacks = buff_count(p, "battery") + buff_count(p, "battery_plus")
-        if battery_stacks:
-            p["mana"] += battery_stacks
-            log(combat, f"Батарея: +{battery_stacks} маны в начале хода.")
-
-        # ward: блок в начале хода
-        if "ward_small" in p.get("buffs", {}):
-            p["block"] += 2
-        if "ward_medium" in p.get("buffs", {}):
-            p["block"] += 3
-        regen_heal = 0
-        regen_block = 0
-        buffs = p.get("buffs", {})
-        if "regen_small" in buffs:
-            regen_heal += 2 * int(buffs.get("regen_small", 1))
-        if "regen_medium" in buffs:
-            regen_heal += 3 * int(buffs.get("regen_medium", 1))
-        if "regen_guard" in buffs:
-            regen_heal += 4 * int(buffs.get("regen_guard", 1))
-            regen_block += 2 * int(buffs.get("regen_guard", 1))
-        if "regen_guard_plus" in buffs:
-            regen_heal += 5 * int(buffs.get("regen_guard_plus", 1))
-            regen_block += 3 * int(buffs.get("regen_guard_plus", 1))
-        if "phoenix_heart" in buffs:
-            regen_heal += 6 * int(buffs.get("phoenix_heart", 1))
-        if "phoenix_heart_plus" in buffs:
-            regen_heal += 7 * int(buffs.get("phoenix_heart_plus", 1))
-        if regen_heal > 0:
-            before = int(p.get("hp", 0))
-            p["hp"] = min(int(p["max_hp"]), before + regen_heal)
-            healed = p["hp"] - before
+        p.mana = p.mana_max
+        # turn_start_player бафы: батарея, тату, регенерация
+        gains = {"mana": 0, "ward": 0, "heal": 0, "block": 0}
+        fire_buff_hook(combat, "turn_start_player", gains)
+        if gains["mana"]:
+            p.mana += gains["mana"]
+            log(combat, "Батарея: +{} маны в начале хода.", gains["mana"])
+        p.block += gains["ward"]
+        if gains["heal"] > 0:
+            before = p.hp
+            p.hp = min(p.max_hp, before + gains["heal"])
+            healed = p.hp - before
             if healed > 0:
-                log(combat, f"Регенерация: +{healed} HP.")
-        if regen_block > 0:
-            p["block"] += regen_block
-            log(combat, f"Регенерация: +{regen_block} Блока.")
-        ward_small = buff_count(p, "ward_small")
-        ward_medium = buff_count(p, "ward_medium")
-        if ward_small:
-            p["block"] += 2 * ward_small
-        if ward_medium:
-            p["block"] += 3 * ward_medium
+                log(combat, "Регенерация: +{} HP.", healed)
+        if gains["block"] > 0:
+            p.block += gains["block"]
+            log(combat, "Регенерация: +{} Блока.", gains["block"])
 
         # добор до 6 с учётом проклятий
         penalty = int(combat.pop("_curse_draw_penalty", 0))
         if penalty:
-            log(combat, f"Проклятье ограничивает добор: -{penalty} карта(ы).")
+            log(combat, "Проклятье ограничивает добор: -{} карта(ы).", penalty)
         draw_n = max(0, 6 - len(combat["hand"]) - penalty)
         draw_to_hand(combat, n=draw_n, rng=rng)
 
         # если умер от яда
-        if p["hp"] <= 0:
+        if not p.alive:
             lose_combat(state)
             return
 
         # выставим намерения у врагов, если где-то нет
         for e in combat["enemies"]:
-            if e["hp"] > 0 and not e.get("intent"):
+            if e.alive and not e.intent:
                 choose_intent(e, rng)
 
         state["updated_at"] = now_ts()
         return
 
+@_accepts_plain()
 def enemy_turn(state: Dict[str, Any]) -> None:
     run = state["run"]
     combat = run.get("combat")
@@ -1553,111 +2685,112 @@ def enemy_turn(state: Dict[str, Any]) -> None:
 
     # блок врагов снимается в начале их фазы, чтобы он учитывался при атаках игрока
     for e in enemies:
-        e["block"] = 0
+        e.block = 0
 
     # яд тикает на врагах в начале их хода
     for e in enemies:
-        if e["hp"] > 0:
+        if e.alive:
             tick_poison(combat, e, owner="enemy")
 
     # если все умерли от DoT — победа
-    if all(e["hp"] <= 0 for e in enemies):
+    if not enemies.alive:
         win_combat(state)
         return
 
     # враги действуют
     for e in enemies:
-        if e["hp"] <= 0:
+        if not e.alive:
             continue
+        st = e.statuses
 
         # stun
-        if status_get(e, "stun") > 0:
+        if st.stun > 0:
             status_dec(e, "stun", 1)
-            log(combat, f"{e['name']} оглушён и пропускает ход.")
+            log(combat, "{} оглушён и пропускает ход.", e.name)
             choose_intent(e, rng)
             continue
 
         # freeze: шанс пропустить
-        if status_get(e, "freeze") > 0:
+        if st.freeze > 0:
             if rng.random() < 0.30:
                 status_dec(e, "freeze", 1)
-                log(combat, f"{e['name']} заморожен и срывается.")
+                log(combat, "{} заморожен и срывается.", e.name)
                 choose_intent(e, rng)
                 continue
 
-        move = e.get("next_move")
+        move = enemy_next_move(e)
         if not move:
             choose_intent(e, rng)
-            move = e.get("next_move")
+            move = enemy_next_move(e)
 
-        e["last_move"] = move.get("id")
+        e.last_move = move.get("id")
 
         mtype = move.get("type")
         if mtype == "attack":
             dmg = int(move.get("dmg", 0))
-            deal_damage(combat, e, p, dmg, allow_crit=False, source=e["name"] + " — " + move["name"])
+            _deal_damage(combat, e, p, dmg, allow_crit=False, source=e.name + " — " + move["name"])
             # bleed triggers on attacker when it attacks
             tick_bleed_on_attack(combat, e)
         elif mtype == "attack_apply":
             dmg = int(move.get("dmg", 0))
-            deal_damage(combat, e, p, dmg, allow_crit=False, source=e["name"] + " — " + move["name"])
+            _deal_damage(combat, e, p, dmg, allow_crit=False, source=e.name + " — " + move["name"])
             stacks = status_with_bonus(e, move.get("status"), int(move.get("stacks", 0)))
-            status_add(p, move.get("status"), stacks, combat=combat, source=e["name"] + " — " + move["name"])
+            status_add(p, move.get("status"), stacks, combat=combat, source=e.name + " — " + move["name"])
             tick_bleed_on_attack(combat, e)
         elif mtype == "apply":
             stacks = status_with_bonus(e, move.get("status"), int(move.get("stacks", 0)))
-            status_add(p, move.get("status"), stacks, combat=combat, source=e["name"] + " — " + move["name"])
-            log(combat, f"{e['name']}: {move['name']} -> {move.get('status')} +{stacks}.")
+            status_add(p, move.get("status"), stacks, combat=combat, source=e.name + " — " + move["name"])
+            log(combat, "{}: {} -> {} +{}.", e.name, move["name"], move.get("status"), stacks)
         elif mtype == "apply_all":
             stacks = status_with_bonus(e, move.get("status"), int(move.get("stacks", 0)))
-            status_add(p, move.get("status"), stacks, combat=combat, source=e["name"] + " — " + move["name"])
-            log(combat, f"{e['name']}: {move['name']} -> {move.get('status')} +{stacks}.")
+            status_add(p, move.get("status"), stacks, combat=combat, source=e.name + " — " + move["name"])
+            log(combat, "{}: {} -> {} +{}.", e.name, move["name"], move.get("status"), stacks)
         elif mtype == "block":
-            e["block"] = int(e.get("block", 0)) + int(move.get("block", 0))
-            log(combat, f"{e['name']}: {move['name']} (+{move.get('block',0)} Блока).")
+            e.block += int(move.get("block", 0))
+            log(combat, "{}: {} (+{} Блока).", e.name, move["name"], move.get("block",0))
         elif mtype == "heal":
             amt = int(move.get("amount", 0))
-            e["hp"] = min(int(e["max_hp"]), int(e["hp"]) + amt)
-            log(combat, f"{e['name']}: лечится на {amt}.")
+            e.hp = min(e.max_hp, e.hp + amt)
+            log(combat, "{}: лечится на {}.", e.name, amt)
         elif mtype == "phase_shift":
             target_phase = move.get("set_phase", "phase2")
-            e.get("vars", {})["phase"] = target_phase
+            e.vars["phase"] = target_phase
             if move.get("block"):
-                e["block"] = int(e.get("block", 0)) + int(move.get("block", 0))
+                e.block += int(move.get("block", 0))
             if move.get("buff"):
                 add_buff(e, move.get("buff"))
             if move.get("dmg_mult"):
-                e.setdefault("vars", {})["dmg_mult"] = float(move.get("dmg_mult", 1.0))
+                e.vars["dmg_mult"] = float(move.get("dmg_mult", 1.0))
             sb = move.get("status_boost") or {}
             if sb.get("status"):
-                bonus_map = e.setdefault("vars", {}).setdefault("status_bonus", {})
+                bonus_map = e.vars.setdefault("status_bonus", {})
                 bonus_map[sb["status"]] = int(bonus_map.get(sb["status"], 0)) + int(sb.get("bonus", 0))
-            log(combat, f"{e['name']} меняет фазу: {move.get('name')}.")
+            log(combat, "{} меняет фазу: {}.", e.name, move.get("name"))
         elif mtype == "counter_prep":
             if move.get("block"):
-                e["block"] = int(e.get("block", 0)) + int(move.get("block", 0))
-            e.get("vars", {})["counter_ready"] = {
+                e.block += int(move.get("block", 0))
+            e.vars["counter_ready"] = {
                 "dmg": int(move.get("counter_dmg", 0)),
                 "status": move.get("status"),
                 "stacks": int(move.get("stacks", 0)),
                 "name": move.get("name"),
             }
-            log(combat, f"{e['name']} готовится ответить: {move.get('name')}.")
+            log(combat, "{} готовится ответить: {}.", e.name, move.get("name"))
         elif mtype == "self_debuff":
             # для «турели»: следующий луч сильнее
-            e["vars"]["overheat"] = 1
-            log(combat, f"{e['name']}: {move['name']} (что-то трещит внутри).")
+            e.vars["overheat"] = 1
+            log(combat, "{}: {} (что-то трещит внутри).", e.name, move["name"])
         else:
-            log(combat, f"{e['name']} делает что-то странное.")
+            log(combat, "{} делает что-то странное.", e.name)
 
         # dead check на игроке
-        if p["hp"] <= 0:
+        if not p.alive:
             lose_combat(state)
             return
 
         # если враг умер от шипов/дотов в своём действии — пропустим burn/intents
-        if e["hp"] <= 0:
-            if all(en["hp"] <= 0 for en in enemies):
+        if not e.alive:
+            if not enemies.alive:
                 win_combat(state)
                 return
             continue
@@ -1665,8 +2798,8 @@ def enemy_turn(state: Dict[str, Any]) -> None:
         # burn tick на враге (конец его хода)
         tick_burn(combat, e, owner="enemy")
 
-        if e["hp"] <= 0:
-            if all(en["hp"] <= 0 for en in enemies):
+        if not e.alive:
+            if not enemies.alive:
                 win_combat(state)
                 return
             continue
@@ -1675,25 +2808,21 @@ def enemy_turn(state: Dict[str, Any]) -> None:
         choose_intent(e, rng)
 
         # проверка победы, если враг умер от дотов/реактивных эффектов
-        if all(en["hp"] <= 0 for en in enemies):
+        if not enemies.alive:
             win_combat(state)
             return
 
     # игрок блок обнулим в начале следующего хода игрока (уже делаем в start_player_turn)
     combat["phase"] = "player"
 
-def tick_poison(combat: Dict[str, Any], ent: Dict[str, Any], owner: str):
-    s = status_get(ent, "poison")
+def tick_poison(combat: Dict[str, Any], ent: Combatant, owner: str):
+    s = ent.statuses.poison
     if s <= 0:
         return
-    ent["hp"] = max(0, int(ent["hp"]) - s)
-    log(combat, f"Яд: {s} урона.")
+    ent.hp = max(0, ent.hp - s)
+    log(combat, "Яд: {} урона.", s)
     # decay unless бафы запрещают уменьшение
-    no_decay = (
-        "poison_no_decay" in combat.get("player", {}).get("buffs", {})
-        or "venom_rain" in combat.get("player", {}).get("buffs", {})
-        or "venom_rain_plus" in combat.get("player", {}).get("buffs", {})
-    )
+    no_decay = bool(buff_subscribers(combat, "dot_tick_poison"))
     if owner == "enemy":
         if not no_decay:
             status_dec(ent, "poison", 1)
@@ -1701,18 +2830,19 @@ def tick_poison(combat: Dict[str, Any], ent: Dict[str, Any], owner: str):
         if not no_decay:
             status_dec(ent, "poison", 1)
 
-def tick_burn(combat: Dict[str, Any], ent: Dict[str, Any], owner: str):
-    s = status_get(ent, "burn")
+def tick_burn(combat: Dict[str, Any], ent: Combatant, owner: str):
+    s = ent.statuses.burn
     if s <= 0:
         return
     # burn_boost: +1 dmg per stack
-    dmg = s + buff_count(combat.get("player", {}), "burn_boost")
-    ent["hp"] = max(0, int(ent["hp"]) - dmg)
-    log(combat, f"Ожог: {dmg} урона.")
+    boost = buff_count(combat["player"], "burn_boost")
+    dmg = s + boost
+    ent.hp = max(0, ent.hp - dmg)
+    log(combat, "Ожог: {} урона.", dmg)
     # decay
     if owner == "enemy":
         # чуть медленнее при burn_boost: у врага не уменьшается на его ходу (иронично), а уменьшится в начале хода игрока? упростим: уменьшается всё равно, но медленнее
-        if buff_count(combat.get("player", {}), "burn_boost"):
+        if boost:
             if s >= 2:
                 status_dec(ent, "burn", 0)  # не уменьшаем
             else:
@@ -1722,12 +2852,12 @@ def tick_burn(combat: Dict[str, Any], ent: Dict[str, Any], owner: str):
     else:
         status_dec(ent, "burn", 1)
 
-def tick_bleed_on_attack(combat: Dict[str, Any], ent: Dict[str, Any]):
-    s = status_get(ent, "bleed")
+def tick_bleed_on_attack(combat: Dict[str, Any], ent: Combatant):
+    s = ent.statuses.bleed
     if s <= 0:
         return
-    ent["hp"] = max(0, int(ent["hp"]) - s)
-    log(combat, f"Кровоток: {s} урона атакующему.")
+    ent.hp = max(0, ent.hp - s)
+    log(combat, "Кровоток: {} урона атакующему.", s)
     status_dec(ent, "bleed", 1)
 
 # ---- исход боя / награды ----
@@ -1739,9 +2869,9 @@ def win_combat(state: Dict[str, Any]) -> None:
         return
     combat["phase"] = "won"
     # перенесём hp обратно в забег
-    run["hp"] = int(combat["player"]["hp"])
+    run["hp"] = combat["player"].hp
     # золото
-    rng = seeded_rng(run)
+    rng = seeded_rng(run, "rewards")
     base = 18 + 6 * (act_for_floor(run["floor"]) - 1)
     gain = base + rng.randint(0, 10)
     run["gold"] += gain
@@ -1791,7 +2921,7 @@ def complete_floor_and_continue(state: Dict[str, Any]) -> None:
     floor = int(run["floor"])
     if is_boss_floor(floor):
         # акт-энд: продублировать и удалить (из 4 случайных)
-        rng = seeded_rng(run)
+        rng = seeded_rng(run, "rewards")
         deck = run["deck"]
         # если колода маленькая — подстроимся
         picks_dup = rng.sample(deck, k=min(4, len(deck))) if deck else []
@@ -1859,7 +2989,7 @@ def pick_reward_card(state: Dict[str, Any], card_id: Optional[str]) -> None:
 
 def start_event(state: Dict[str, Any]) -> None:
     run = state["run"]
-    rng = seeded_rng(run)
+    rng = seeded_rng(run, "events")
     ev = rng.choice(content.EVENTS)
     run["event"] = deep(ev)
     state["screen"] = "EVENT"
@@ -1889,7 +3019,7 @@ def choose_event_option(state: Dict[str, Any], opt_id: str) -> None:
 
 def apply_event_effect(state: Dict[str, Any], eff: Dict[str, Any]) -> None:
     run = state["run"]
-    rng = seeded_rng(run)
+    rng = seeded_rng(run, "events")
     op = eff.get("op")
     if op == "noop":
         state["ui"]["toast"] = "Ничего не произошло. Подозрительно."
@@ -1955,13 +3085,12 @@ def resolve_event_pick(state: Dict[str, Any], uid: str) -> None:
         return
     t = pick.get("type")
     if t == "remove":
-        run["deck"] = [c for c in run["deck"] if c["uid"] != uid]
+        take_card(run["deck"], uid)
         state["ui"]["toast"] = "Карта удалена."
     elif t == "upgrade":
-        for c in run["deck"]:
-            if c["uid"] == uid:
-                c["up"] = True
-                break
+        c = find_card(run["deck"], uid)
+        if c:
+            c["up"] = True
         state["ui"]["toast"] = "Карта улучшена (+)."
     run.pop("event_pick", None)
     run["event"] = None
@@ -1969,7 +3098,7 @@ def resolve_event_pick(state: Dict[str, Any], uid: str) -> None:
 
 def start_shop(state: Dict[str, Any]) -> None:
     run = state["run"]
-    rng = seeded_rng(run)
+    rng = seeded_rng(run, "shop")
     twist = run.get("room_twist")
     discount = float(twist.get("shop_discount", 1.0)) if twist else 1.0
     extra_offer = 1 if twist and twist.get("shop_discount") else 0
@@ -2012,7 +3141,7 @@ def shop_buy(state: Dict[str, Any], what: str, idx: Optional[int]=None) -> None:
             state["ui"]["toast"] = "Не хватает жетонов."
             return
         # удалим из 4 случайных
-        rng = seeded_rng(run)
+        rng = seeded_rng(run, "shop")
         picks = rng.sample(run["deck"], k=min(4, len(run["deck"])))
         run["shop_remove"] = {"price": svc["price"], "choices":[{"uid":c["uid"],"id":c["id"],"up":c.get("up",False)} for c in picks]}
         state["screen"] = "SHOP_REMOVE"
@@ -2027,7 +3156,7 @@ def shop_remove_confirm(state: Dict[str, Any], uid: str) -> None:
         state["ui"]["toast"] = "Не хватает жетонов."
         return
     run["gold"] -= price
-    run["deck"] = [c for c in run["deck"] if c["uid"] != uid]
+    take_card(run["deck"], uid)
     run.pop("shop_remove", None)
     state["screen"] = "SHOP"
     state["ui"]["toast"] = "Удалено."
@@ -2049,7 +3178,7 @@ def campfire_choice(state: Dict[str, Any], choice: str) -> None:
         state["ui"]["toast"] = f"Отдых: +{heal} HP."
         complete_floor_and_continue(state)
     elif choice == "upgrade":
-        rng = seeded_rng(run)
+        rng = seeded_rng(run, "rewards")
         picks = rng.sample(run["deck"], k=min(4, len(run["deck"])))
         run["campfire_up"] = {"choices":[{"uid":c["uid"],"id":c["id"],"up":c.get("up",False)} for c in picks]}
         state["screen"] = "CAMPFIRE_UP"
@@ -2057,17 +3186,16 @@ def campfire_choice(state: Dict[str, Any], choice: str) -> None:
 
 def campfire_upgrade_confirm(state: Dict[str, Any], uid: str) -> None:
     run = state["run"]
-    for c in run["deck"]:
-        if c["uid"] == uid:
-            c["up"] = True
-            break
+    c = find_card(run["deck"], uid)
+    if c:
+        c["up"] = True
     run.pop("campfire_up", None)
     state["ui"]["toast"] = "Карта улучшена."
     complete_floor_and_continue(state)
 
 def open_chest(state: Dict[str, Any]) -> None:
     run = state["run"]
-    rng = seeded_rng(run)
+    rng = seeded_rng(run, "rewards")
     gold = 35 + rng.randint(0, 25)
     run["gold"] += gold
     relic = random_relic(rng, run.get("relics", []))
@@ -2077,7 +3205,7 @@ def open_chest(state: Dict[str, Any]) -> None:
         relic_text = f" Реликвия: {content.RELIC_INDEX[relic]['name']}."
     # шанс на проклятье (гарантия, если есть компас)
     if has_relic(run, "WARDENS_COMPASS") or rng.random() < 0.4:
-        curse_id = rng.choice(content.CURSES)["id"]
+        curse_id = rng.choice(content.CURSE_IDS)
         add_curse_to_deck(run, curse_id, rng)
         relic_text += " Проклятье добавлено в колоду!"
     cid = generate_card_choices(run, rng, k=1)[0]
@@ -2094,13 +3222,13 @@ def act_end_select(state: Dict[str, Any], kind: str, uid: str) -> None:
         return
     if kind == "dup" and not ae.get("dup_done"):
         # найдём карту в колоде
-        src = next((c for c in run["deck"] if c["uid"] == uid), None)
+        src = find_card(run["deck"], uid)
         if src:
             add_card_to_deck(run, src["id"], bool(src.get("up", False)))
             ae["dup_done"] = True
             state["ui"]["toast"] = "Карта продублирована."
     if kind == "rem" and not ae.get("rem_done"):
-        run["deck"] = [c for c in run["deck"] if c["uid"] != uid]
+        take_card(run["deck"], uid)
         ae["rem_done"] = True
         state["ui"]["toast"] = "Карта удалена."
     # если оба сделаны — идём дальше
@@ -2147,7 +3275,7 @@ def start_inherit_if_possible(state: Dict[str, Any]) -> bool:
     last = state.get("meta", {}).get("last_deck", [])
     if not last:
         return False
-    rng = random.Random(int(time.time()))
+    rng = getattr(_ENTROPY, "rng", None) or random.Random(int(time.time()))
     picks = []
     for slot in range(3):
         options = rng.sample(last, k=min(5, len(last)))
@@ -2177,6 +3305,25 @@ def inherit_pick(state: Dict[str, Any], slot: int, idx: int) -> None:
 
 # ---- диспетчер действий ----
 
+def apply_action(state: Dict[str, Any], action: Any) -> bool:
+    """dispatch в детерминированном режиме; ошибка не роняет вызывающего, а уходит в тост."""
+    try:
+        adopt_state(state)
+        with deterministic(state):
+            dispatch(state, action)
+        return True
+    except Exception as e:
+        # чтобы фронт не зависал
+        state.setdefault("ui", {})["toast"] = f"Ошибка: {type(e).__name__}"
+        return False
+
+# Типы действий, которые понимает dispatch (остальные молча игнорируются).
+ACTION_TYPES = frozenset({
+    "NEW_RUN", "CONTINUE", "INHERIT_PICK", "CHOOSE_ROOM", "PLAY_CARD", "END_TURN", "RESOLVE_PENDING",
+    "PICK_REWARD", "EVENT_OPT", "EVENT_PICK", "SHOP_BUY", "SHOP_REMOVE", "SHOP_LEAVE", "CAMPFIRE",
+    "CAMPFIRE_UP", "ACT_END", "CONTINUE_ENDLESS", "SET_DIFFICULTY",
+})
+
 def dispatch(state: Dict[str, Any], action: Dict[str, Any]) -> None:
     typ = action.get("type")
     state.setdefault("ui", {}).setdefault("toast", "")
@@ -2259,3 +3406,6 @@ def dispatch(state: Dict[str, Any], action: Dict[str, Any]) -> None:
         state["ui"]["toast"] = "Сложность изменена."
         return
 
+
+# Проверяем и компилируем эффекты всех карт сразу при импорте.
+compile_content()
@@ -0,0 +1,206 @@
+# replay.py
+# Детерминированный повтор: (начальное состояние, список действий) -> итоговое состояние.
+# Все действия идут через game.apply_action (deterministic(): сиды и uid из state["entropy"]),
+# поэтому повтор совпадает с записью до байта, кроме меток времени и журнала боя.
+#
+#   python replay.py record --seed 7 --floors 40 --out run.json
+#   python replay.py check run.json
+#
+# Годится для разбора падений (повтор журнала сервера поверх снимка), восстановления
+# сейвов и регрессионных корпусов: запись, сделанная до изменения движка, после него
+# либо совпадает, либо показывает первые расходящиеся поля.
+
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+import argparse, hashlib, json, random, sys, time
+
+import game
+
+LOG_VERSION = 1
+
+# Поля, которые законно различаются между записью и повтором.
+VOLATILE_KEYS = {"updated_at", "started_at", "last_seen_at", "log", "_rng", "_buff_hooks"}
+
+
+def _canon(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _canon(v) for k, v in obj.items() if k not in VOLATILE_KEYS}
+    if isinstance(obj, (list, tuple)):
+        return [_canon(v) for v in obj]
+    return obj
+
+
+def _plain_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Живое состояние -> JSON-копия без VOLATILE_KEYS, как в сейве (записи через to_dict)."""
+    return json.loads(json.dumps(_canon(state), ensure_ascii=False, default=game.json_default))
+
+
+def state_digest(state: Dict[str, Any]) -> str:
+    """sha256 канонического JSON состояния без VOLATILE_KEYS."""
+    blob = json.dumps(_canon(state), ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+                      default=game.json_default)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def diff_states(a: Any, b: Any, limit: int = 10, path: str = "") -> List[str]:
+    """Первые limit расхождений в виде JSON-путей (для разбора, а не для патчей)."""
+    out: List[str] = []
+
+    def walk(x, y, p):
+        if len(out) >= limit:
+            return
+        if isinstance(x, dict) and isinstance(y, dict):
+            for k in sorted(set(x) | set(y), key=str):
+                if k in VOLATILE_KEYS:
+                    continue
+                if k not in x or k not in y:
+                    out.append(f"{p}/{k}: {'нет' if k not in x else 'есть'} -> {'нет' if k not in y else 'есть'}")
+                else:
+                    walk(x[k], y[k], f"{p}/{k}")
+                if len(out) >= limit:
+                    return
+        elif isinstance(x, (list, tuple)) and isinstance(y, (list, tuple)):
+            if len(x) != len(y):
+                out.append(f"{p}: длина {len(x)} -> {len(y)}")
+                return
+            for i, (u, v) in enumerate(zip(x, y)):
+                walk(u, v, f"{p}/{i}")
+        elif x != y:
+            out.append(f"{p}: {x!r} -> {y!r}")
+
+    walk(a, b, path)
+    return out
+
+
+class ReplayResult:
+    __slots__ = ("state", "actions", "errors", "seconds", "digest", "diffs")
+
+    def __init__(self, state, actions, errors, seconds, digest, diffs):
+        self.state = state
+        self.actions = actions
+        self.errors = errors
+        self.seconds = seconds
+        self.digest = digest
+        self.diffs = diffs
+
+    @property
+    def ok(self) -> bool:
+        return not self.diffs
+
+
+def replay(initial: Dict[str, Any], actions: Iterable[Dict[str, Any]], *,
+           expect: Optional[Dict[str, Any]] = None, expect_digest: Optional[str] = None) -> ReplayResult:
+    """Прогнать действия поверх копии initial. С expect/expect_digest — сверить итог."""
+    state = json.loads(json.dumps(initial, ensure_ascii=False, default=game.json_default))
+    prev = game.LOG_VERBOSITY
+    game.set_log_verbosity(0)
+    n = errors = 0
+    t0 = time.perf_counter()
+    try:
+        for action in actions:
+            if not game.apply_action(state, action):
+                errors += 1
+            n += 1
+    finally:
+        game.set_log_verbosity(prev)
+    seconds = time.perf_counter() - t0
+    digest = state_digest(state)
+    diffs: List[str] = []
+    if expect is not None:
+        diffs = diff_states(expect, _plain_state(state))
+    elif expect_digest is not None and expect_digest != digest:
+        diffs = [f"digest {expect_digest[:12]} -> {digest[:12]}"]
+    return ReplayResult(state, n, errors, seconds, digest, diffs)
+
+
+def replay_log(log: Dict[str, Any]) -> ReplayResult:
+    return replay(log["initial"], log["actions"], expect=log.get("final"), expect_digest=log.get("digest"))
+
+
+# ---- запись ----
+
+def _depth(run: Dict[str, Any]) -> int:
+    return int(run.get("loop", 0)) * 10 + int(run.get("floor", 1))
+
+
+def record_bot_run(seed: int, *, floors: int = 40, policy: str = "greedy", difficulty: int = 1,
+                   god_hp: Optional[int] = 10_000, max_actions: int = 20_000) -> Dict[str, Any]:
+    """Записать забег бота simulate.py до floors этажей (с бесконечными петлями после победы).
+
+    god_hp — стартовое HP забега, чтобы бот гарантированно дошёл до глубоких этажей;
+    начальное состояние фиксируется уже с ним, так что повтор честный.
+    """
+    from simulate import POLICIES
+    random.seed(seed)
+    state = game.default_state()
+    state["entropy"] = {"seed": seed, "ctr": 0}
+    game.apply_action(state, {"type": "SET_DIFFICULTY", "difficulty": difficulty})
+    game.apply_action(state, {"type": "NEW_RUN"})
+    if god_hp:
+        state["run"]["hp"] = state["run"]["max_hp"] = god_hp
+    initial = json.loads(json.dumps(state, ensure_ascii=False, default=game.json_default))
+    bot = POLICIES[policy](random.Random(seed ^ 0x5EED))
+    actions: List[Dict[str, Any]] = []
+    while len(actions) < max_actions:
+        screen = state.get("screen")
+        if screen == "DEFEAT":
+            break
+        if screen == "VICTORY":
+            action = {"type": "CONTINUE_ENDLESS"}
+        else:
+            if _depth(state["run"]) > floors:
+                break
+            action = bot.act(state)
+        game.apply_action(state, action)
+        actions.append(action)
+    final = _plain_state(state)
+    return {"version": LOG_VERSION, "seed": seed, "initial": initial, "actions": actions,
+            "final": final, "digest": state_digest(final)}
+
+
+def load_journal(path: str) -> List[Dict[str, Any]]:
+    """Действия из журнала сервера (<sid>.journal) по порядку, до первой битой строки."""
+    actions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                actions.append(json.loads(line)["a"])
+            except (ValueError, KeyError, TypeError):
+                break
+    return actions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Запись и детерминированный повтор забегов.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rec = sub.add_parser("record", help="записать забег бота")
+    rec.add_argument("--seed", type=int, default=1)
+    rec.add_argument("--floors", type=int, default=40)
+    rec.add_argument("--policy", default="greedy")
+    rec.add_argument("--out", required=True)
+    chk = sub.add_parser("check", help="повторить запись и сверить итог")
+    chk.add_argument("logs", nargs="+")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "record":
+        log = record_bot_run(args.seed, floors=args.floors, policy=args.policy)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(log, f, ensure_ascii=False, separators=(",", ":"), default=game.json_default)
+        print(f"{args.out}: {len(log['actions'])} действий, этаж {_depth(log['final'].get('run') or {})}")
+        return 0
+
+    failed = 0
+    for path in args.logs:
+        with open(path, "r", encoding="utf-8") as f:
+            log = json.load(f)
+        res = replay_log(log)
+        status = "OK" if res.ok else "РАСХОЖДЕНИЕ"
+        print(f"{path}: {status}, {res.actions} действий за {res.seconds * 1000:.0f} мс")
+        for d in res.diffs:
+            print("   ", d)
+        failed += not res.ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
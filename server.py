@@ -3,10 +3,13 @@
 # Запуск: python server.py  (или flask --app server run)
 
 from __future__ import annotations
-from typing import Dict, Any, Optional
-import os, json, tempfile, socket
+from typing import Dict, Any, Optional, Iterator, List, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+import os, sys, json, tempfile, socket, threading, time, atexit, uuid, bisect, random, hmac, hashlib
+import cProfile, pstats
 
-from flask import Flask, request, send_from_directory, jsonify
+from flask import Flask, request, send_from_directory, jsonify, Response
 
 import game
 import content
@@ -20,72 +23,859 @@ app = Flask(__name__, static_folder="static", static_url_path="/static")
 DEFAULT_HOST = os.environ.get("MPRL_HOST", "127.0.0.1")
 DEFAULT_PORT = int(os.environ.get("MPRL_PORT", "5173"))
 
+# Кэш живых сессий: сколько держим в памяти, через сколько секунд простоя выгружаем,
+# и как часто фоновый писатель сбрасывает изменённые сейвы на диск (0 = писать сразу).
+CACHE_SIZE = int(os.environ.get("MPRL_CACHE_SIZE", "256"))
+CACHE_IDLE_SEC = float(os.environ.get("MPRL_CACHE_IDLE", "900"))
+FLUSH_INTERVAL_SEC = float(os.environ.get("MPRL_FLUSH_INTERVAL", "2.0"))
+
+# Журнал действий: каждые SNAPSHOT_EVERY действий (и на смене экрана) пишем полный снимок,
+# между снимками — по одной короткой строке на действие в <sid>.journal.
+SNAPSHOT_EVERY = int(os.environ.get("MPRL_SNAPSHOT_EVERY", "25"))
+
+# Дельта-ответы: если патч выходит длиннее, отдаём полное состояние.
+PATCH_MAX_OPS = int(os.environ.get("MPRL_PATCH_MAX_OPS", "400"))
+
+# ---- метрики ----
+# Счётчики и гистограммы в памяти процесса; /api/metrics отдаёт их в текстовом формате
+# Prometheus. Замер — пара perf_counter и инкремент под общим замком, микросекунды на запрос.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+_METRICS_LOCK = threading.Lock()
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    parts = [f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name, self.doc, self.labels = name, doc, labels
+        self.values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, labels: Tuple[Any, ...] = (), n: float = 1) -> None:
+        with _METRICS_LOCK:
+            self.values[labels] = self.values.get(labels, 0) + n
+
+    def inc_many(self, items: Dict[Tuple[Any, ...], float]) -> None:
+        with _METRICS_LOCK:
+            for labels, n in items.items():
+                self.values[labels] = self.values.get(labels, 0) + n
+
+    def get(self, labels: Tuple[Any, ...] = ()) -> float:
+        return self.values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with _METRICS_LOCK:
+            items = sorted(self.values.items())
+        out.extend(f"{self.name}{_label_str(self.labels, k)} {v:g}" for k, v in items)
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.doc, self.labels, self.buckets = name, doc, labels, buckets
+        # labels -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self.values: Dict[Tuple[Any, ...], List[float]] = {}
+
+    def observe(self, value: float, labels: Tuple[Any, ...] = ()) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with _METRICS_LOCK:
+            row = self.values.get(labels)
+            if row is None:
+                row = self.values[labels] = [0] * (len(self.buckets) + 2)
+            row[i] += 1
+            row[-1] += value
+
+    def count(self, labels: Tuple[Any, ...] = ()) -> int:
+        row = self.values.get(labels)
+        return int(sum(row[:-1])) if row else 0
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with _METRICS_LOCK:
+            items = sorted((k, list(v)) for k, v in self.values.items())
+        for k, row in items:
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                acc += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                out.append(f"{self.name}_bucket{_label_str(self.labels, k, le)} {acc:g}")
+            out.append(f"{self.name}_sum{_label_str(self.labels, k)} {row[-1]:.6f}")
+            out.append(f"{self.name}_count{_label_str(self.labels, k)} {acc:g}")
+        return out
+
+
+PHASE_SECONDS = Histogram("mprl_phase_seconds",
+                          "Время фаз обработки запроса: checkout (замок + загрузка), dispatch, sanitize, diff, encode.",
+                          ("action", "phase"))
+SESSION_LOAD_SECONDS = Histogram("mprl_session_load_seconds", "Загрузка сессии с диска (снимок + журнал).")
+SAVE_SECONDS = Histogram("mprl_save_seconds", "Запись сессии на диск.", ("kind",))
+SAVE_BYTES = Counter("mprl_save_bytes_total", "Байт записано на диск.", ("kind",))
+CORRUPT_RECOVERIES = Counter("mprl_corrupt_recoveries_total",
+                             "Битые снимки: восстановлено по журналу или сброшено в новое состояние.", ("outcome",))
+ACTION_ERRORS = Counter("mprl_action_errors_total",
+                        "Исключения в game.dispatch, проглоченные game.apply_action (ушли в тост).", ("action",))
+WRITER_ERRORS = Counter("mprl_writer_errors_total", "Исключения фонового писателя сейвов.")
+PAYLOAD_BYTES = Counter("mprl_payload_bytes_total",
+                        "Байт ответа по разделам view (компактный JSON в UTF-8, до сжатия); kind — state или patch.",
+                        ("screen", "kind", "section"))
+RESPONSE_BYTES = Histogram("mprl_response_bytes", "Размер view или патча в ответе по экранам.",
+                           ("screen", "kind"), buckets=SIZE_BUCKETS)
+METRICS = [PHASE_SECONDS, SESSION_LOAD_SECONDS, SAVE_SECONDS, SAVE_BYTES, CORRUPT_RECOVERIES,
+           ACTION_ERRORS, WRITER_ERRORS, PAYLOAD_BYTES, RESPONSE_BYTES]
+
+
+def action_label(action: Any) -> str:
+    # тип действия приходит от клиента: в метки — только известные, иначе рост числа рядов
+    typ = action.get("type") if isinstance(action, dict) else None
+    return typ if typ in game.ACTION_TYPES else "other"
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for m in METRICS:
+        lines.extend(m.render())
+    lines += ["# HELP mprl_sessions_cached Сессий в памяти.", "# TYPE mprl_sessions_cached gauge",
+              f"mprl_sessions_cached {len(SESSIONS)}"]
+    return "\n".join(lines) + "\n"
+
+
+# ---- профилирование dispatch по требованию ----
+# Выключено — act() проверяет один глобальный None и зовёт game.apply_action напрямую.
+# Включается переменной MPRL_PROFILE ("next:200" — следующие 200 действий, "sample:0.01" —
+# случайный 1%) или POST /api/profile с токеном MPRL_ADMIN_TOKEN. Результат — по файлу на
+# тип действия в MPRL_PROFILE_DIR/<метка времени>/: <ACTION>.pstats (cProfile, для snakeviz/
+# pstats) или <ACTION>.collapsed («a;b;c мкс» — вход flamegraph.pl/speedscope).
+
+PROFILE_DIR = os.environ.get("MPRL_PROFILE_DIR", os.path.join(APP_DIR, "profiles"))
+ADMIN_TOKEN = os.environ.get("MPRL_ADMIN_TOKEN", "")
+PROFILE_FORMATS = ("pstats", "collapsed")
+PROFILE_FLUSH_EVERY = 100   # в режиме выборки без лимита — сбрасывать файлы каждые N профилей
+
+
+class _StackTracer:
+    """sys.setprofile-трассировщик: собственное время (нс) каждого полного стека вызовов."""
+
+    def __init__(self, root: str, totals: Dict[Tuple[str, ...], int]):
+        self.stack: List[str] = [root]
+        self.totals = totals
+        self.last = time.perf_counter_ns()
+
+    def _charge(self, now: int) -> None:
+        key = tuple(self.stack)
+        self.totals[key] = self.totals.get(key, 0) + now - self.last
+        self.last = now
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        if event == "call":
+            self._charge(now)
+            code = frame.f_code
+            self.stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        elif event == "c_call":
+            self._charge(now)
+            self.stack.append(f"<{getattr(arg, '__qualname__', getattr(arg, '__name__', '?'))}>")
+        elif event in ("return", "c_return", "c_exception"):
+            self._charge(now)
+            if len(self.stack) > 1:
+                self.stack.pop()
+        self.last = time.perf_counter_ns()
+
+
+class DispatchProfiler:
+    """Профиль следующих count вызовов dispatch или случайной доли sample (до count, если задан)."""
+
+    def __init__(self, out_dir: str, fmt: str = "pstats", count: Optional[int] = None,
+                 sample: float = 1.0, seed: Optional[int] = None):
+        if fmt not in PROFILE_FORMATS:
+            raise ValueError(f"формат профиля: {', '.join(PROFILE_FORMATS)}")
+        if count is None and sample >= 1.0:
+            raise ValueError("нужен count или sample < 1")
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.left = count
+        self.sample = float(sample)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.profiled = 0
+        self.since_flush = 0
+        self.pstats: Dict[str, Any] = {}                              # action -> pstats.Stats
+        self.stacks: Dict[str, Dict[Tuple[str, ...], int]] = {}       # action -> стек -> нс
+
+    @property
+    def done(self) -> bool:
+        return self.left is not None and self.left <= 0
+
+    def __call__(self, state: Dict[str, Any], action: Any, label: str) -> bool:
+        if self.sample < 1.0 and self.rng.random() >= self.sample:
+            return game.apply_action(state, action)
+        # профили не пересекаются: cProfile/setprofile одного потока и общие агрегаты
+        with self.lock:
+            if self.done:
+                return game.apply_action(state, action)
+            if self.fmt == "pstats":
+                prof = cProfile.Profile()
+                ok = prof.runcall(game.apply_action, state, action)
+                if label in self.pstats:
+                    self.pstats[label].add(prof)
+                else:
+                    self.pstats[label] = pstats.Stats(prof)
+            else:
+                tracer = _StackTracer(f"dispatch[{label}]", self.stacks.setdefault(label, {}))
+                sys.setprofile(tracer)
+                try:
+                    ok = game.apply_action(state, action)
+                finally:
+                    sys.setprofile(None)
+            self.profiled += 1
+            self.since_flush += 1
+            if self.left is not None:
+                self.left -= 1
+            if self.done or (self.left is None and self.since_flush >= PROFILE_FLUSH_EVERY):
+                self._flush()
+        return ok
+
+    def _flush(self) -> List[str]:
+        # вызывать под self.lock
+        os.makedirs(self.out_dir, exist_ok=True)
+        written = []
+        for label, st in self.pstats.items():
+            p = os.path.join(self.out_dir, f"{label}.pstats")
+            st.dump_stats(p)
+            written.append(p)
+        for label, totals in self.stacks.items():
+            p = os.path.join(self.out_dir, f"{label}.collapsed")
+            with open(p, "w", encoding="utf-8") as f:
+                f.writelines(f"{';'.join(k)} {max(1, v // 1000)}\n" for k, v in sorted(totals.items()) if v > 0)
+            written.append(p)
+        self.since_flush = 0
+        return written
+
+    def flush(self) -> List[str]:
+        with self.lock:
+            return self._flush()
+
+    def status(self) -> Dict[str, Any]:
+        return {"format": self.fmt, "dir": self.out_dir, "left": self.left, "sample": self.sample,
+                "profiled": self.profiled, "actions": sorted(set(self.pstats) | set(self.stacks))}
+
+
+_PROFILE_HOOK: Optional[DispatchProfiler] = None
+_PROFILE_LOCK = threading.Lock()
+
+
+def start_profiling(fmt: str = "pstats", count: Optional[int] = None, sample: float = 1.0,
+                    out_dir: Optional[str] = None) -> DispatchProfiler:
+    """Включить профилирование (прежний профиль сбрасывается на диск и заменяется)."""
+    global _PROFILE_HOOK
+    if out_dir is None:
+        out_dir = base = os.path.join(PROFILE_DIR, time.strftime("%Y%m%d-%H%M%S"))
+        n = 1
+        while os.path.exists(out_dir):
+            n += 1
+            out_dir = f"{base}-{n}"
+    prof = DispatchProfiler(out_dir, fmt, count, sample)
+    with _PROFILE_LOCK:
+        old, _PROFILE_HOOK = _PROFILE_HOOK, prof
+    if old is not None:
+        old.flush()
+    return prof
+
+
+def stop_profiling() -> Optional[Dict[str, Any]]:
+    """Выключить и дописать файлы. Вернёт статус с путями или None, если не было профиля."""
+    global _PROFILE_HOOK
+    with _PROFILE_LOCK:
+        prof, _PROFILE_HOOK = _PROFILE_HOOK, None
+    if prof is None:
+        return None
+    files = prof.flush()
+    return {**prof.status(), "files": files}
+
+
+def parse_profile_spec(spec: str) -> Dict[str, Any]:
+    """'next:200' / 'sample:0.01' / 'sample:0.01:500' -> kwargs для start_profiling."""
+    kind, _, rest = spec.partition(":")
+    parts = rest.split(":") if rest else []
+    if kind == "next" and len(parts) == 1:
+        return {"count": int(parts[0])}
+    if kind == "sample" and 1 <= len(parts) <= 2:
+        return {"sample": float(parts[0]), "count": int(parts[1]) if len(parts) == 2 else None}
+    raise ValueError(f"MPRL_PROFILE: ожидалось next:N или sample:P[:N], а не {spec!r}")
+
+
+def _dispatch(state: Dict[str, Any], action: Any, label: str) -> bool:
+    hook = _PROFILE_HOOK
+    if hook is None:
+        return game.apply_action(state, action)
+    if hook.done:
+        stop_profiling()
+        return game.apply_action(state, action)
+    return hook(state, action, label)
+
+
+def _safe_sid(sid: str) -> str:
+    return "".join(ch for ch in sid if ch.isalnum() or ch in "_-")
+
 def save_path(sid: str) -> str:
-    safe = "".join(ch for ch in sid if ch.isalnum() or ch in "_-")
-    return os.path.join(SAVE_DIR, f"{safe}.json")
+    return os.path.join(SAVE_DIR, f"{_safe_sid(sid)}.json")
 
-def load_state(sid: str) -> Dict[str, Any]:
+def journal_path(sid: str) -> str:
+    return os.path.join(SAVE_DIR, f"{_safe_sid(sid)}.journal")
+
+def _journal_line(seq: int, action: Any) -> str:
+    return json.dumps({"n": seq, "a": action}, ensure_ascii=False, separators=(",", ":"))
+
+def _journal_seq(line: str) -> Optional[int]:
+    try:
+        return int(json.loads(line)["n"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def replay_journal(sid: str, st: Dict[str, Any]) -> int:
+    """Догнать снимок по журналу. Вернёт число повторённых действий."""
+    p = journal_path(sid)
+    if not os.path.exists(p):
+        return 0
+    seq = int(st.get("journal_seq", 0))
+    replayed = 0
+    with open(p, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                n = int(rec["n"])
+                action = rec["a"]
+            except (ValueError, KeyError, TypeError):
+                break  # недописанный хвост после падения
+            if n < seq:
+                continue
+            if n > seq:
+                break  # дыра в журнале — дальше верить нельзя
+            game.apply_action(st, action)
+            seq += 1
+            st["journal_seq"] = seq
+            replayed += 1
+    return replayed
+
+def _set_aside(path: str) -> None:
+    """Убрать битый файл с дороги в <path>.corrupt, не затирая отложенный раньше."""
+    corrupt = path + ".corrupt"
+    if os.path.exists(corrupt):
+        corrupt = path + f".{game.now_ts()}.corrupt"
+    os.replace(path, corrupt)
+
+def _load_snapshot(sid: str) -> Tuple[Optional[Dict[str, Any]], bool]:
     p = save_path(sid)
     was_corrupt = False
-    if os.path.exists(p):
+    for cand in (p, p + ".bak"):
+        if not os.path.exists(cand):
+            continue
         try:
-            with open(p, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(cand, "r", encoding="utf-8") as f:
+                return json.load(f), was_corrupt
         except json.JSONDecodeError:
-            # битый сейв — переименуем и продолжим с новым
+            # битый снимок — отложим в сторону и попробуем предыдущий + журнал
             was_corrupt = True
-            corrupt = p + ".corrupt"
-            if os.path.exists(corrupt):
-                corrupt = p + f".{game.now_ts()}.corrupt"
-            os.replace(p, corrupt)
+            _set_aside(cand)
         except Exception:
-            # любой другой сбой — сбрасываем состояние, но не падаем
+            # любой другой сбой — пробуем дальше, но не падаем
             was_corrupt = True
-    st = game.default_state()
+    return None, was_corrupt
+
+def _load_session(sid: str) -> Tuple[Dict[str, Any], int]:
+    """Снимок + хвост журнала. Вернёт состояние и journal_seq самого снимка."""
+    st, was_corrupt = _load_snapshot(sid)
+    if st is None:
+        st = game.default_state()
+        if was_corrupt:
+            # целого снимка нет, а журнал без него не повторить: сид entropy (и с ним
+            # забег) жил только в снимке. Откладываем журнал рядом, чтобы новые записи
+            # с n=0 не смешались со старыми и его можно было разобрать руками.
+            if os.path.exists(journal_path(sid)):
+                _set_aside(journal_path(sid))
+            CORRUPT_RECOVERIES.inc(("reset",))
+            st.setdefault("ui", {})["toast"] = "Сейв повреждён и восстановлен."
+        return st, 0
+    game.adopt_state(st)
+    snap_seq = int(st.get("journal_seq", 0))
+    replay_journal(sid, st)
     if was_corrupt:
-        st.setdefault("ui", {})["toast"] = "Сейв повреждён и восстановлен."
-    return st
+        CORRUPT_RECOVERIES.inc(("journal",))
+        st.setdefault("ui", {})["toast"] = "Сейв восстановлен по журналу."
+    return st, snap_seq
+
+def load_state(sid: str) -> Dict[str, Any]:
+    return _load_session(sid)[0]
+
+# рабочие поля боя: пересобираются движком по требованию, на диск не пишутся
+TRANSIENT_COMBAT_KEYS = frozenset({"_rng", "_buff_hooks"})
 
-def _strip_transient(state: Dict[str, Any]):
+def _persistable(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Состояние для записи: бой — копией без TRANSIENT_COMBAT_KEYS и с журналом строками.
+    Живое состояние (и кольцо CombatLog в нём) не трогаем."""
     run = state.get("run")
-    if not run:
-        return
-    combat = run.get("combat")
-    if combat:
-        combat.pop("_rng", None)
+    combat = run.get("combat") if run else None
+    if not combat:
+        return state
+    combat = {k: v for k, v in combat.items() if k not in TRANSIENT_COMBAT_KEYS}
+    game.render_log(combat)
+    return dict(state, run=dict(run, combat=combat))
 
-def save_state(sid: str, st: Dict[str, Any]) -> None:
-    p = save_path(sid)
-    st["updated_at"] = game.now_ts()
-    _strip_transient(st)
+def _atomic_write(p: str, data: str) -> int:
+    """Записать файл целиком через временный и rename. Вернёт число записанных байт."""
+    raw = data.encode("utf-8")
     tmp_fd, tmp_path = tempfile.mkstemp(prefix="save_", suffix=".tmp", dir=SAVE_DIR)
     try:
-        with os.fdopen(tmp_fd, "w", encoding="utf-8") as f:
-            json.dump(st, f, ensure_ascii=False, indent=2)
+        with os.fdopen(tmp_fd, "wb") as f:
+            f.write(raw)
         os.replace(tmp_path, p)
     finally:
         if os.path.exists(tmp_path):
             os.remove(tmp_path)
+    return len(raw)
+
+def save_state(sid: str, st: Dict[str, Any]) -> int:
+    """Полный снимок. Предыдущий остаётся в <sid>.json.bak на случай порчи нового."""
+    p = save_path(sid)
+    st["updated_at"] = game.now_ts()
+    data = json.dumps(_persistable(st), ensure_ascii=False, indent=2, default=game.json_default)
+    if os.path.exists(p):
+        os.replace(p, p + ".bak")
+    return _atomic_write(p, data)
+
+def append_journal(sid: str, lines: List[str]) -> int:
+    raw = "".join(line + "\n" for line in lines).encode("utf-8")
+    with open(journal_path(sid), "ab") as f:
+        f.write(raw)
+    return len(raw)
+
+def compact_journal(sid: str, keep_from: int, lines: List[str]) -> int:
+    """Оставить в журнале только то, что нужно для восстановления из .bak (n >= keep_from)."""
+    p = journal_path(sid)
+    kept: List[str] = []
+    if os.path.exists(p):
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                n = _journal_seq(line)
+                if n is not None and n >= keep_from:
+                    kept.append(line.rstrip("\n"))
+    kept.extend(lines)
+    return _atomic_write(p, "".join(line + "\n" for line in kept))
+
+def _ptr(token: Any) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+def _same(a: Any, b: Any) -> bool:
+    """Равенство в смысле JSON: == в Python считает True == 1 и [True] == [1]."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return len(a) == len(b) and all(k in b and _same(v, b[k]) for k, v in a.items())
+    if isinstance(a, list):
+        return len(a) == len(b) and all(map(_same, a, b))
+    return a == b
+
+def json_patch(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """RFC 6902 патч old -> new (только add/remove/replace)."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: List[Dict[str, Any]] = []
+        for k, v in old.items():
+            if k not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_ptr(k)}"})
+            elif v is not new[k]:
+                ops.extend(json_patch(v, new[k], f"{path}/{_ptr(k)}"))
+        for k, v in new.items():
+            if k not in old:
+                ops.append({"op": "add", "path": f"{path}/{_ptr(k)}", "value": v})
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        # общий хвост не трогаем — так вынутая из середины руки карта даёт один remove
+        head, tail = 0, 0
+        if len(old) != len(new):
+            limit = min(len(old), len(new))
+            # == отсекает разные быстро (на C), _same добивает bool/int внутри равных
+            while head < limit and old[head] == new[head] and _same(old[head], new[head]):
+                head += 1
+            while tail < limit - head and old[-1 - tail] == new[-1 - tail] and _same(old[-1 - tail], new[-1 - tail]):
+                tail += 1
+        ops = []
+        mid_old, mid_new = len(old) - tail, len(new) - tail
+        common = min(mid_old, mid_new)
+        for i in range(head, common):
+            if old[i] is not new[i]:
+                ops.extend(json_patch(old[i], new[i], f"{path}/{i}"))
+        for _ in range(common, mid_old):
+            ops.append({"op": "remove", "path": f"{path}/{common}"})
+        for i in range(common, mid_new):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+        return ops
+    if type(old) is not type(new) or old != new:
+        return [{"op": "replace", "path": path, "value": new}]
+    return []
+
+# Разделы view для учёта трафика: ключи верхнего уровня, а эти словари — на ключ глубже
+# (run.deck_view, run.combat_view.log, ...).
+PAYLOAD_SPLIT = ("run", "run.combat_view")
+
+
+def _compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def view_sizes(view: Dict[str, Any]) -> Dict[str, int]:
+    """Байты JSON по разделам view (только для учёта трафика полных ответов)."""
+    sizes: Dict[str, int] = {}
+
+    def walk(d: Dict[str, Any], prefix: str):
+        for k, v in d.items():
+            name = prefix + str(k)
+            if name in PAYLOAD_SPLIT and isinstance(v, dict):
+                walk(v, name + ".")
+            else:
+                sizes[name] = len(_compact(v).encode("utf-8"))
+    walk(view, "")
+    return sizes
+
+
+def patch_sizes(patch: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Байты операций патча по тем же разделам, что и view_sizes."""
+    sizes: Dict[str, int] = {}
+    for op in patch:
+        parts = op["path"].split("/")[1:]
+        name, i = parts[0], 1
+        while name in PAYLOAD_SPLIT and i < len(parts):
+            name += "." + parts[i]
+            i += 1
+        sizes[name] = sizes.get(name, 0) + len(_compact(op).encode("utf-8")) + 1
+    return sizes
+
+
+def _count_payload(screen: str, kind: str, sizes: Dict[str, int]) -> None:
+    PAYLOAD_BYTES.inc_many({(screen, kind, name): n for name, n in sizes.items()})
+    RESPONSE_BYTES.observe(sum(sizes.values()), (screen, kind))
+
+
+class _Session:
+    __slots__ = ("sid", "state", "dirty", "touched", "evicted", "lock",
+                 "journal", "since_snapshot", "need_snapshot", "snapshot_seq",
+                 "view", "view_rev", "view_n", "token")
+
+    def __init__(self, sid: str, state: Dict[str, Any], snapshot_seq: int = 0):
+        self.sid = sid
+        self.dirty = False
+        self.touched = time.monotonic()
+        self.evicted = False
+        self.lock = threading.Lock()
+        self.journal: List[str] = []      # строки журнала, ещё не записанные на диск
+        self.since_snapshot = 0
+        self.reset(state, snapshot_seq)
+        # последний отданный клиенту view — база для дельта-ответов (только в памяти)
+        self.view: Optional[Dict[str, Any]] = None
+        self.view_rev: Optional[str] = None
+        self.view_n = 0
+        self.token = uuid.uuid4().hex[:8]
+
+    def reset(self, state: Dict[str, Any], snapshot_seq: int) -> None:
+        self.state = state
+        self.need_snapshot = int(state.get("journal_seq", 0)) != snapshot_seq
+        self.snapshot_seq = snapshot_seq  # journal_seq последнего снимка на диске
+
+
+class SessionCache:
+    """LRU живых сессий + отложенная запись (write-behind).
+
+    Клик больше не читает и не переписывает сейв синхронно: состояние живёт в памяти,
+    а изменённые сессии сбрасываются на диск фоновым потоком раз в flush_interval секунд,
+    при вытеснении из LRU и при остановке процесса. Окно потери при аварийном падении —
+    не больше flush_interval секунд действий.
+
+    На диск идут строки журнала, а полный снимок — раз в snapshot_every действий,
+    на смене экрана, после ошибки, при вытеснении и остановке. Действия исполняются в game.deterministic(),
+    поэтому повтор журнала поверх снимка воспроизводит и новые uid, и сид нового забега.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, idle_sec: float = CACHE_IDLE_SEC,
+                 flush_interval: float = FLUSH_INTERVAL_SEC, snapshot_every: int = SNAPSHOT_EVERY):
+        self.max_size = max(1, int(max_size))
+        self.idle_sec = float(idle_sec)
+        self.flush_interval = float(flush_interval)
+        self.snapshot_every = max(1, int(snapshot_every))
+        self._items: "OrderedDict[str, _Session]" = OrderedDict()
+        self._retiring: Dict[str, _Session] = {}   # вытеснены из LRU, но ещё пишутся на диск
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _get(self, sid: str, fresh: Optional[Dict[str, Any]] = None) -> _Session:
+        # Под общим замком — только словарь LRU. На промахе кладём заглушку с уже захваченным
+        # sess.lock: запросы к этой сессии ждут на нём, а загрузка с диска и запись вытесненных
+        # идут вне общего замка и остальные сессии не задерживают.
+        load = prev = None
+        victims: List[_Session] = []
+        with self._lock:
+            sess = self._items.get(sid)
+            if fresh is not None or sess is None or sess.evicted:
+                prev = sess if sess is not None else self._retiring.get(sid)
+                if fresh is not None:
+                    if sess is not None:
+                        sess.evicted = True
+                    sess = _Session(sid, fresh)
+                    sess.dirty = sess.need_snapshot = True
+                else:
+                    sess = load = _Session(sid, {})
+                    load.lock.acquire()
+                self._items[sid] = sess
+            self._items.move_to_end(sid)
+            sess.touched = time.monotonic()
+            while len(self._items) > self.max_size:
+                _, old = self._items.popitem(last=False)
+                self._retiring[old.sid] = old
+                victims.append(old)
+        if load is not None:
+            try:
+                if prev is not None:
+                    # прежняя копия могла ещё не дописаться на диск — дождёмся (повторно не пишет)
+                    self._retire(prev)
+                t0 = time.perf_counter()
+                load.reset(*_load_session(sid))
+                SESSION_LOAD_SECONDS.observe(time.perf_counter() - t0)
+            except BaseException:
+                load.evicted = True
+                with self._lock:
+                    if self._items.get(sid) is load:
+                        del self._items[sid]
+                raise
+            finally:
+                load.lock.release()
+        for old in victims:
+            self._retire(old)
+            with self._lock:
+                if self._retiring.get(old.sid) is old:
+                    del self._retiring[old.sid]
+        return sess
+
+    @contextmanager
+    def _checkout(self, sid: str, fresh: Optional[Dict[str, Any]] = None) -> Iterator[_Session]:
+        self._ensure_writer()
+        while True:
+            sess = self._get(sid, fresh)
+            sess.lock.acquire()
+            if not sess.evicted:
+                break
+            # успели вытеснить между поиском и захватом — возьмём заново
+            sess.lock.release()
+            fresh = None
+        try:
+            yield sess
+        finally:
+            sess.dirty = True
+            if self.flush_interval <= 0:
+                self._write(sess)
+            sess.lock.release()
+
+    @contextmanager
+    def checkout(self, sid: str, fresh: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Эксклюзивный доступ к состоянию сессии. Изменения мимо журнала — значит, нужен снимок."""
+        with self._checkout(sid, fresh) as sess:
+            sess.need_snapshot = True
+            yield sess.state
+
+    def _respond(self, sess: _Session, base_rev: Optional[str], label: str,
+                 sizes_out: bool = False) -> Dict[str, Any]:
+        # вызывать под sess.lock; бой (с _rng и прочим) в клиентский view не попадает
+        t0 = time.perf_counter()
+        # sanitize_for_client уже отдаёт проекцию, не связанную с живым состоянием:
+        # она же база для следующего патча и уходит в ответ после снятия блокировки
+        view = game.sanitize_for_client(sess.state)
+        t1 = time.perf_counter()
+        PHASE_SECONDS.observe(t1 - t0, (label, "sanitize"))
+        prev, prev_rev = sess.view, sess.view_rev
+        sess.view_n += 1
+        sess.view = view
+        sess.view_rev = f"{sess.token}.{sess.view_n}"
+        out: Dict[str, Any] = {"rev": sess.view_rev}
+        kind = "state"
+        if base_rev and prev is not None and base_rev == prev_rev:
+            patch = json_patch(prev, view)
+            PHASE_SECONDS.observe(time.perf_counter() - t1, (label, "diff"))
+            if len(patch) <= PATCH_MAX_OPS:
+                out["patch"] = patch
+                kind, sizes = "patch", patch_sizes(patch)
+        if kind == "state":
+            out["state"] = view
+            sizes = view_sizes(view)
+        _count_payload(str(view.get("screen") or "none"), kind, sizes)
+        if sizes_out:
+            out["sizes"] = sizes
+        return out
+
+    def bootstrap(self, sid: str, fresh: Optional[Dict[str, Any]] = None,
+                  sizes_out: bool = False) -> Dict[str, Any]:
+        """Полное состояние для (пере)подключения клиента.
+
+        sizes_out — положить в ответ "sizes": байты по разделам view (для отладочного заголовка).
+        """
+        t0 = time.perf_counter()
+        with self._checkout(sid, fresh) as sess:
+            PHASE_SECONDS.observe(time.perf_counter() - t0, ("bootstrap", "checkout"))
+            st = sess.state
+            # лёгкая защита от несовпадений версии
+            if int(st.get("version", 0)) != game.SAVE_VERSION:
+                seq = st.get("journal_seq", 0)
+                st.clear()
+                st.update(game.default_state())
+                st["journal_seq"] = seq
+                sess.need_snapshot = True
+            return self._respond(sess, None, "bootstrap", sizes_out)
+
+    def act(self, sid: str, action: Any, base_rev: Optional[str] = None,
+            sizes_out: bool = False) -> Dict[str, Any]:
+        """Применить действие, записать его в журнал и вернуть ответ клиенту.
+
+        Если клиент прислал base_rev и он совпал с последним отданным view —
+        вместо state в ответе будет patch (RFC 6902) поверх этого view.
+        """
+        label = action_label(action)
+        t0 = time.perf_counter()
+        with self._checkout(sid) as sess:
+            t1 = time.perf_counter()
+            PHASE_SECONDS.observe(t1 - t0, (label, "checkout"))
+            st = sess.state
+            screen = st.get("screen")
+            # старый сейв без entropy: deterministic() заведёт сид сейчас, и он должен попасть
+            # в снимок — иначе повтор журнала после падения вытянет другой
+            seeded = isinstance(st.get("entropy"), dict)
+            ok = _dispatch(st, action, label)
+            PHASE_SECONDS.observe(time.perf_counter() - t1, (label, "dispatch"))
+            if not ok:
+                ACTION_ERRORS.inc((label,))
+            seq = int(st.get("journal_seq", 0))
+            sess.journal.append(_journal_line(seq, action))
+            st["journal_seq"] = seq + 1
+            sess.since_snapshot += 1
+            if not ok or st.get("screen") != screen or not seeded:
+                sess.need_snapshot = True
+            return self._respond(sess, base_rev, label, sizes_out)
+
+    def _write(self, sess: _Session) -> None:
+        # вызывать под sess.lock
+        if not sess.dirty:
+            return
+        sess.dirty = False
+        t0 = time.perf_counter()
+        if sess.need_snapshot or sess.since_snapshot >= self.snapshot_every:
+            prev_seq = sess.snapshot_seq
+            SAVE_BYTES.inc(("snapshot",), save_state(sess.sid, sess.state))
+            SAVE_BYTES.inc(("journal",), compact_journal(sess.sid, prev_seq, sess.journal))
+            sess.snapshot_seq = int(sess.state.get("journal_seq", 0))
+            sess.since_snapshot = 0
+            sess.need_snapshot = False
+            SAVE_SECONDS.observe(time.perf_counter() - t0, ("snapshot",))
+        elif sess.journal:
+            SAVE_BYTES.inc(("journal",), append_journal(sess.sid, sess.journal))
+            SAVE_SECONDS.observe(time.perf_counter() - t0, ("journal",))
+        sess.journal = []
+
+    def _seal(self, sess: _Session) -> None:
+        # вызывать под sess.lock. Хвост журнала при следующем запуске повторит уже тот движок,
+        # а точен повтор только на том же — поэтому уходящая из памяти сессия пишется снимком.
+        if sess.journal or sess.snapshot_seq != int(sess.state.get("journal_seq", 0)):
+            sess.dirty = sess.need_snapshot = True
+        self._write(sess)
+
+    def _retire(self, sess: _Session) -> None:
+        with sess.lock:
+            sess.evicted = True
+            self._seal(sess)
+
+    def flush(self) -> None:
+        """Сбросить на диск все изменённые сессии и выгрузить простаивающие."""
+        now = time.monotonic()
+        with self._lock:
+            sessions = list(self._items.values())
+        for sess in sessions:
+            if now - sess.touched > self.idle_sec:
+                # сначала пишем, потом убираем из LRU — иначе параллельный запрос прочтёт старый файл
+                self._retire(sess)
+                with self._lock:
+                    if self._items.get(sess.sid) is sess:
+                        del self._items[sess.sid]
+            elif sess.dirty:
+                with sess.lock:
+                    self._write(sess)
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._run_writer, name="mprl-save-writer", daemon=True)
+            self._writer.start()
+
+    def _run_writer(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # писатель не должен умирать из-за одного сейва
+                WRITER_ERRORS.inc()
+
+    def close(self) -> None:
+        """Остановить писателя и сбросить все сессии полными снимками."""
+        self._stop.set()
+        self.flush()
+        with self._lock:
+            sessions = list(self._items.values())
+        for sess in sessions:
+            with sess.lock:
+                self._seal(sess)
+
+
+SESSIONS = SessionCache()
+atexit.register(SESSIONS.close)
+atexit.register(stop_profiling)
+if os.environ.get("MPRL_PROFILE"):
+    start_profiling(os.environ.get("MPRL_PROFILE_FORMAT", "pstats"), **parse_profile_spec(os.environ["MPRL_PROFILE"]))
 
 @app.get("/")
 def index():
     return send_from_directory(app.static_folder, "index.html")
 
+def _want_sizes() -> bool:
+    # отладка трафика: "X-MPRL-Debug: sizes" в запросе — размеры разделов в заголовке ответа
+    return request.headers.get("X-MPRL-Debug") == "sizes"
+
+
+def _sized(resp: Response, sizes: Optional[Dict[str, int]]) -> Response:
+    if sizes is not None:
+        parts = [f"total={sum(sizes.values())}"]
+        parts += [f"{k}={v}" for k, v in sorted(sizes.items(), key=lambda kv: -kv[1])]
+        resp.headers["X-MPRL-Payload-Sizes"] = ", ".join(parts)
+    return resp
+
+
 @app.post("/api/bootstrap")
 def api_bootstrap():
     data = request.get_json(silent=True) or {}
     sid = data.get("sid")
     if not sid:
         sid = game.make_uid("sid")
-        st = game.default_state()
-        save_state(sid, st)
-        return jsonify({"sid": sid, "state": game.sanitize_for_client(st)})
-    st = load_state(sid)
-    # лёгкая защита от несовпадений версии
-    if int(st.get("version", 0)) != game.SAVE_VERSION:
-        st = game.default_state()
-    save_state(sid, st)
-    return jsonify({"sid": sid, "state": game.sanitize_for_client(st)})
+        out = SESSIONS.bootstrap(sid, fresh=game.default_state(), sizes_out=_want_sizes())
+    else:
+        out = SESSIONS.bootstrap(sid, sizes_out=_want_sizes())
+    sizes = out.pop("sizes", None)
+    return _sized(jsonify({"sid": sid, "content_hash": CONTENT_HASH, **out}), sizes)
 
 @app.post("/api/action")
 def api_action():
@@ -94,17 +884,64 @@ def api_action():
     action = data.get("action", {})
     if not sid:
         return jsonify({"error":"missing sid"}), 400
-    st = load_state(sid)
+    # base_rev — версия state у клиента; при совпадении ответим патчем вместо полного state
+    out = SESSIONS.act(sid, action, data.get("base_rev"), sizes_out=_want_sizes())
+    sizes = out.pop("sizes", None)
+    t0 = time.perf_counter()
+    resp = jsonify({"sid": sid, **out})
+    PHASE_SECONDS.observe(time.perf_counter() - t0, (action_label(action), "encode"))
+    return _sized(resp, sizes)
+
+def _admin_denied(loopback_ok: bool = False) -> Optional[Tuple[Response, int]]:
+    """Отказ для служебного эндпоинта или None. С MPRL_ADMIN_TOKEN нужен токен в X-MPRL-Token
+    (или Authorization: Bearer — так его шлёт Prometheus). Без токена эндпоинта как будто нет;
+    loopback_ok — кроме запросов с этой же машины."""
+    if not ADMIN_TOKEN:
+        if loopback_ok and request.remote_addr in ("127.0.0.1", "::1"):
+            return None
+        return jsonify({"error": "not found"}), 404
+    sent = request.headers.get("X-MPRL-Token")
+    if sent is None:
+        sent = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(sent, ADMIN_TOKEN):
+        return jsonify({"error": "forbidden"}), 403
+    return None
+
+@app.route("/api/profile", methods=["GET", "POST"])
+def api_profile():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    hook = _PROFILE_HOOK
+    if request.method == "GET":
+        return jsonify({"active": hook is not None and not hook.done, **(hook.status() if hook else {})})
+    data = request.get_json(silent=True) or {}
+    mode = data.get("mode")
+    if mode == "off":
+        return jsonify({"active": False, **(stop_profiling() or {})})
     try:
-        game.dispatch(st, action)
-    except Exception as e:
-        # чтобы фронт не зависал
-        st.setdefault("ui", {})["toast"] = f"Ошибка: {type(e).__name__}"
-    save_state(sid, st)
-    return jsonify({"sid": sid, "state": game.sanitize_for_client(st)})
+        if mode == "next":
+            kw = {"count": int(data.get("count", 100))}
+        elif mode == "sample":
+            kw = {"sample": float(data.get("rate", 0.01)),
+                  "count": int(data["count"]) if data.get("count") is not None else None}
+        else:
+            raise ValueError("mode: next, sample или off")
+        prof = start_profiling(str(data.get("format", "pstats")), **kw)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"active": True, **prof.status()})
 
-@app.get("/api/content")
-def api_content():
+@app.get("/api/metrics")
+def api_metrics():
+    # метрики выдают число сессий, действия и трафик — чужим только с токеном
+    denied = _admin_denied(loopback_ok=True)
+    if denied:
+        return denied
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+def build_content_payload() -> Tuple[bytes, str]:
+    """Тело /api/content и его хэш: контент меняется только вместе с content.py."""
     # Кодекс: отдаём все карты (base + плюс-версию)
     cards = []
     for c in content.CARDS:
@@ -114,14 +951,34 @@ def api_content():
     for c in content.CURSES:
         base = content.get_card_def(c["id"], upgraded=False)
         cards.append({"base": base, "up": base})
-    return jsonify({
+    body = json.dumps({
         "cards": cards,
         "rarities": content.RARITIES,
         "card_types": content.CARD_TYPES,
         "statuses": content.STATUSES,
         "buffs": content.BUFFS,
         "relics": content.RELICS,
-    })
+    }, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+
+# Собираем один раз при старте; хэш уходит клиенту в /api/bootstrap (content_hash),
+# и тот держит кодекс в localStorage, пока хэш не сменится.
+CONTENT_BODY, CONTENT_HASH = build_content_payload()
+
+
+@app.get("/api/content")
+def api_content():
+    resp = Response(CONTENT_BODY, mimetype="application/json")
+    resp.set_etag(CONTENT_HASH)
+    if request.args.get("v") == CONTENT_HASH:
+        # адрес с хэшем не меняет содержимого — кэшируем насовсем
+        resp.cache_control.public = True
+        resp.cache_control.max_age = 31536000
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
 
 def _local_ipv4s() -> list[str]:
     ips = set()
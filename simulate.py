@@ -0,0 +1,362 @@
+# simulate.py
+# Безголовый прогон полных забегов ботами: баланс и регрессии без Flask и браузера.
+#
+#   python simulate.py --runs 2000 --policy greedy --difficulty 1 3 5 --out runs.csv
+#
+# Каждый забег идёт через game.dispatch ровно теми же действиями, что шлёт фронт.
+
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Iterator
+import argparse, csv, json, multiprocessing, os, random, sys, time
+from collections import Counter, defaultdict
+
+import content
+import game
+
+# страховка от зацикливания бота/игры
+MAX_ACTIONS = 6000
+MAX_PLAYS_PER_TURN = 40
+
+
+# ---- политики ботов ----
+
+class Policy:
+    """Бот: по состоянию выбирает следующее действие для game.dispatch.
+
+    Вне боя все политики ведут себя одинаково (и предсказуемо); отличаются розыгрышем карт.
+    Базовая играет первую доступную карту в первого живого врага.
+    """
+    name = "base"
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.plays_this_turn = 0
+        self.turn_key = None
+
+    def act(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        screen = state.get("screen")
+        handler = getattr(self, "on_" + str(screen).lower(), None)
+        if handler is None:
+            raise RuntimeError(f"бот не знает экран {screen!r}")
+        return handler(state, state.get("run"))
+
+    # -- бой --
+
+    def on_combat(self, state, run):
+        combat = run["combat"]
+        # отдельного id у боя нет: бой — это комната (круг, этаж, узел), плюс номер хода.
+        # Счётчик сбрасывается по нему, а не по своему END_TURN: бой может кончиться
+        # посреди хода, а следующий снова начнётся с хода 1
+        key = (run.get("loop"), run.get("floor"), run.get("current_node"), combat.get("turn"))
+        if key != self.turn_key:
+            self.turn_key, self.plays_this_turn = key, 0
+        pending = combat.get("pending")
+        if pending:
+            return {"type": "RESOLVE_PENDING", "payload": self.resolve_pending(combat, pending)}
+        if self.plays_this_turn < MAX_PLAYS_PER_TURN:
+            play = self.pick_play(combat, self.playable(combat))
+            if play is not None:
+                self.plays_this_turn += 1
+                inst, target = play
+                return {"type": "PLAY_CARD", "uid": inst["uid"], "target": target}
+        return {"type": "END_TURN"}
+
+    def playable(self, combat) -> List[Dict[str, Any]]:
+        mana = int(combat["player"].get("mana", 0))
+        out = []
+        for inst in combat.get("hand", []):
+            cdef = content.get_card_def(inst["id"], upgraded=bool(inst.get("up", False)))
+            if not game.is_curse_card(cdef) and game.card_cost(cdef, inst) <= mana:
+                out.append(inst)
+        return out
+
+    def alive(self, combat) -> List[int]:
+        return [i for i, e in enumerate(combat.get("enemies", [])) if e["hp"] > 0]
+
+    def weakest(self, combat) -> Optional[int]:
+        alive = self.alive(combat)
+        return min(alive, key=lambda i: combat["enemies"][i]["hp"]) if alive else None
+
+    def pick_play(self, combat, hand):
+        """(карта, цель) или None — закончить ход."""
+        alive = self.alive(combat)
+        return (hand[0], alive[0]) if hand and alive else None
+
+    def resolve_pending(self, combat, pending) -> Dict[str, Any]:
+        ptype = pending.get("type")
+        if ptype == "discard_choose":
+            # сначала сбрасываем проклятья, потом самое дорогое
+            def keep_value(inst):
+                cdef = content.get_card_def(inst["id"], upgraded=bool(inst.get("up", False)))
+                return (not game.is_curse_card(cdef), -int(cdef.get("cost", 0)))
+            hand = sorted(combat.get("hand", []), key=keep_value)
+            return {"uids": [c["uid"] for c in hand[: int(pending.get("n", 1))]]}
+        if ptype == "take_from_discard":
+            pile = combat.get("discard_pile", [])
+            # пустой сброс: несуществующий uid просто снимает выбор
+            return {"uid": pile[-1]["uid"] if pile else "-"}
+        return {"idx": 0}
+
+    # -- вне боя --
+
+    def on_map(self, state, run):
+        choices = run["room_choices"]
+        hp_low = int(run["hp"]) < int(run["max_hp"]) * 0.4
+        prefer = ("campfire", "event", "shop", "fight") if hp_low else ("fight", "event", "chest", "elite")
+        for kind in prefer:
+            for ch in choices:
+                if ch.get("type") == kind:
+                    return {"type": "CHOOSE_ROOM", "room_id": ch["id"]}
+        return {"type": "CHOOSE_ROOM", "room_id": choices[0]["id"]}
+
+    def on_reward(self, state, run):
+        cards = run["reward"]["cards"]
+        if not cards:
+            return {"type": "PICK_REWARD", "card_id": None}
+        rank = {r: i for i, r in enumerate(content.RARITIES)}
+        best = max(cards, key=lambda cid: rank.get(content.get_card_def(cid).get("rarity"), 0))
+        return {"type": "PICK_REWARD", "card_id": best}
+
+    def on_event(self, state, run):
+        return {"type": "EVENT_OPT", "opt_id": run["event"]["options"][0]["id"]}
+
+    def on_event_pick(self, state, run):
+        return {"type": "EVENT_PICK", "uid": first_uid(run["event_pick"].get("choices"))}
+
+    def on_shop(self, state, run):
+        shop = run["shop"]
+        gold = int(run.get("gold", 0))
+        for idx, offer in enumerate(shop.get("offers", [])):
+            if offer["price"] <= gold:
+                return {"type": "SHOP_BUY", "what": "card", "idx": idx}
+        return {"type": "SHOP_LEAVE"}
+
+    def on_shop_remove(self, state, run):
+        return {"type": "SHOP_REMOVE", "uid": first_uid(run["shop_remove"].get("choices"))}
+
+    def on_campfire(self, state, run):
+        return {"type": "CAMPFIRE", "choice": "rest" if int(run["hp"]) < int(run["max_hp"]) * 0.7 else "upgrade"}
+
+    def on_campfire_up(self, state, run):
+        return {"type": "CAMPFIRE_UP", "uid": first_uid(run["campfire_up"].get("choices"))}
+
+    def on_act_end(self, state, run):
+        ae = run["act_end"]
+        if not ae.get("dup_done"):
+            return {"type": "ACT_END", "kind": "dup", "uid": first_uid(ae.get("dup_choices"))}
+        return {"type": "ACT_END", "kind": "rem", "uid": first_uid(ae.get("rem_choices"))}
+
+
+def first_uid(choices) -> Optional[str]:
+    return choices[0]["uid"] if choices else None
+
+
+def card_damage(combat, inst) -> int:
+    cdef = content.get_card_def(inst["id"], upgraded=bool(inst.get("up", False)))
+    return int(game.preview_damage(cdef, inst, combat) or 0)
+
+
+def card_block(inst) -> int:
+    cdef = content.get_card_def(inst["id"], upgraded=bool(inst.get("up", False)))
+    return sum(int(e.get("amount", 0)) for e in cdef.get("effects", []) if e.get("op") == "block")
+
+
+def incoming_damage(combat) -> int:
+    return sum(int((e.get("intent") or {}).get("dmg", 0) or 0)
+               for e in combat.get("enemies", []) if e["hp"] > 0)
+
+
+class RandomPolicy(Policy):
+    """Случайная играбельная карта в случайную живую цель; иногда заканчивает ход раньше."""
+    name = "random"
+
+    def pick_play(self, combat, hand):
+        alive = self.alive(combat)
+        if not hand or not alive or self.rng.random() < 0.1:
+            return None
+        return self.rng.choice(hand), self.rng.choice(alive)
+
+    def on_map(self, state, run):
+        return {"type": "CHOOSE_ROOM", "room_id": self.rng.choice(run["room_choices"])["id"]}
+
+    def on_reward(self, state, run):
+        return {"type": "PICK_REWARD", "card_id": self.rng.choice(run["reward"]["cards"] + [None])}
+
+
+class GreedyDamagePolicy(Policy):
+    """Самая «больная» играбельная карта в самого слабого врага (при равенстве — с большим блоком)."""
+    name = "greedy"
+
+    def pick_play(self, combat, hand):
+        target = self.weakest(combat)
+        if not hand or target is None:
+            return None
+        best = max(hand, key=lambda c: (card_damage(combat, c), card_block(c)))
+        return best, target
+
+
+class BlockFirstPolicy(GreedyDamagePolicy):
+    """Пока блок не покрывает входящий урон — защита; дальше как greedy."""
+    name = "block"
+
+    def pick_play(self, combat, hand):
+        need = incoming_damage(combat) - int(combat["player"].get("block", 0))
+        if need > 0:
+            blockers = [c for c in hand if card_block(c) > 0]
+            target = self.weakest(combat)
+            if blockers and target is not None:
+                return max(blockers, key=card_block), target
+        return super().pick_play(combat, hand)
+
+
+POLICIES = {cls.name: cls for cls in (RandomPolicy, GreedyDamagePolicy, BlockFirstPolicy)}
+
+
+# ---- прогон ----
+
+def simulate_run(seed: int, difficulty: int = 1, policy: str = "greedy") -> Dict[str, Any]:
+    """Один полный забег до победы/поражения. Результат — плоская запись для CSV/JSONL."""
+    t0 = time.perf_counter()
+    random.seed(seed)  # new_run берёт сид забега из модульного random
+    bot = POLICIES[policy](random.Random(seed ^ 0x5EED))
+    state = game.default_state()
+    game.dispatch(state, {"type": "SET_DIFFICULTY", "difficulty": difficulty})
+    game.dispatch(state, {"type": "NEW_RUN"})
+    floor, turns, actions = 1, 0, 0
+    result = "stuck"
+    run = state["run"]
+    while actions < MAX_ACTIONS:
+        screen = state.get("screen")
+        if screen == "VICTORY":
+            result = "victory"
+            break
+        if screen == "DEFEAT":
+            result = "defeat"
+            break
+        run = state["run"]  # после поражения state["run"] обнулится, запомним последний
+        floor = int(run["floor"])
+        action = bot.act(state)
+        if action["type"] == "END_TURN":
+            turns += 1
+        game.dispatch(state, action)
+        actions += 1
+    return {
+        "seed": seed,
+        "difficulty": difficulty,
+        "policy": policy,
+        "result": result,
+        "floor": floor,
+        "act": game.act_for_floor(floor),
+        "turns": turns,
+        "actions": actions,
+        "hp": int(run.get("hp", 0)),
+        "deck": len(run.get("deck", [])),
+        "gold": int(run.get("gold", 0)),
+        "ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+
+def _worker_init(verbose_log: bool) -> None:
+    if not verbose_log:
+        game.set_log_verbosity(0)
+
+
+def _run_job(job) -> Dict[str, Any]:
+    return simulate_run(*job)
+
+
+def iter_results(jobs: List[tuple], workers: int, verbose_log: bool = False) -> Iterator[Dict[str, Any]]:
+    if workers <= 1:
+        prev = game.LOG_VERBOSITY
+        _worker_init(verbose_log)
+        try:
+            for job in jobs:
+                yield _run_job(job)
+        finally:
+            game.set_log_verbosity(prev)
+        return
+    chunk = max(1, min(64, len(jobs) // (workers * 8)))
+    with multiprocessing.Pool(workers, initializer=_worker_init, initargs=(verbose_log,)) as pool:
+        yield from pool.imap_unordered(_run_job, jobs, chunksize=chunk)
+
+
+# ---- отчёт ----
+
+FIELDS = ["seed", "difficulty", "policy", "result", "floor", "act", "turns", "actions", "hp", "deck", "gold", "ms"]
+
+
+class ResultWriter:
+    """CSV или JSON lines — по расширению файла (или явно через fmt)."""
+
+    def __init__(self, path: Optional[str], fmt: Optional[str] = None):
+        self.fmt = fmt or ("jsonl" if path and path.endswith((".jsonl", ".json")) else "csv")
+        self.f = open(path, "w", encoding="utf-8", newline="") if path else None
+        self.csv = None
+        if self.f and self.fmt == "csv":
+            self.csv = csv.DictWriter(self.f, fieldnames=FIELDS)
+            self.csv.writeheader()
+
+    def write(self, rec: Dict[str, Any]) -> None:
+        if not self.f:
+            return
+        if self.csv:
+            self.csv.writerow(rec)
+        else:
+            self.f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        if self.f:
+            self.f.close()
+
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> str:
+    lines = [f"Забегов: {len(results)} за {elapsed:.1f} c ({len(results) / max(elapsed, 1e-9):.1f} забегов/с)"]
+    by_diff: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for r in results:
+        by_diff[r["difficulty"]].append(r)
+    for diff in sorted(by_diff):
+        rs = by_diff[diff]
+        wins = sum(1 for r in rs if r["result"] == "victory")
+        stuck = sum(1 for r in rs if r["result"] == "stuck")
+        line = f"Сложность {diff}: побед {wins}/{len(rs)} ({100.0 * wins / len(rs):.1f}%)"
+        if stuck:
+            line += f", зависло {stuck}"
+        lines.append(line)
+        deaths = Counter(r["floor"] for r in rs if r["result"] == "defeat")
+        if deaths:
+            top = max(deaths.values())
+            lines.append("  этаж смерти:")
+            for floor in range(1, max(deaths) + 1):
+                n = deaths.get(floor, 0)
+                lines.append(f"  {floor:>4} | {'#' * max(1 if n else 0, round(30 * n / top))} {n}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Безголовая симуляция забегов ботами.")
+    ap.add_argument("--runs", type=int, default=200, help="забегов на каждую сложность")
+    ap.add_argument("--seed", type=int, default=1, help="первый сид (дальше подряд)")
+    ap.add_argument("--difficulty", type=int, nargs="+", default=[1])
+    ap.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--out", help="файл результатов (.csv или .jsonl)")
+    ap.add_argument("--format", choices=("csv", "jsonl"))
+    ap.add_argument("--log", action="store_true", help="вести журнал боя (медленнее)")
+    args = ap.parse_args(argv)
+
+    jobs = [(args.seed + i, diff, args.policy) for diff in args.difficulty for i in range(args.runs)]
+    writer = ResultWriter(args.out, args.format)
+    results = []
+    t0 = time.perf_counter()
+    try:
+        for rec in iter_results(jobs, args.workers, args.log):
+            writer.write(rec)
+            results.append(rec)
+    finally:
+        writer.close()
+    print(summarize(results, time.perf_counter() - t0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
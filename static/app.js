@@ -3,6 +3,7 @@
 */
 let SID = null;
 let STATE = null;
+let STATE_REV = null; // ревизия STATE на сервере — база для дельта-ответов
 let CONTENT = null; // /api/content
 let CARD_INDEX = new Map(); // id -> {base, up}
 let MAP_ZOOM = 1;
@@ -151,6 +152,25 @@ async function apiGet(path){
   }
 }
 
+// Кодекс неизменен, пока не сменился content_hash из /api/bootstrap:
+// держим его в localStorage и на тёплой перезагрузке не качаем вовсе.
+async function loadContent(hash){
+  if(!hash) return await apiGet('api/content');
+  try{
+    const cached = JSON.parse(localStorage.getItem('mprl_content') || 'null');
+    if(cached && cached.hash === hash) return cached.body;
+  }catch(e){
+    // битый кэш — просто скачаем заново
+  }
+  const body = await apiGet(`api/content?v=${hash}`);
+  try{
+    localStorage.setItem('mprl_content', JSON.stringify({hash, body}));
+  }catch(e){
+    // квота — обойдёмся HTTP-кэшем
+  }
+  return body;
+}
+
 async function bootstrap(){
   const saved = localStorage.getItem('mprl_sid');
   try{
@@ -158,13 +178,14 @@ async function bootstrap(){
     SID = data.sid;
     localStorage.setItem('mprl_sid', SID);
     STATE = data.state;
+    STATE_REV = data.rev || null;
     renderAll();
     if(STATE?.run){
       await dispatch({type:'CONTINUE'});
     }
     // подгрузим контент для кодекса/наследия
     try{
-      CONTENT = await apiGet('api/content');
+      CONTENT = await loadContent(data.content_hash);
       CARD_INDEX = new Map();
       for(const item of CONTENT.cards){
         CARD_INDEX.set(item.base.id, item);
@@ -184,8 +205,8 @@ async function dispatch(action){
     return;
   }
   try{
-    const data = await api('api/action', {sid: SID, action});
-    STATE = data.state;
+    const data = await api('api/action', {sid: SID, action, base_rev: STATE_REV});
+    await acceptState(data);
     renderAll();
     if(STATE?.ui?.toast) toast(STATE.ui.toast);
   }catch(err){
@@ -194,6 +215,59 @@ async function dispatch(action){
   }
 }
 
+// --- дельта-ответы (RFC 6902: add/remove/replace) ---
+function decodePointer(path){
+  return path.split('/').slice(1).map(t=>t.replace(/~1/g,'/').replace(/~0/g,'~'));
+}
+
+function applyJsonPatch(doc, ops){
+  for(const op of ops){
+    const keys = decodePointer(op.path);
+    if(keys.length === 0){
+      if(op.op === 'remove') throw new Error('patch: remove root');
+      doc = op.value;
+      continue;
+    }
+    let parent = doc;
+    for(const k of keys.slice(0, -1)){
+      parent = parent[Array.isArray(parent) ? Number(k) : k];
+      if(parent === null || typeof parent !== 'object') throw new Error(`patch: bad path ${op.path}`);
+    }
+    const last = keys[keys.length - 1];
+    if(Array.isArray(parent)){
+      const idx = last === '-' ? parent.length : Number(last);
+      if(op.op === 'add') parent.splice(idx, 0, op.value);
+      else if(op.op === 'remove') parent.splice(idx, 1);
+      else if(op.op === 'replace') parent[idx] = op.value;
+      else throw new Error(`patch: op ${op.op}`);
+    }else{
+      if(op.op === 'add' || op.op === 'replace') parent[last] = op.value;
+      else if(op.op === 'remove') delete parent[last];
+      else throw new Error(`patch: op ${op.op}`);
+    }
+  }
+  return doc;
+}
+
+async function acceptState(data){
+  if(data.patch && STATE){
+    try{
+      STATE = applyJsonPatch(STATE, data.patch);
+      STATE_REV = data.rev || null;
+      return;
+    }catch(err){
+      // разъехались с сервером — заберём полный state
+      console.error('Patch error', err);
+      const full = await api('api/bootstrap', {sid: SID});
+      STATE = full.state;
+      STATE_REV = full.rev || null;
+      return;
+    }
+  }
+  STATE = data.state;
+  STATE_REV = data.rev || null;
+}
+
 function renderHostInfo(hostinfo){
   const list = $('#apiHostList');
   if(!list) return;
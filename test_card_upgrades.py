@@ -36,6 +36,17 @@ class CardUpgradeDefTest(unittest.TestCase):
             # базовое описание не должно протекать после апгрейда
             self.assertEqual(base["desc"], c["desc"])
 
+    def test_card_defs_are_shared_and_read_only(self):
+        first = content.get_card_def("SCAVENGE", upgraded=True)
+        self.assertIs(first, content.get_card_def("SCAVENGE", upgraded=True))
+        with self.assertRaises(TypeError):
+            first["cost"] = 99
+        with self.assertRaises(TypeError):
+            first["effects"].append({"op": "draw", "n": 1})
+        with self.assertRaises(TypeError):
+            first["effects"][0]["n"] = 5
+        self.assertEqual(content.get_card_def("SCAVENGE", upgraded=True)["cost"], first["cost"])
+
     def test_sanitize_deck_view_shows_upgraded_stats(self):
         state = game.default_state()
         state["run"] = {
@@ -0,0 +1,47 @@
+import unittest
+
+import batchsim
+import game
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@unittest.skipUnless(np is not None, "нужен numpy")
+class BatchSimTests(unittest.TestCase):
+    def test_compute_damage_matches_engine(self):
+        base = np.arange(0, 40)
+        for weak in (0, 1):
+            for freeze in (0, 1):
+                for vuln in (0, 1):
+                    got = batchsim.BatchCombat._compute_damage(base, np.full(40, weak), np.full(40, freeze), np.full(40, vuln))
+                    att = game.Enemy.from_dict({"statuses": {"weak": weak, "freeze": freeze}})
+                    dfn = game.Player.from_dict({"statuses": {"vulnerable": vuln}})
+                    want = [game.compute_damage(att, dfn, int(b)) for b in base]
+                    self.assertEqual(got.tolist(), want)
+
+    def test_unsupported_cards_are_rejected_up_front(self):
+        with self.assertRaises(batchsim.BatchUnsupported) as ctx:
+            batchsim.BatchCombat(["RAT_MAGE"], ["ARCANE_JAB", "FOCUS"], 4)
+        self.assertIn("FOCUS", str(ctx.exception))
+
+    def test_same_seed_same_outcome(self):
+        deck = batchsim.starter_deck_ids()
+        a = batchsim.BatchCombat(["WARDEN_HOUND"], deck, 64, seed=5).run()
+        b = batchsim.BatchCombat(["WARDEN_HOUND"], deck, 64, seed=5).run()
+        self.assertEqual(a.result.tolist(), b.result.tolist())
+        self.assertEqual(a.turn.tolist(), b.turn.tolist())
+
+    def test_statistics_agree_with_scalar_engine(self):
+        deck = batchsim.starter_deck_ids()
+        rep = batchsim.validate(["BOSS_WARDEN"], deck, 300, seed=1, batch=6000, hp=60)
+        scalar, batch = rep["scalar"], rep["batch"]
+        self.assertAlmostEqual(scalar["win_rate"], batch["win_rate"], delta=0.1)
+        self.assertAlmostEqual(scalar["mean_turns"], batch["mean_turns"], delta=0.1 * scalar["mean_turns"])
+        self.assertEqual(batch["timeouts"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
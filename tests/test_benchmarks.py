@@ -0,0 +1,46 @@
+import json
+import os
+
+from benchmarks import bench
+
+
+def test_every_benchmark_runs_once():
+    out = bench.run_benches(rounds=1, number=1)
+    assert set(out["results"]) == set(bench.BENCHES)
+    assert all(r["best_ns"] > 0 and r["calib_ns"] > 0 for r in out["results"].values())
+    assert {f"play_card[{op}]" for op in bench.card_for_op()} <= set(out["results"])
+    json.dumps(out)
+
+
+def test_baseline_covers_the_suite():
+    with open(bench.BASELINE_PATH, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    assert baseline["version"] == bench.FORMAT_VERSION
+    assert set(baseline["results"]) == set(bench.BENCHES)
+
+
+def test_compare_scales_by_calibration_and_flags_regressions():
+    base = {"results": {"a": {"best_ns": 1000, "calib_ns": 100}, "b": {"best_ns": 1000, "calib_ns": 100},
+                        "gone": {"best_ns": 5, "calib_ns": 100}}}
+    cur = {"results": {"a": {"best_ns": 2000, "calib_ns": 200},     # машина вдвое медленнее
+                       "b": {"best_ns": 1500, "calib_ns": 100},
+                       "new": {"best_ns": 1, "calib_ns": 100}}}
+    rows = {r["name"]: r for r in bench.compare(cur, base, tolerance=0.3)}
+    assert set(rows) == {"a", "b"}
+    assert rows["a"]["ratio"] == 1.0 and not rows["a"]["regressed"]
+    assert rows["b"]["regressed"]
+
+
+def test_main_exit_code(tmp_path):
+    path = os.path.join(tmp_path, "base.json")
+    assert bench.main(["-k", "build_path_map", "--rounds", "1", "--number", "1",
+                       "--baseline", path, "--save-baseline"]) == 0
+    with open(path, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    saved["results"]["build_path_map"]["best_ns"] = 1
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(saved, f)
+    assert bench.main(["-k", "build_path_map", "--rounds", "1", "--number", "1", "--baseline", path,
+                       "--out", os.path.join(tmp_path, "out.json")]) == 1
+    with open(os.path.join(tmp_path, "out.json"), "r", encoding="utf-8") as f:
+        assert json.load(f)["comparison"][0]["regressed"]
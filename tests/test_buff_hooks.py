@@ -0,0 +1,53 @@
+import random
+
+import game
+
+
+def make_combat(buffs=None):
+    return {
+        "turn": 1,
+        "player": game.Player.from_dict({"hp": 20, "max_hp": 30, "mana": 0, "mana_max": 3, "block": 0,
+                                         "buffs": dict(buffs or {}), "statuses": {}}),
+        "hand": [],
+        "draw_pile": [game.make_card_instance("ARCANE_JAB") for _ in range(3)],
+        "discard_pile": [],
+        "exhaust_pile": [],
+        "enemies": game.Roster([game.Enemy.from_dict({"name": "Манекен", "hp": 10, "max_hp": 10, "block": 0,
+                                                      "statuses": {}, "buffs": {}})]),
+        "log": [],
+        "_rng": random.Random(0),
+    }
+
+
+def test_index_follows_add_and_consume():
+    combat = make_combat({"regen_small": 1})
+    p = combat["player"]
+    assert game.buff_subscribers(combat, "turn_start_player") == [("regen_small", 1)]
+    assert game.buff_subscribers(combat, "on_discard") == []
+
+    game.add_buff(p, "venom_rain", combat=combat)
+    game.add_buff(p, "venom_rain", combat=combat)
+    assert game.buff_subscribers(combat, "turn_end_player") == [("venom_rain", 2)]
+    assert game.buff_subscribers(combat, "dot_tick_poison") == [("venom_rain", 2)]
+
+    game.consume_buff(p, "venom_rain", 2, combat=combat)
+    assert game.buff_subscribers(combat, "turn_end_player") == []
+    assert "venom_rain" not in combat["_buff_hooks"]["dot_tick_poison"]
+
+
+def test_turn_start_gains_are_summed():
+    combat = make_combat({"battery": 1, "regen_guard": 2, "ward_small": 1})
+    gains = {"mana": 0, "ward": 0, "heal": 0, "block": 0}
+    game.fire_buff_hook(combat, "turn_start_player", gains)
+    assert gains == {"mana": 1, "ward": 4, "heal": 8, "block": 4}
+
+
+def test_on_discard_hooks_fire_in_catalogue_order():
+    combat = make_combat()
+    p = combat["player"]
+    game.add_buff(p, "draw_on_discard", combat=combat)
+    game.add_buff(p, "mana_on_discard", combat=combat)
+    game.trigger_on_discard(combat, None)
+    assert p["mana"] == 1
+    assert len(combat["hand"]) == 1
+    assert combat["log"][0].startswith("Баф: сброс -> +1 маны")
@@ -0,0 +1,150 @@
+import copy
+import json
+import unittest
+
+import content
+import game
+
+
+def legacy_combat_view(combat):
+    # прежняя сборка: глубокая копия боя + перезапись полей
+    v = copy.deepcopy(combat)
+    hand = []
+    for inst in combat.get("hand", []):
+        d = content.get_card_def(inst["id"], upgraded=bool(inst.get("up", False)))
+        hv = game.card_view(inst)
+        hv["uid"] = inst["uid"]
+        hv["eff_cost"] = game.card_cost(d, inst)
+        hv["charge"] = int(inst.get("charge", 0))
+        hv["dmg_preview"] = game.preview_damage(d, inst, combat)
+        hand.append(hv)
+    v["hand"] = hand
+    v["draw_count"] = len(combat.get("draw_pile", []))
+    v["discard_count"] = len(combat.get("discard_pile", []))
+    v["discard_pile_cards"] = [game.card_view(ci) for ci in combat.get("discard_pile", [])][-18:]
+    v["exhaust_count"] = len(combat.get("exhaust_pile", []))
+    p = combat.get("player", {})
+    v["player"] = {
+        "hp": p.get("hp", 0),
+        "max_hp": p.get("max_hp", 0),
+        "block": p.get("block", 0),
+        "mana": p.get("mana", 0),
+        "mana_max": p.get("mana_max", 0),
+        "statuses": p.get("statuses", {}),
+        "buffs": p.get("buffs", {}),
+        "crit": round(game.crit_chance(p), 3),
+    }
+    v["enemies"] = [{
+        "id": e["id"],
+        "name": e["name"],
+        "hp": e["hp"],
+        "max_hp": e["max_hp"],
+        "block": e.get("block", 0),
+        "statuses": e.get("statuses", {}),
+        "intent": e.get("intent", {}),
+    } for e in combat.get("enemies", [])]
+    v["pending"] = combat.get("pending", None)
+    return v
+
+
+# что рисует клиент из боя — остальное (стопки, журнал боя, внутренности врагов) во view не идёт
+COMBAT_VIEW_KEYS = ("turn", "phase", "log", "hand", "draw_count", "discard_count", "discard_pile_cards",
+                    "exhaust_count", "player", "enemies", "pending")
+
+
+def legacy_sanitize(state):
+    st = copy.deepcopy(state)
+    for k in game.VIEW_HIDDEN:
+        st.pop(k, None)
+    run = st.get("run")
+    if run:
+        run["act"] = game.act_for_floor(run.get("floor", 1))
+        run["deck_view"] = [game.card_view(ci) for ci in run.get("deck", [])]
+        run["relics_view"] = [content.RELIC_INDEX[rid] for rid in run.get("relics", []) if rid in content.RELIC_INDEX]
+        if run.get("combat"):
+            game.render_log(run["combat"])
+            cv = legacy_combat_view(run["combat"])
+            run["combat_view"] = {k: cv[k] for k in COMBAT_VIEW_KEYS}
+        else:
+            run["combat_view"] = None
+        for k in game.RUN_VIEW_HIDDEN:
+            run.pop(k, None)
+    st["content_summary"] = {
+        "rarities": content.RARITIES,
+        "card_types": content.CARD_TYPES,
+        "statuses": content.STATUSES,
+        "buffs": {k: {"name": v["name"], "desc": v["desc"]} for k, v in content.BUFFS.items()},
+        "curses": {c["id"]: {"name": c["name"], "desc": c["desc"]} for c in content.CURSES},
+        "relics": {r["id"]: {"name": r["name"], "desc": r["desc"]} for r in content.RELICS},
+        "crit_base": content.CRIT_BASE_CHANCE,
+    }
+    return st
+
+
+def dump(view):
+    return json.dumps(view, ensure_ascii=False, default=game.json_default)
+
+
+class ClientViewTests(unittest.TestCase):
+    def states(self):
+        state = game.default_state()
+        yield state
+        game.new_run(state)
+        yield state
+        game.start_combat(state, "fight")
+        yield state
+        combat = state["run"]["combat"]
+        for inst in list(combat["hand"])[:2]:
+            game.play_card(state, inst["uid"], 0)
+        yield state
+        game.end_turn(state)
+        yield state
+        combat["hand"].append(game.make_card_instance("SCAVENGE"))
+        combat["player"]["mana"] = 5
+        game.play_card(state, combat["hand"][-1]["uid"], None)
+        self.assertIsNotNone(combat.get("pending"))
+        yield state
+
+    def test_view_is_byte_identical_to_deepcopy_build(self):
+        for state in self.states():
+            combat = (state.get("run") or {}).get("combat")
+            if combat:
+                combat.pop("_rng", None)
+            self.assertEqual(dump(game.sanitize_for_client(state)), dump(legacy_sanitize(state)))
+
+    def test_view_is_projected_and_detached(self):
+        for state in self.states():
+            state = copy.deepcopy(state)
+            view = game.sanitize_for_client(state)
+            run = view.get("run")
+            if not run:
+                continue
+            self.assertFalse(game.RUN_VIEW_HIDDEN & run.keys())
+            before = dump(view)
+            combat = state["run"].get("combat")
+            if combat:
+                self.assertEqual(tuple(run["combat_view"]), COMBAT_VIEW_KEYS)
+                game.end_turn(state)
+            state["run"]["relics"].append("X")
+            state["run"]["visited_nodes"].append("X")
+            state["ui"]["toast"] = "другое"
+            self.assertEqual(dump(view), before)
+
+    def test_view_does_not_touch_live_state(self):
+        for state in self.states():
+            combat = (state.get("run") or {}).get("combat")
+            if combat:
+                combat.pop("_rng", None)
+                game.log(combat, "метка")
+            before = copy.deepcopy(state)
+            game.sanitize_for_client(state)
+            self.assertEqual(state.keys(), before.keys())
+            if combat:
+                self.assertIsInstance(combat["log"], game.CombatLog)
+                self.assertNotIn("combat_view", state["run"])
+                self.assertEqual(state["run"].keys(), before["run"].keys())
+                self.assertEqual(combat.keys(), before["run"]["combat"].keys())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import copy
+import json
+
+import game
+
+
+def fight():
+    state = game.default_state()
+    game.new_run(state)
+    game.start_combat(state, "fight")
+    return state
+
+
+def test_combat_cards_overlay_the_deck():
+    state = fight()
+    run, combat = state["run"], state["run"]["combat"]
+    inst = combat["hand"][0]
+    base = run["deck"].get(inst["uid"])
+    assert isinstance(inst, game.CombatCard) and inst.base is base
+    assert inst["id"] == base["id"] and inst.get("up") is False and inst.get("charge", 0) == 0
+    inst["temp_cost_mod"] = 1
+    inst["up"] = True
+    assert "temp_cost_mod" not in base and base["up"] is False
+    assert json.loads(json.dumps(inst)) == {"uid": inst["uid"], "temp_cost_mod": 1, "up": True}
+
+
+def test_compact_combat_survives_save_and_load():
+    state = fight()
+    combat = state["run"]["combat"]
+    combat.pop("_rng", None)
+    combat.pop("_buff_hooks", None)
+    game.render_log(combat)
+    loaded = json.loads(json.dumps(state, ensure_ascii=False, default=game.json_default))
+    assert all(set(c) == {"uid"} for c in loaded["run"]["combat"]["draw_pile"])
+    game.adopt_state(loaded)
+    hand = loaded["run"]["combat"]["hand"]
+    assert [c["id"] for c in hand] == [c["id"] for c in combat["hand"]]
+    view = game.sanitize_for_client(loaded)
+    assert [c["name"] for c in view["run"]["combat_view"]["hand"]] == \
+        [c["name"] for c in game.sanitize_for_client(state)["run"]["combat_view"]["hand"]]
+
+
+def test_deepcopy_keeps_overlays_linked_to_the_copied_deck():
+    state = fight()
+    twin = copy.deepcopy(state)
+    inst = twin["run"]["combat"]["hand"][0]
+    assert inst.base is twin["run"]["deck"].get(inst["uid"])
@@ -0,0 +1,56 @@
+import json
+import tempfile
+from unittest import mock
+
+import game
+import server
+
+
+def test_log_is_a_bounded_ring_rendered_on_read():
+    combat = {"log": ["старая строка"]}
+    for i in range(game.LOG_CAPACITY + 5):
+        game.log(combat, "Удар {}: {} урона.", i, i * 2)
+    buf = combat["log"]
+    assert isinstance(buf, game.CombatLog)
+    assert len(buf) == game.LOG_CAPACITY
+    assert buf[-1] == f"Удар {game.LOG_CAPACITY + 4}: {2 * (game.LOG_CAPACITY + 4)} урона."
+    assert "старая строка" not in list(buf)
+
+    game.render_log(combat)
+    assert json.loads(json.dumps(combat["log"]))[0] == "Удар 5: 10 урона."
+
+
+def test_zero_verbosity_disables_logging():
+    combat = {"log": []}
+    game.set_log_verbosity(0)
+    try:
+        game.log(combat, "Яд: {} урона.", 3)
+    finally:
+        game.set_log_verbosity(1)
+    assert combat["log"] == []
+
+
+def test_client_view_gets_plain_strings():
+    state = game.default_state()
+    game.new_run(state)
+    game.start_combat(state, "fight")
+    view = game.sanitize_for_client(state)
+    assert json.loads(json.dumps(view)) == view
+    assert any("В бой!" in line for line in view["run"]["combat_view"]["log"])
+    assert "combat" not in view["run"]
+
+
+def test_responses_and_saves_leave_the_live_ring_alone():
+    with tempfile.TemporaryDirectory() as tmp, mock.patch.object(server, "SAVE_DIR", tmp):
+        cache = server.SessionCache(max_size=2, idle_sec=60, flush_interval=0)
+        cache.bootstrap("l", fresh=game.default_state())
+        cache.act("l", {"type": "NEW_RUN"})
+        with cache.checkout("l") as st:
+            game.start_combat(st, "fight")
+            ring = st["run"]["combat"]["log"]
+        cache.act("l", {"type": "END_TURN"})
+        combat = cache._items["l"].state["run"]["combat"]
+        assert combat["log"] is ring and isinstance(ring, game.CombatLog)
+        saved = server.load_state("l")["run"]["combat"]["log"]
+        assert list(saved) == list(ring)
+        cache.close()
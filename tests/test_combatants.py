@@ -0,0 +1,86 @@
+import copy
+import json
+import pickle
+import tempfile
+from unittest import mock
+
+import pytest
+
+import game
+import server
+
+
+def fight():
+    state = game.default_state()
+    game.new_run(state)
+    game.start_combat(state, "fight")
+    return state
+
+
+def test_records_convert_to_the_old_save_format():
+    combat = fight()["run"]["combat"]
+    p, e = combat["player"], combat["enemies"][0]
+    assert isinstance(p, game.Player) and isinstance(e, game.Enemy)
+    assert set(p.to_dict()) == {"name", "hp", "max_hp", "block", "mana_max", "mana", "statuses", "buffs", "crit"}
+    assert "moves" not in e.to_dict() and e.to_dict()["next"] == e.next
+    e["mod_flag"] = 1
+    for rec in (p, e, game.make_card_instance("ARCANE_JAB")):
+        d = json.loads(json.dumps(rec, default=game.json_default))
+        assert type(rec).from_dict(d) == rec == d
+
+
+def test_alive_counter_follows_hp():
+    combat = fight()["run"]["combat"]
+    enemies = combat["enemies"]
+    enemies.append(game.Enemy.from_dict({"id": "X", "hp": 5, "max_hp": 5}))
+    n = len(enemies)
+    assert enemies.alive == n
+    e = enemies[-1]
+    e.hp = 0
+    assert not e.alive and enemies.alive == n - 1
+    e["hp"] = -3
+    assert enemies.alive == n - 1
+    e.hp = 1
+    assert e.alive and enemies.alive == n
+    for e in enemies:
+        e.hp = 0
+    assert enemies.alive == 0
+
+
+def test_statuses_have_fixed_slots():
+    st = game.Statuses({"poison": 3, "weak": 0})
+    assert st == {"poison": 3} and "weak" not in st and st.poison == 3
+    st["poison"] = -1
+    assert st.to_dict() == {} and st.get("poison", 0) == 0
+    with pytest.raises(ValueError):
+        st["sleep"] = 1
+    p = game.Player.from_dict({"hp": 5, "max_hp": 5})
+    p["statuses"] = {"burn": 2}
+    assert isinstance(p.statuses, game.Statuses) and p.statuses.burn == 2
+
+
+def test_copies_keep_the_roster_link():
+    combat = fight()["run"]["combat"]
+    combat.pop("_rng", None)
+    combat.pop("_buff_hooks", None)
+    for twin in (copy.deepcopy(combat), pickle.loads(pickle.dumps(combat))):
+        enemies = twin["enemies"]
+        assert isinstance(enemies, game.Roster) and enemies.alive == len(enemies)
+        enemies[0].hp = 0
+        assert enemies.alive == len(enemies) - 1
+    assert combat["enemies"].alive == len(combat["enemies"])
+
+
+def test_save_file_is_plain_json_and_loads_back_to_records():
+    state = fight()
+    with tempfile.TemporaryDirectory() as tmp, mock.patch.object(server, "SAVE_DIR", tmp):
+        server.save_state("s", state)
+        with open(server.save_path("s"), encoding="utf-8") as f:
+            saved = json.load(f)["run"]
+        loaded = server.load_state("s")["run"]
+    assert saved["combat"]["player"] == state["run"]["combat"]["player"].to_dict()
+    assert saved["deck"][0] == {"uid": "c0", "id": state["run"]["deck"][0].id, "up": False}
+    assert isinstance(loaded["combat"]["player"], game.Player)
+    assert isinstance(loaded["combat"]["enemies"], game.Roster)
+    assert isinstance(loaded["deck"][0], game.CardInstance)
+    assert loaded["combat"]["enemies"] == state["run"]["combat"]["enemies"]
@@ -0,0 +1,48 @@
+import hashlib
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+import content
+import server
+
+
+class ContentEndpointTests(unittest.TestCase):
+    def setUp(self):
+        self.client = server.app.test_client()
+
+    def test_body_is_built_once_and_addressed_by_hash(self):
+        with mock.patch.object(content, "get_card_def", side_effect=AssertionError):
+            resp = self.client.get("/api/content")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data, server.CONTENT_BODY)
+        self.assertEqual(resp.headers["ETag"], f'"{server.CONTENT_HASH}"')
+        self.assertEqual(server.CONTENT_HASH, hashlib.sha256(resp.data).hexdigest()[:32])
+        self.assertIn("no-cache", resp.headers["Cache-Control"])
+        data = json.loads(resp.data)
+        self.assertEqual(len(data["cards"]), len(content.CARDS) + len(content.CURSES))
+        self.assertEqual(data["cards"][0]["up"], content.get_card_def(content.CARDS[0]["id"], upgraded=True))
+        self.assertEqual(server.build_content_payload(), (server.CONTENT_BODY, server.CONTENT_HASH))
+
+    def test_conditional_and_immutable_requests(self):
+        etag = f'"{server.CONTENT_HASH}"'
+        resp = self.client.get("/api/content", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b"")
+        self.assertEqual(self.client.get("/api/content", headers={"If-None-Match": '"old"'}).status_code, 200)
+        resp = self.client.get(f"/api/content?v={server.CONTENT_HASH}")
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+        self.assertIn("max-age=31536000", resp.headers["Cache-Control"])
+        self.assertIn("no-cache", self.client.get("/api/content?v=stale").headers["Cache-Control"])
+
+    def test_bootstrap_announces_content_hash(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(server, "SAVE_DIR", tmp), \
+                mock.patch.object(server, "SESSIONS", server.SessionCache(flush_interval=0)):
+            data = self.client.post("/api/bootstrap", json={}).get_json()
+        self.assertEqual(data["content_hash"], server.CONTENT_HASH)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+import content
+import game
+
+
+def test_rarity_pools_match_card_list():
+    for r in content.RARITIES:
+        assert content.CARDS_BY_RARITY[r] == tuple(c["id"] for c in content.CARDS if c["rarity"] == r)
+    assert content.card_pool() == tuple(c["id"] for c in content.CARDS)
+    assert content.card_pool("mythic") == ()
+
+
+def test_tier_pools_are_cumulative():
+    for tier in (0, 1, 2, 3, 9):
+        legacy = [e for e in content.ENEMIES if int(e.get("tier", 1)) <= tier] or content.ENEMIES
+        assert list(content.enemy_pool(tier)) == legacy
+
+
+def test_tag_postings_and_relic_sampling():
+    for c in content.CARDS + content.CURSES:
+        for t in c.get("tags", []):
+            assert c["id"] in content.cards_with_tag(t)
+        assert content.CARD_TAGS[c["id"]] == frozenset(c.get("tags", []))
+    assert content.cards_with_tag("нет-такого") == frozenset()
+    everything = list(content.RELIC_IDS)
+    assert content.sample_relic(random.Random(0), everything) is None
+    assert content.sample_relic(random.Random(0), set(everything[1:])) == everything[0]
+
+
+def _legacy_card_choices(run, rng, k=3):
+    rarities = [game.roll_card_rarity(run, rng) for _ in range(k)]
+    if not any(r in ("uncommon", "rare", "legendary") for r in rarities):
+        rarities[-1] = "uncommon"
+    return [rng.choice([c for c in content.CARDS if c["rarity"] == r])["id"] for r in rarities]
+
+
+def test_generators_pick_same_ids_as_list_scans():
+    # пулы сохраняют порядок списков, так что сиды дают прежние награды
+    for seed in range(20):
+        rng_a, rng_b = random.Random(seed), random.Random(seed)
+        assert content.sample_cards(rng_a, "rare", 3) == [
+            rng_b.choice([c for c in content.CARDS if c["rarity"] == "rare"])["id"] for _ in range(3)]
+        rng_a, rng_b = random.Random(seed), random.Random(seed)
+        owned = ["RAT_POUCH"] + [r["id"] for r in content.RELICS if random.Random(seed + 100).random() < 0.4]
+        free = [r["id"] for r in content.RELICS if r["id"] not in owned]
+        assert game.random_relic(rng_a, owned) == (rng_b.choice(free) if free else None)
+        rng_a, rng_b = random.Random(seed), random.Random(seed)
+        assert game.generate_card_choices({"floor": seed % 10 + 1}, rng_a) == _legacy_card_choices(
+            {"floor": seed % 10 + 1}, rng_b)
+
+
+def test_rebuild_picks_up_new_content():
+    extra = dict(content.CARDS[0], id="TEST_EXTRA", rarity="legendary", tags=["test_tag"])
+    content.CARDS.append(extra)
+    try:
+        content.build_indexes()
+        assert content.CARDS_BY_RARITY["legendary"][-1] == "TEST_EXTRA"
+        assert content.cards_with_tag("test_tag") == frozenset({"TEST_EXTRA"})
+    finally:
+        content.CARDS.remove(extra)
+        content.build_indexes()
+    assert "TEST_EXTRA" not in content.card_pool()
+
+
+def test_overridden_card_gets_fresh_def_and_program():
+    i, old = 0, content.CARDS[0]
+    stale_prog = game.card_program(content.get_card_def(old["id"]))
+    content.CARDS[i] = dict(old, cost=old["cost"] + 1, effects=[{"op": "block", "amount": 99}])
+    try:
+        game.compile_content()
+        d = content.get_card_def(old["id"])
+        assert d["cost"] == old["cost"] + 1 and content.CARD_INDEX[old["id"]] is content.CARDS[i]
+        assert game.card_program(d) is not stale_prog and d["effects"][0]["amount"] == 99
+        content.CARDS.append(dict(old))
+        try:
+            with pytest.raises(ValueError):
+                content.build_indexes()
+        finally:
+            content.CARDS.pop()
+    finally:
+        content.CARDS[i] = old
+        game.compile_content()
+    assert content.get_card_def(old["id"])["cost"] == old["cost"]
+    assert content.get_card_def(old["id"], upgraded=True)["effects"] == (old.get("effects_up") or old["effects"])
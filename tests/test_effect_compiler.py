@@ -0,0 +1,80 @@
+import unittest
+
+import content
+import game
+
+
+class EffectCompilerTests(unittest.TestCase):
+    def test_all_content_compiles(self):
+        for c in content.CARDS:
+            for up in (False, True):
+                errors = []
+                program = game.card_program(content.get_card_def(c["id"], upgraded=up), errors)
+                self.assertEqual(errors, [], c["id"])
+                self.assertTrue(program, c["id"])
+
+    def test_programs_are_compiled_once(self):
+        cdef = content.get_card_def("RUNE_SLASH", upgraded=True)
+        self.assertIs(game.card_program(cdef), game.card_program(cdef))
+
+    def test_unknown_op_and_bad_fields_are_reported(self):
+        errors = []
+        program = game.compile_effects([
+            {"op": "teleport"},
+            {"op": "damage", "amount": "много"},
+            {"op": "apply", "status": "sleepy", "stacks": 1},
+            {"op": "block", "amount": 4},
+        ], errors=errors)
+        self.assertEqual(len(program), 1)
+        self.assertEqual(len(errors), 3)
+        self.assertIn("teleport", errors[0])
+
+    def test_nested_lists_are_checked_too(self):
+        errors = []
+        game.compile_effects([{"op": "damage", "amount": 3, "on_crit": [{"op": "nope"}]}], errors=errors)
+        self.assertEqual(len(errors), 1)
+
+    def make_combat(self):
+        state = game.default_state()
+        game.new_run(state)
+        game.start_combat(state, "fight")
+        return state, state["run"]["combat"]
+
+    def test_nested_effects_use_full_op_set(self):
+        state, combat = self.make_combat()
+        hp_before = [e["hp"] for e in combat["enemies"]]
+        effects = [{"op": "combo", "steps": [
+            {"op": "aoe_damage", "amount": 3},
+            {"op": "discard_random", "n": 1},
+        ]}]
+        errors = []
+        game.compile_effects(effects, errors=errors)
+        self.assertEqual(errors, [])
+        hand = len(combat["hand"])
+        game.resolve_effect_list(state, combat, effects, combat["player"], None)
+        self.assertTrue(all(e["hp"] < hp for e, hp in zip(combat["enemies"], hp_before)))
+        self.assertEqual(len(combat["hand"]), hand - 1)
+
+    def test_register_effect_op(self):
+        def compile_gain_gold(eff, effects, idx, errors):
+            amount = int(eff.get("amount", 0))
+
+            def step(ctx):
+                ctx.state["run"]["gold"] += amount
+            return step
+
+        game.register_effect_op("test_gain_gold", compile_gain_gold)
+        self.addCleanup(game.EFFECT_OPS.pop, "test_gain_gold")
+        with self.assertRaises(ValueError):
+            game.register_effect_op("test_gain_gold", compile_gain_gold)
+
+        state, combat = self.make_combat()
+        gold = state["run"]["gold"]
+        game.resolve_effect_list(state, combat, [{"op": "if_enemy_hp_below", "pct": 2.0, "then": [
+            {"op": "test_gain_gold", "amount": 7},
+        ]}], combat["player"], combat["enemies"][0])
+        self.assertEqual(state["run"]["gold"], gold + 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import copy
+import random
+
+import server
+from benchmarks import loadtest
+
+
+def test_apply_patch_inverts_server_json_patch():
+    rng = random.Random(3)
+    old = {"a": [1, 2, 3, 4], "b": {"x/y": 1, "t~": [{"k": 1}]}, "c": "s"}
+    for _ in range(200):
+        new = copy.deepcopy(old)
+        new["a"] = [v for v in new["a"] if rng.random() < 0.7] + [rng.randint(0, 9)] * rng.randint(0, 2)
+        new["b"]["x/y"] = rng.randint(0, 2)
+        new["b"]["t~"][0]["k"] = rng.randint(0, 2)
+        if rng.random() < 0.3:
+            new.pop("c", None)
+        else:
+            new["d"] = rng.random()
+        got = loadtest.apply_patch(copy.deepcopy(old), server.json_patch(old, new))
+        assert got == new
+        old = new
+
+
+def test_percentile_nearest_rank():
+    values = sorted(float(i) for i in range(1, 101))
+    assert loadtest.percentile(values, 50) == 50.0
+    assert loadtest.percentile(values, 99) == 99.0
+    assert loadtest.percentile([7.0], 95) == 7.0
+    assert loadtest.percentile([], 50) == 0.0
+
+
+def _check(rep, sessions):
+    rows = rep["by_action"]
+    assert rows["bootstrap"]["count"] == sessions
+    assert "PLAY_CARD" in rows and "END_TURN" in rows
+    assert all(r["errors"] == 0 for r in rows.values())
+    assert all(r["bytes_mean"] > 0 and r["p50_ms"] <= r["p95_ms"] <= r["p99_ms"] <= r["max_ms"]
+               for r in rows.values())
+    assert rep["resyncs"] == 0
+
+
+def test_in_process_load_run():
+    local = loadtest.LocalServer(in_process=True, flush_interval=0)
+    try:
+        rep = loadtest.run_load(local.transport_factory(), sessions=4, workers=2, duration=None, actions=300)
+    finally:
+        local.close()
+    assert rep["actions"] == 300
+    _check(rep, 4)
+
+
+def test_loopback_http_load_run():
+    prev = server.SESSIONS
+    local = loadtest.LocalServer()
+    try:
+        rep = loadtest.run_load(local.transport_factory(), sessions=3, workers=3, duration=None, actions=120)
+    finally:
+        local.close()
+    assert server.SESSIONS is prev
+    assert rep["actions"] == 120
+    _check(rep, 3)
@@ -0,0 +1,133 @@
+import json
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import server
+
+
+def parse(text):
+    """{(имя, метки): значение} из текстового формата Prometheus."""
+    out = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        m = re.match(r'^(\w+)(\{.*\})? (\S+)$', line)
+        out[(m.group(1), m.group(2) or "")] = float(m.group(3))
+    return out
+
+
+class MetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patches = [mock.patch.object(server, "SAVE_DIR", self.tmp.name),
+                   mock.patch.object(server, "SESSIONS", server.SessionCache(flush_interval=0))]
+        for m in server.METRICS:
+            patches.append(mock.patch.object(m, "values", {}))
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.client = server.app.test_client()
+
+    def metrics(self):
+        resp = self.client.get("/api/metrics")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.mimetype.startswith("text/plain"))
+        return parse(resp.get_data(as_text=True))
+
+    def act(self, sid, action, rev=None):
+        return self.client.post("/api/action", json={"sid": sid, "action": action, "base_rev": rev}).get_json()
+
+    def test_phases_are_timed_per_action_type(self):
+        sid = self.client.post("/api/bootstrap", json={}).get_json()["sid"]
+        rev = self.act(sid, {"type": "NEW_RUN"})["rev"]
+        self.act(sid, {"type": "SET_DIFFICULTY", "difficulty": 2}, rev)
+        self.act(sid, {"type": "<script>"})
+        m = self.metrics()
+        for phase in ("checkout", "dispatch", "sanitize", "encode"):
+            self.assertEqual(m[("mprl_phase_seconds_count", f'{{action="NEW_RUN",phase="{phase}"}}')], 1)
+        self.assertEqual(m[("mprl_phase_seconds_count", '{action="SET_DIFFICULTY",phase="diff"}')], 1)
+        # неизвестный тип не плодит ряды
+        self.assertEqual(m[("mprl_phase_seconds_count", '{action="other",phase="dispatch"}')], 1)
+        self.assertFalse(any("script" in labels for _, labels in m))
+        self.assertEqual(m[("mprl_phase_seconds_bucket", '{action="NEW_RUN",phase="dispatch",le="+Inf"}')], 1)
+        self.assertGreater(m[("mprl_save_bytes_total", '{kind="snapshot"}')], 1000)
+        self.assertEqual(m[("mprl_sessions_cached", "")], 1)
+
+    def test_swallowed_errors_and_corrupt_recoveries_are_counted(self):
+        sid = self.client.post("/api/bootstrap", json={}).get_json()["sid"]
+        self.act(sid, {"type": "END_TURN"})   # забега нет — dispatch падает, apply_action глотает
+        m = self.metrics()
+        self.assertEqual(m[("mprl_action_errors_total", '{action="END_TURN"}')], 1)
+
+        server.SESSIONS.close()
+        with open(server.save_path("broken"), "w", encoding="utf-8") as f:
+            f.write("{не json")
+        self.client.post("/api/bootstrap", json={"sid": "broken"})
+        m = self.metrics()
+        self.assertEqual(m[("mprl_corrupt_recoveries_total", '{outcome="reset"}')], 1)
+        self.assertEqual(m[("mprl_session_load_seconds_count", "")], 1)
+        self.assertTrue(os.path.exists(server.save_path("broken") + ".corrupt"))
+
+    def test_payload_bytes_per_screen_and_section(self):
+        r = self.client.post("/api/bootstrap", json={}, headers={"X-MPRL-Debug": "sizes"})
+        sid, body = r.get_json()["sid"], r.get_json()
+        self.assertNotIn("sizes", body)
+        header = dict(p.split("=") for p in r.headers["X-MPRL-Payload-Sizes"].split(", "))
+        self.assertEqual(int(header["total"]), sum(int(v) for k, v in header.items() if k != "total"))
+        self.assertEqual(int(header["content_summary"]),
+                         len(json.dumps(body["state"]["content_summary"], ensure_ascii=False,
+                                        separators=(",", ":")).encode("utf-8")))
+        self.assertNotIn("X-MPRL-Payload-Sizes", self.client.post("/api/action", json={
+            "sid": sid, "action": {"type": "NEW_RUN"}}).headers)
+        self.act(sid, {"type": "CONTINUE"})
+        with server.SESSIONS.checkout(sid) as st:
+            st["run"]["room_choices"][0]["type"] = "fight"
+            room = st["run"]["room_choices"][0]["id"]
+        rev = self.act(sid, {"type": "CHOOSE_ROOM", "room_id": room})["rev"]
+        self.act(sid, {"type": "END_TURN"}, rev)
+        m = self.metrics()
+        self.assertGreater(m[("mprl_payload_bytes_total", '{screen="MENU",kind="state",section="content_summary"}')], 0)
+        self.assertGreater(m[("mprl_payload_bytes_total", '{screen="MAP",kind="state",section="run.path_map"}')], 0)
+        self.assertGreater(m[("mprl_payload_bytes_total", '{screen="COMBAT",kind="state",section="run.deck_view"}')], 0)
+        self.assertGreater(m[("mprl_payload_bytes_total", '{screen="COMBAT",kind="patch",section="run.combat_view.log"}')], 0)
+        self.assertNotIn(("mprl_payload_bytes_total", '{screen="COMBAT",kind="patch",section="content_summary"}'), m)
+        self.assertEqual(m[("mprl_response_bytes_count", '{screen="COMBAT",kind="patch"}')], 1)
+
+    def test_metrics_need_token_or_loopback(self):
+        remote = {"REMOTE_ADDR": "10.1.2.3"}
+        with mock.patch.object(server, "ADMIN_TOKEN", ""):
+            self.assertEqual(self.client.get("/api/metrics", environ_base=remote).status_code, 404)
+            self.assertEqual(self.client.get("/api/metrics").status_code, 200)
+        with mock.patch.object(server, "ADMIN_TOKEN", "s3cret"):
+            self.assertEqual(self.client.get("/api/metrics").status_code, 403)
+            for headers in ({"X-MPRL-Token": "s3cret"}, {"Authorization": "Bearer s3cret"}):
+                resp = self.client.get("/api/metrics", headers=headers, environ_base=remote)
+                self.assertEqual(resp.status_code, 200)
+            resp = self.client.get("/api/metrics", headers={"Authorization": "Bearer nope"}, environ_base=remote)
+            self.assertEqual(resp.status_code, 403)
+
+    def test_patch_sizes_follow_view_sections(self):
+        sizes = server.patch_sizes([{"op": "replace", "path": "/run/combat_view/log/3", "value": "x"},
+                                    {"op": "add", "path": "/run/deck_view/0", "value": {}},
+                                    {"op": "replace", "path": "/screen", "value": "MAP"},
+                                    {"op": "replace", "path": "/run", "value": None}])
+        self.assertEqual(set(sizes), {"run.combat_view.log", "run.deck_view", "screen", "run"})
+        vs = server.view_sizes({"run": {"combat_view": {"log": ["а"]}, "gold": 5}, "ui": {}})
+        self.assertEqual(vs, {"run.combat_view.log": 6, "run.gold": 1, "ui": 2})
+
+    def test_histogram_buckets_are_cumulative(self):
+        h = server.Histogram("t_seconds", "тест", ("k",), buckets=(0.1, 1.0))
+        for v in (0.05, 0.5, 0.5, 3.0):
+            h.observe(v, ("a",))
+        m = parse("\n".join(h.render()))
+        self.assertEqual([m[("t_seconds_bucket", f'{{k="a",le="{le}"}}')] for le in ("0.1", "1", "+Inf")], [1, 3, 4])
+        self.assertEqual(m[("t_seconds_count", '{k="a"}')], 4)
+        self.assertAlmostEqual(m[("t_seconds_sum", '{k="a"}')], 4.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
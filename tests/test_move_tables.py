@@ -0,0 +1,58 @@
+import random
+
+import content
+import game
+
+
+def alias_probabilities(table, avail, last):
+    prob, alias = table._alias_for(avail, last)
+    n = len(avail)
+    out = dict.fromkeys(avail, 0.0)
+    for k in range(n):
+        out[avail[k]] += prob[k] / n
+        out[avail[alias[k]]] += (1.0 - prob[k]) / n
+    return out
+
+
+def test_alias_tables_match_weights_with_last_move_halved():
+    for table in game.MOVE_TABLES.values():
+        for avail, last in list(table._alias):
+            weights = {i: int(table.moves[i].get("w", 1)) for i in avail}
+            if last is not None:
+                weights[last] = max(1, weights[last] // 2)
+            total = sum(weights.values())
+            got = alias_probabilities(table, avail, last)
+            for i in avail:
+                assert abs(got[i] - weights[i] / total) < 1e-9, (table.tid, avail, last)
+
+
+def test_availability_matches_move_available():
+    for tmpl in content.ENEMIES + content.ELITES + content.BOSSES:
+        table = game.MOVE_TABLES[tmpl["id"]]
+        for phase in ["base"] + [m["set_phase"] for m in tmpl["moves"] if m.get("set_phase")]:
+            for hp in range(0, 101, 5):
+                enemy = game.Enemy.from_dict({"hp": hp, "max_hp": 100, "vars": {"phase": phase}})
+                want = tuple(i for i, m in enumerate(tmpl["moves"]) if game.move_available(enemy, m))
+                assert table.available(phase, hp / 100) == (want or tuple(range(len(tmpl["moves"]))))
+
+
+def test_enemies_reference_the_shared_table():
+    tmpl = content.BOSSES[0]
+    rng = random.Random(3)
+    enemy = game.instantiate_enemy(tmpl, rng, 1.0)
+    assert "moves" not in enemy
+    game.choose_intent(enemy, rng)
+    move = game.enemy_next_move(enemy)
+    assert move["id"] == enemy["next"]
+    assert enemy["intent"] == game.summarize_move(move)
+    assert enemy["intent"] is game.MOVE_TABLES[tmpl["id"]].intents[game.MOVE_TABLES[tmpl["id"]].index[move["id"]]]
+
+
+def test_inline_moves_from_old_saves_still_work():
+    tmpl = content.ENEMIES[0]
+    rng = random.Random(3)
+    enemy = game.instantiate_enemy(tmpl, rng, 1.0)
+    enemy["moves"] = game.deep(tmpl["moves"])
+    game.choose_intent(enemy, rng)
+    assert "next" not in enemy
+    assert game.enemy_next_move(enemy) is enemy["next_move"]
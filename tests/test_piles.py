@@ -0,0 +1,56 @@
+import copy
+import json
+import random
+
+import game
+
+
+def cards(n):
+    return [game.make_card_instance("ARCANE_JAB") for _ in range(n)]
+
+
+def test_pile_index_survives_list_operations():
+    raw = cards(8)
+    p = game.Pile(raw)
+    assert p.get(raw[3]["uid"]) is raw[3]
+    random.Random(1).shuffle(p)
+    extra = game.make_card_instance("GUARD_SIGIL")
+    p.append(extra)
+    assert p.get(extra["uid"]) is extra
+    top = p.pop()
+    assert p.get(top["uid"]) is None
+    taken = p.take(raw[5]["uid"])
+    assert taken is raw[5] and taken not in p and len(p) == 7
+    p[0:2] = []
+    assert [c["uid"] for c in p] == [c["uid"] for c in p if p.get(c["uid"]) is c]
+    assert p.take("нет такого") is None
+
+
+def test_pile_serializes_and_copies_as_a_list():
+    p = game.Pile(cards(3))
+    assert json.loads(json.dumps(p, default=game.json_default)) == [c.to_dict() for c in p]
+    twin = copy.deepcopy(p)
+    assert isinstance(twin, game.Pile) and twin == p and twin[0] is not p[0]
+    assert twin.get(p[1]["uid"]) == p[1]
+
+
+def test_loaded_plain_lists_are_adopted():
+    state = game.default_state()
+    game.new_run(state)
+    game.start_combat(state, "fight")
+    loaded = json.loads(json.dumps(state, default=game.json_default))
+    assert type(loaded["run"]["deck"]) is list
+    game.adopt_piles(loaded)
+    assert isinstance(loaded["run"]["deck"], game.Pile)
+    assert all(isinstance(loaded["run"]["combat"][k], game.Pile) for k in game.PILE_KEYS)
+
+
+def test_deck_removal_keeps_order():
+    state = game.default_state()
+    game.new_run(state)
+    run = state["run"]
+    order = [c["uid"] for c in run["deck"]]
+    run["shop_remove"] = {"price": 0, "choices": []}
+    game.shop_remove_confirm(state, order[4])
+    assert [c["uid"] for c in run["deck"]] == order[:4] + order[5:]
+    assert isinstance(run["deck"], game.Pile)
@@ -0,0 +1,105 @@
+import os
+import pstats
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import game
+import server
+
+
+class ProfilingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for p in (mock.patch.object(server, "SAVE_DIR", self.tmp.name),
+                  mock.patch.object(server, "PROFILE_DIR", os.path.join(self.tmp.name, "profiles")),
+                  mock.patch.object(server, "SESSIONS", server.SessionCache(flush_interval=3600))):
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(server.stop_profiling)
+        self.client = server.app.test_client()
+        self.sid = self.client.post("/api/bootstrap", json={}).get_json()["sid"]
+
+    def act(self, action):
+        return self.client.post("/api/action", json={"sid": self.sid, "action": action}).get_json()
+
+    def play_some(self, n):
+        self.act({"type": "NEW_RUN"})
+        self.act({"type": "CHOOSE_ROOM", "room_id": self.act({"type": "CONTINUE"})["state"]["run"]["room_choices"][0]["id"]})
+        for _ in range(n):
+            self.act({"type": "END_TURN"})
+
+    def test_disabled_profiler_stays_out_of_the_way(self):
+        self.assertIsNone(server._PROFILE_HOOK)
+        seen = []
+        real = game.apply_action
+
+        def spy(state, action):
+            seen.append(sys.getprofile())
+            return real(state, action)
+        with mock.patch.object(game, "apply_action", spy), \
+                mock.patch.object(server.cProfile, "Profile", side_effect=AssertionError):
+            self.act({"type": "NEW_RUN"})
+        self.assertEqual(seen, [None])
+
+    def test_next_n_writes_pstats_per_action_and_switches_off(self):
+        prof = server.start_profiling("pstats", count=4)
+        self.play_some(5)
+        self.assertIsNone(server._PROFILE_HOOK)
+        self.assertEqual(prof.profiled, 4)
+        files = sorted(os.listdir(prof.out_dir))
+        self.assertIn("NEW_RUN.pstats", files)
+        self.assertIn("END_TURN.pstats", files)
+        st = pstats.Stats(os.path.join(prof.out_dir, "END_TURN.pstats"))
+        self.assertTrue(any(func[2] == "end_turn" for func in st.stats))
+
+    def test_collapsed_stacks_for_flamegraphs(self):
+        prof = server.start_profiling("collapsed", count=5)
+        self.play_some(2)
+        with open(os.path.join(prof.out_dir, "END_TURN.collapsed"), "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, weight = line.rsplit(" ", 1)
+            self.assertTrue(stack.startswith("dispatch[END_TURN]"))
+            self.assertGreater(int(weight), 0)
+        self.assertTrue(any("game.py:end_turn" in line for line in lines))
+
+    def test_sampling_profiles_a_fraction(self):
+        prof = server.DispatchProfiler(os.path.join(self.tmp.name, "s"), "pstats", sample=0.25, seed=5)
+        state = game.default_state()
+        for _ in range(200):
+            prof(state, {"type": "SET_DIFFICULTY", "difficulty": 2}, "SET_DIFFICULTY")
+        self.assertTrue(20 < prof.profiled < 80)
+        self.assertFalse(prof.done)
+
+    def test_spec_parsing(self):
+        self.assertEqual(server.parse_profile_spec("next:200"), {"count": 200})
+        self.assertEqual(server.parse_profile_spec("sample:0.01"), {"sample": 0.01, "count": None})
+        self.assertEqual(server.parse_profile_spec("sample:0.5:10"), {"sample": 0.5, "count": 10})
+        with self.assertRaises(ValueError):
+            server.parse_profile_spec("always")
+
+    def test_endpoint_requires_token(self):
+        with mock.patch.object(server, "ADMIN_TOKEN", ""):
+            self.assertEqual(self.client.post("/api/profile", json={"mode": "next"}).status_code, 404)
+        with mock.patch.object(server, "ADMIN_TOKEN", "s3cret"):
+            self.assertEqual(self.client.post("/api/profile", json={"mode": "next"}).status_code, 403)
+            hdr = {"X-MPRL-Token": "s3cret"}
+            r = self.client.post("/api/profile", json={"mode": "next", "count": 2, "format": "collapsed"}, headers=hdr)
+            self.assertEqual(r.status_code, 200)
+            self.assertTrue(r.get_json()["active"])
+            self.assertEqual(self.client.post("/api/profile", json={"mode": "x"}, headers=hdr).status_code, 400)
+            self.act({"type": "NEW_RUN"})
+            status = self.client.get("/api/profile", headers=hdr).get_json()
+            self.assertEqual((status["profiled"], status["left"]), (1, 1))
+            off = self.client.post("/api/profile", json={"mode": "off"}, headers=hdr).get_json()
+            self.assertFalse(off["active"])
+            self.assertTrue(off["files"][0].endswith("NEW_RUN.collapsed"))
+            self.assertIsNone(server._PROFILE_HOOK)
+
+
+if __name__ == "__main__":
+    unittest.main()
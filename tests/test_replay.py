@@ -0,0 +1,46 @@
+import copy
+import json
+import os
+import tempfile
+
+import game
+import replay
+
+
+def test_bot_run_replays_to_the_recorded_state():
+    log = replay.record_bot_run(5, floors=12)
+    assert replay._depth(log["final"]["run"]) > 12
+    res = replay.replay_log(log)
+    assert res.ok, res.diffs
+    assert res.digest == log["digest"]
+
+
+def test_new_run_and_uids_are_reproducible_under_the_flag():
+    initial = game.default_state()
+    initial["entropy"] = {"seed": 99, "ctr": 0}
+    actions = [{"type": "NEW_RUN"}, {"type": "CHOOSE_ROOM", "room_id": None}]
+    a = replay.replay(initial, actions)
+    b = replay.replay(initial, actions, expect=a.state)
+    assert b.ok, b.diffs
+    assert a.state["run"]["seed"] == b.state["run"]["seed"]
+    assert [c["uid"] for c in a.state["run"]["deck"]] == [c["uid"] for c in b.state["run"]["deck"]]
+    assert a.state["entropy"]["ctr"] > 0
+
+
+def test_divergence_is_reported_with_paths():
+    log = replay.record_bot_run(5, floors=3)
+    tampered = copy.deepcopy(log)
+    tampered["final"]["run"]["gold"] += 1
+    res = replay.replay_log(tampered)
+    assert not res.ok
+    assert any(d.startswith("/run/gold") for d in res.diffs)
+
+
+def test_cli_record_then_check(capsys):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "r.json")
+        assert replay.main(["record", "--seed", "3", "--floors", "6", "--out", path]) == 0
+        with open(path, encoding="utf-8") as f:
+            assert type(json.load(f)["initial"]["run"]["deck"][0]) is dict
+        assert replay.main(["check", path]) == 0
+    assert "OK" in capsys.readouterr().out
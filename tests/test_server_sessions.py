@@ -0,0 +1,324 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import game
+import server
+
+
+class SessionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(server, "SAVE_DIR", self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def read_save(self, sid):
+        with open(server.save_path(sid), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_actions_are_written_behind(self):
+        cache = server.SessionCache(max_size=4, idle_sec=60, flush_interval=3600)
+        with cache.checkout("s1", fresh=game.default_state()):
+            pass
+        self.assertFalse(os.path.exists(server.save_path("s1")))
+
+        with cache.checkout("s1") as st:
+            game.dispatch(st, {"type": "SET_DIFFICULTY", "difficulty": 4})
+        cache.flush()
+        self.assertEqual(self.read_save("s1")["settings"]["difficulty"], 4)
+
+        # повторный доступ не перечитывает диск
+        with mock.patch.object(server, "_load_session") as load:
+            with cache.checkout("s1") as st:
+                self.assertEqual(st["settings"]["difficulty"], 4)
+            load.assert_not_called()
+
+    def test_lru_eviction_persists_dirty_session(self):
+        cache = server.SessionCache(max_size=1, idle_sec=60, flush_interval=3600)
+        with cache.checkout("a", fresh=game.default_state()) as st:
+            st["settings"]["difficulty"] = 3
+        with cache.checkout("b", fresh=game.default_state()):
+            pass
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(self.read_save("a")["settings"]["difficulty"], 3)
+        with cache.checkout("a") as st:
+            self.assertEqual(st["settings"]["difficulty"], 3)
+
+    def test_idle_sessions_are_unloaded(self):
+        cache = server.SessionCache(max_size=4, idle_sec=0, flush_interval=3600)
+        with cache.checkout("idle", fresh=game.default_state()):
+            pass
+        time.sleep(0.01)
+        cache.flush()
+        self.assertEqual(len(cache), 0)
+        self.assertTrue(os.path.exists(server.save_path("idle")))
+
+    def test_slow_load_does_not_block_other_sessions(self):
+        cache = server.SessionCache(max_size=4, idle_sec=60, flush_interval=3600)
+        with cache.checkout("slow", fresh=game.default_state()) as st:
+            st["settings"]["difficulty"] = 5
+        cache.close()
+        cache = server.SessionCache(max_size=4, idle_sec=60, flush_interval=3600)
+        with cache.checkout("fast", fresh=game.default_state()):
+            pass
+        started, release = threading.Event(), threading.Event()
+        real = server._load_session
+
+        def slow_load(sid):
+            started.set()
+            release.wait(5)
+            return real(sid)
+        seen = []
+
+        def read_slow():
+            with cache.checkout("slow") as st:
+                seen.append(st["settings"]["difficulty"])
+        with mock.patch.object(server, "_load_session", slow_load):
+            waiter = threading.Thread(target=read_slow)
+            waiter.start()
+            self.assertTrue(started.wait(5))
+            # соседняя сессия не ждёт чужой загрузки с диска
+            with cache.checkout("fast") as st:
+                st["settings"]["difficulty"] = 1
+            self.assertTrue(waiter.is_alive())
+            release.set()
+            waiter.join(5)
+        self.assertEqual(seen, [5])
+
+    def test_evicted_session_is_written_before_reload(self):
+        cache = server.SessionCache(max_size=1, idle_sec=60, flush_interval=3600)
+        with cache.checkout("a", fresh=game.default_state()) as st:
+            st["settings"]["difficulty"] = 3
+        entered, release = threading.Event(), threading.Event()
+
+        def hold_a():
+            # запрос к "a" ещё идёт, когда её вытесняют
+            with cache.checkout("a") as st:
+                entered.set()
+                release.wait(5)
+                st["settings"]["difficulty"] = 4
+        holder = threading.Thread(target=hold_a)
+        holder.start()
+        self.assertTrue(entered.wait(5))
+
+        def open_b():
+            with cache.checkout("b", fresh=game.default_state()):
+                pass
+        evictor = threading.Thread(target=open_b)
+        evictor.start()
+        time.sleep(0.05)
+        release.set()
+        holder.join(5)
+        evictor.join(5)
+        with cache.checkout("a") as st:
+            self.assertEqual(st["settings"]["difficulty"], 4)
+
+    def test_zero_interval_writes_through(self):
+        cache = server.SessionCache(max_size=4, idle_sec=60, flush_interval=0)
+        with cache.checkout("wt", fresh=game.default_state()) as st:
+            st["settings"]["difficulty"] = 2
+        self.assertEqual(self.read_save("wt")["settings"]["difficulty"], 2)
+
+
+class ActionJournalTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(server, "SAVE_DIR", self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = server.SessionCache(max_size=4, idle_sec=60, flush_interval=0, snapshot_every=50)
+        with self.cache.checkout("j", fresh=game.default_state()):
+            pass
+        self.cache.act("j", {"type": "NEW_RUN"})
+
+    def journal_lines(self):
+        with open(server.journal_path("j"), "r", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def peek(self):
+        # смотрим в живое состояние без checkout, чтобы не спровоцировать снимок
+        return self.cache._items["j"].state
+
+    def fight_room(self):
+        with self.cache.checkout("j") as st:
+            st["run"]["room_choices"][0]["type"] = "fight"
+            return st["run"]["room_choices"][0]["id"]
+
+    def test_same_screen_actions_only_append_to_journal(self):
+        self.cache.act("j", {"type": "CHOOSE_ROOM", "room_id": self.fight_room()})
+        snapshot_mtime = os.path.getmtime(server.save_path("j"))
+        before = len(self.journal_lines())
+        self.cache.act("j", {"type": "PLAY_CARD", "uid": "nope", "target": 0})
+        lines = self.journal_lines()
+        self.assertEqual(len(lines), before + 1)
+        self.assertLess(len(lines[-1].encode("utf-8")), 120)
+        self.assertEqual(os.path.getmtime(server.save_path("j")), snapshot_mtime)
+
+    def test_journal_replay_restores_exact_state(self):
+        self.cache.act("j", {"type": "CHOOSE_ROOM", "room_id": self.fight_room()})
+        hand = [c["uid"] for c in self.peek()["run"]["combat"]["hand"]]
+        for uid in hand[:3]:
+            self.cache.act("j", {"type": "PLAY_CARD", "uid": uid, "target": 0})
+        self.cache.act("j", {"type": "END_TURN"})
+        live, restored = (json.loads(json.dumps(server._persistable(st), default=game.json_default))
+                          for st in (self.peek(), server.load_state("j")))
+        for st in (live, restored):
+            st.pop("updated_at", None)
+        self.assertEqual(restored, live)
+
+    def test_transient_combat_fields_stay_live_but_not_in_save(self):
+        self.cache.act("j", {"type": "CHOOSE_ROOM", "room_id": self.fight_room()})
+        idx = game._buff_index(self.peek()["run"]["combat"])
+        self.cache.act("j", {"type": "END_TURN"})
+        combat = self.peek()["run"]["combat"]
+        self.assertIs(combat.get("_buff_hooks"), idx)
+        self.assertIn("_rng", combat)
+        with self.cache.checkout("j"):
+            pass
+        with open(server.save_path("j"), "r", encoding="utf-8") as f:
+            saved = json.load(f)["run"]["combat"]
+        self.assertTrue(server.TRANSIENT_COMBAT_KEYS.isdisjoint(saved))
+        self.assertEqual(saved["turn"], combat["turn"])
+
+    def test_close_and_eviction_leave_no_journal_tail(self):
+        cache = server.SessionCache(max_size=1, idle_sec=60, flush_interval=3600, snapshot_every=50)
+        cache.bootstrap("s1", fresh=game.default_state())
+        cache.act("s1", {"type": "NEW_RUN"})
+        cache.act("s1", {"type": "SET_DIFFICULTY", "difficulty": 2})
+        cache.flush()
+        cache.act("s1", {"type": "SET_DIFFICULTY", "difficulty": 3})
+        cache.bootstrap("s2", fresh=game.default_state())      # вытесняет s1
+        cache.act("s2", {"type": "NEW_RUN"})
+        cache.flush()
+        cache.act("s2", {"type": "SET_DIFFICULTY", "difficulty": 4})
+        cache.close()
+        for sid, seq in (("s1", 3), ("s2", 2)):
+            with open(server.save_path(sid), "r", encoding="utf-8") as f:
+                self.assertEqual(json.load(f)["journal_seq"], seq)
+            with mock.patch.object(game, "apply_action", side_effect=AssertionError("повтор журнала")):
+                server.load_state(sid)
+
+    def test_legacy_save_without_entropy_snapshots_the_new_seed(self):
+        with self.cache.checkout("j") as st:
+            st.pop("entropy")
+        self.cache.act("j", {"type": "SET_DIFFICULTY", "difficulty": 2})
+        seed = self.peek()["entropy"]["seed"]
+        with open(server.save_path("j"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["entropy"]["seed"], seed)
+        self.cache.act("j", {"type": "CHOOSE_ROOM", "room_id": self.fight_room()})
+        self.assertEqual(server.load_state("j")["run"]["seed"], self.peek()["run"]["seed"])
+
+    def test_corrupt_snapshot_recovers_from_backup_and_journal(self):
+        self.cache.act("j", {"type": "CHOOSE_ROOM", "room_id": self.fight_room()})
+        self.cache.act("j", {"type": "END_TURN"})
+        turn = self.peek()["run"]["combat"]["turn"]
+        with open(server.save_path("j"), "w", encoding="utf-8") as f:
+            f.write("{broken")
+
+        restored = server.load_state("j")
+        self.assertEqual(restored["run"]["combat"]["turn"], turn)
+        self.assertIn("журнал", restored["ui"]["toast"])
+
+    def test_corrupt_snapshot_without_backup_sets_the_journal_aside(self):
+        self.cache.act("j", {"type": "SET_DIFFICULTY", "difficulty": 3})
+        self.cache.close()
+        os.remove(server.save_path("j") + ".bak")
+        with open(server.journal_path("j"), "r", encoding="utf-8") as f:
+            old_journal = f.read()
+        self.assertTrue(old_journal)
+        with open(server.save_path("j"), "w", encoding="utf-8") as f:
+            f.write("{broken")
+
+        cache = server.SessionCache(max_size=4, idle_sec=60, flush_interval=0, snapshot_every=50)
+        cache.act("j", {"type": "SET_DIFFICULTY", "difficulty": 2})
+        with cache.checkout("j") as st:
+            self.assertIsNone(st["run"])
+            self.assertEqual(st["settings"]["difficulty"], 2)
+        cache.close()
+        with open(server.journal_path("j") + ".corrupt", "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), old_journal)
+        self.assertTrue(os.path.exists(server.save_path("j") + ".corrupt"))
+        restored = server.load_state("j")
+        self.assertIsNone(restored["run"])
+        self.assertEqual(restored["settings"]["difficulty"], 2)
+
+
+def apply_patch(doc, ops):
+    doc = json.loads(json.dumps(doc))
+    for op in ops:
+        keys = [k.replace("~1", "/").replace("~0", "~") for k in op["path"].split("/")[1:]]
+        if not keys:
+            doc = op["value"]
+            continue
+        parent = doc
+        for k in keys[:-1]:
+            parent = parent[int(k)] if isinstance(parent, list) else parent[k]
+        last = keys[-1]
+        if isinstance(parent, list):
+            idx = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(idx, op["value"])
+            elif op["op"] == "remove":
+                parent.pop(idx)
+            else:
+                parent[idx] = op["value"]
+        elif op["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = op["value"]
+    return doc
+
+
+class DeltaResponseTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(server, "SAVE_DIR", self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = server.SessionCache(max_size=4, idle_sec=60, flush_interval=3600)
+
+    def test_json_patch_roundtrip(self):
+        old = {"a": [1, 2, 3], "b": {"x/y": 1, "t~": 2}, "c": "keep"}
+        new = {"a": [1, 5], "b": {"x/y": 2}, "c": "keep", "d": None}
+        self.assertEqual(apply_patch(old, server.json_patch(old, new)), new)
+        self.assertEqual(server.json_patch(new, new), [])
+
+    def test_json_patch_does_not_confuse_bool_and_int(self):
+        for old, new in (({"a": [True, 2, 3]}, {"a": [1, 2]}),
+                         ({"a": [0, [False], 3]}, {"a": [False, [0]]}),
+                         ({"a": [{"k": 1}, 5]}, {"a": [7, {"k": True}, 5]})):
+            got = apply_patch(old, server.json_patch(old, new))
+            self.assertEqual(json.dumps(got), json.dumps(new))
+
+    def test_action_returns_patch_against_client_rev(self):
+        resp = self.cache.bootstrap("d", fresh=game.default_state())
+        client = resp["state"]
+        resp = self.cache.act("d", {"type": "NEW_RUN"}, resp["rev"])
+        self.assertIn("patch", resp)
+        client = apply_patch(client, resp["patch"])
+
+        room = client["run"]["room_choices"][0]["id"]
+        resp = self.cache.act("d", {"type": "CHOOSE_ROOM", "room_id": room}, resp["rev"])
+        client = apply_patch(client, resp.get("patch", []))
+        full = game.sanitize_for_client(self.cache._items["d"].state)
+        self.assertEqual(client, json.loads(json.dumps(full)))
+
+    def test_unknown_rev_falls_back_to_full_state(self):
+        self.cache.bootstrap("d", fresh=game.default_state())
+        resp = self.cache.act("d", {"type": "SET_DIFFICULTY", "difficulty": 2}, "stale.1")
+        self.assertIn("state", resp)
+        self.assertNotIn("patch", resp)
+        resp = self.cache.act("d", {"type": "SET_DIFFICULTY", "difficulty": 3})
+        self.assertIn("state", resp)
+
+
+if __name__ == "__main__":
+    unittest.main()
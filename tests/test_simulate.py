@@ -0,0 +1,54 @@
+import csv
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import game
+import simulate
+
+
+class SimulateTests(unittest.TestCase):
+    def test_every_policy_finishes_a_run(self):
+        for policy in simulate.POLICIES:
+            rec = simulate.simulate_run(7, difficulty=1, policy=policy)
+            self.assertIn(rec["result"], ("victory", "defeat"), policy)
+            self.assertGreater(rec["actions"], 0)
+            self.assertEqual(sorted(rec), sorted(simulate.FIELDS))
+
+    def test_same_seed_same_run(self):
+        a = simulate.simulate_run(3, difficulty=2, policy="block")
+        b = simulate.simulate_run(3, difficulty=2, policy="block")
+        a.pop("ms"), b.pop("ms")
+        self.assertEqual(a, b)
+
+    def test_play_budget_resets_with_a_new_combat(self):
+        state = game.default_state()
+        game.new_run(state)
+        game.start_combat(state, "fight")
+        bot = simulate.Policy(random.Random(0))
+        self.assertEqual(bot.act(state)["type"], "PLAY_CARD")
+        bot.plays_this_turn = simulate.MAX_PLAYS_PER_TURN
+        self.assertEqual(bot.act(state)["type"], "END_TURN")
+        # бой кончился посреди хода — следующий начинается с полного бюджета
+        state["run"]["floor"] += 1
+        game.start_combat(state, "fight")
+        self.assertEqual(bot.act(state)["type"], "PLAY_CARD")
+
+    def test_cli_writes_csv_and_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("runs.csv", "runs.jsonl"):
+                path = os.path.join(tmp, name)
+                simulate.main(["--runs", "2", "--difficulty", "1", "4", "--workers", "1", "--out", path])
+                with open(path, encoding="utf-8") as f:
+                    if name.endswith(".csv"):
+                        rows = list(csv.DictReader(f))
+                    else:
+                        rows = [json.loads(line) for line in f]
+                self.assertEqual(len(rows), 4)
+                self.assertEqual({str(r["difficulty"]) for r in rows}, {"1", "4"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import game
+
+
+def all_ids(run):
+    ids = [c["uid"] for c in run["deck"]]
+    for layer in run["path_map"]["floors"]:
+        ids += [n["id"] for n in layer]
+    return ids
+
+
+def test_run_issues_compact_unique_ids():
+    state = game.default_state()
+    game.new_run(state)
+    run = state["run"]
+    ids = all_ids(run)
+    assert len(ids) == len(set(ids))
+    assert all(len(i) <= 3 for i in ids)
+    assert run["uid_next"] == len(ids)
+    assert game.add_card_to_deck(run, "ARCANE_JAB")["uid"] == "c" + game.to_base36(len(ids))
+
+
+def test_base36():
+    assert [game.to_base36(n) for n in (0, 9, 10, 35, 36, 1295)] == ["0", "9", "a", "z", "10", "zz"]
+
+
+def test_old_string_uids_stay_playable():
+    state = game.default_state()
+    game.new_run(state)
+    run = state["run"]
+    for ci in run["deck"]:
+        ci["uid"] = "card_" + ci["uid"].rjust(10, "0")
+    run.pop("uid_next")
+    game.start_combat(state, "fight")
+    combat = run["combat"]
+    combat["player"]["mana"] = 99
+    old = combat["hand"][0]
+    game.play_card(state, old["uid"], 0)
+    assert old["uid"] not in [c["uid"] for c in combat["hand"]]
+    fresh = game.add_card_to_deck(run, "SPARK_SHOT")
+    assert fresh["uid"] == "c0"